@@ -1,21 +1,58 @@
 from flask import Flask, render_template, request, abort, redirect, url_for, jsonify, flash
-from flask_mysqldb import MySQL
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta, time as dt_time
+from datetime import datetime, timedelta
+from decimal import Decimal
+import base64
+import json
 import pymysql.cursors
+from booking import BookingConflict, BookingEngine
+from cache import TTLCache
+from db import MySQLPool, PoolTimeout
+from hashing import HashingBusy, PasswordHasher
+from instrumentation import SQLInstrumentation
+from metrics import Metrics
+from commands import register_commands
+from models import Appointment, Patient, Prescription, RecordJSONProvider
+from reference import ReferenceCache
+from slowlog import SlowQueryLog
+from versions import VersionStore
 import config
+import endpoints
+import queries
 
 app = Flask(__name__)
 
 app.config.from_object(config)
-mysql = MySQL(app)
+app.json = RecordJSONProvider(app)
+mysql = MySQLPool(app)
+sql_instrumentation = SQLInstrumentation(app)
+hasher = PasswordHasher(app)
+register_commands(app)
 
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'  # Redirect to /login if user is not logged in
 login_manager.login_message = "Please log in to access this page."
 
+# In-process cache of loaded users (keyed by user_id)
+user_cache = TTLCache(maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL)
+
+# Per-patient / per-doctor write counters behind the ETags of the JSON reads
+# ('doctors' / 'patients' count writes to any doctor / patient profile)
+versions = VersionStore(config.VERSION_FILE)
+
+# Department and room tables (see reference.py)
+reference = ReferenceCache(app, versions)
+
+# Appointment booking, with per-day doctor/room occupancy indexes (see booking.py)
+booking = BookingEngine(app, versions)
+
+# Prometheus metrics for the routes, queries, pool and caches (see /metrics)
+metrics = Metrics(app, sql_instrumentation, pool=mysql.pool, caches={'user': user_cache})
+
+# Statements over SQL_SLOW_QUERY_THRESHOLD, with their plans (see `flask slow-queries`)
+slow_queries = SlowQueryLog(app, sql_instrumentation)
+
 # Allowed input fields for the 'Patient' table
 ALLOWED_PATIENT_FIELDS = [
     'address', 
@@ -36,40 +73,262 @@ ALLOWED_DOCTOR_FIELDS = [
     'years_of_experience'
 ]
 
+# The tables behind each profile page, with their editable fields
+PATIENT_PROFILE_TABLES = {'patient': ALLOWED_PATIENT_FIELDS, 'insurance': ALLOWED_INSURANCE_FIELDS}
+DOCTOR_PROFILE_TABLES = {'doctor': ALLOWED_DOCTOR_FIELDS}
+
+# Profile fields holding a date (YYYY-MM-DD in, MM-DD-YYYY back)
+PROFILE_DATE_FIELDS = ('date_of_birth', 'date_of_expiry')
+
+# Widest date range served by /patient/appointments-by-range
+MAX_APPOINTMENT_RANGE_DAYS = 62
+
+# Page sizes for the paginated (keyset) lists
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
 
 # Represents a User
+# (patient_id / doctor_id are resolved once when the user is loaded, so
+#  routes never need to look them up again)
 class User(UserMixin):
-    def __init__(self, id, email, role):
+    def __init__(self, id, email, role, patient_id=None, doctor_id=None):
         self.id = id
         self.email = email
         self.role = role
+        self.patient_id = patient_id
+        self.doctor_id = doctor_id
 
 
 # Load a user from the current session
 @login_manager.user_loader
 def load_user(user_id):
+    # Serve the user from the cache when possible
+    user_row = user_cache.get(str(user_id))
+    if (user_row):
+        return User(**user_row)
+    
     try:
-        # Fetch the appropriate user
+        # Fetch the appropriate user, along with their linked patient/doctor
         cur = mysql.connection.cursor()
-        cur.execute("""SELECT * FROM User
-                       WHERE user_id = %s
-                    """, (user_id,))
+        cur.execute(queries.LOAD_USER_SQL, {'user_id': user_id})
         user_row = cur.fetchone()
         cur.close()
         
-        # Load the user if found
+        # Load (and cache) the user if found
         if (user_row):
-            return User(
-                       id = user_row['user_id'], 
-                       email = user_row['email'], 
-                       role = user_row['role']
-                    )
+            return cache_user(user_id, user_row)
             
     # Catch any exceptions
     except Exception as e:
         print(f"Error loading user: {e}")
+
+
+# Cache a user's LOAD_USER_SQL row (also used by asgi.py)
+def cache_user(user_id, user_row):
+    user_row = {
+                   'id': user_row['user_id'], 
+                   'email': user_row['email'], 
+                   'role': user_row['role'],
+                   'patient_id': user_row['patient_id'],
+                   'doctor_id': user_row['doctor_id']
+               }
+    user_cache.set(str(user_id), user_row)
+    return User(**user_row)
         
 
+# Encode the sort key of the last row on a page as an opaque cursor
+def encode_cursor(*values):
+    raw = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+# Decode a cursor created by encode_cursor (raises ValueError if malformed)
+def decode_cursor(cursor, size):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if (not isinstance(values, list) or len(values) != size):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+# Read the requested page size (capped at MAX_PAGE_SIZE)
+def page_size_arg():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        limit = DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+# Fetch one page of a patient's appointments, newest first
+# (keyset pagination on appointment_date, appointment_time, appointment_id)
+def fetch_appointment_page(cur, patient_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    query = queries.APPOINTMENT_PAGE_SQL
+    params = {'patient_id': patient_id, 'limit': limit + 1}
+    
+    # Continue after the last appointment of the previous page
+    if (cursor):
+        last_date, last_time, last_id = decode_cursor(cursor, 3)
+        try:
+            params.update({
+                'after_date': datetime.strptime(last_date, '%Y-%m-%d').date(),
+                'after_time': datetime.strptime(last_time, '%H:%M:%S').time(),
+                'after_id': int(last_id)
+            })
+        except ValueError:
+            raise ValueError('Invalid cursor')
+        query = queries.APPOINTMENT_PAGE_AFTER_SQL
+    
+    cur.execute(query, params)
+    appointments = Appointment.from_rows(cur.fetchall())
+    
+    # Only hand out a cursor when there is another page
+    next_cursor = None
+    if (len(appointments) > limit):
+        appointments = appointments[:limit]
+        last = appointments[-1]
+        next_cursor = encode_cursor(last.appointment_date.isoformat(),
+                                    last.appointment_time.isoformat(),
+                                    last.appointment_id)
+    return appointments, next_cursor
+
+
+# Fetch one page of a patient's medical records, newest first
+def fetch_medical_record_page(cur, patient_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    query = queries.MEDICAL_RECORD_PAGE_SQL
+    params = {'patient_id': patient_id, 'limit': limit + 1}
+    
+    # Continue after the last record of the previous page
+    if (cursor):
+        (last_id,) = decode_cursor(cursor, 1)
+        try:
+            params['after_id'] = int(last_id)
+        except ValueError:
+            raise ValueError('Invalid cursor')
+        query = queries.MEDICAL_RECORD_PAGE_AFTER_SQL
+    
+    cur.execute(query, params)
+    rows = list(cur.fetchall())
+    records = rows[:limit]
+    
+    next_cursor = None
+    if (len(rows) > limit):
+        next_cursor = encode_cursor(records[-1]['record_id'])
+    return records, next_cursor
+
+
+# Fetch one page of a patient's prescriptions, newest first
+# (keyset pagination on prescribed_on, prescription_id)
+def fetch_prescription_page(cur, patient_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    query = queries.PRESCRIPTION_PAGE_SQL
+    params = {'patient_id': patient_id, 'limit': limit + 1}
+    
+    # Continue after the last prescription of the previous page
+    if (cursor):
+        last_date, last_id = decode_cursor(cursor, 2)
+        try:
+            params.update({
+                'after_date': datetime.strptime(last_date, '%Y-%m-%d').date(),
+                'after_id': int(last_id)
+            })
+        except ValueError:
+            raise ValueError('Invalid cursor')
+        query = queries.PRESCRIPTION_PAGE_AFTER_SQL
+    
+    cur.execute(query, params)
+    prescriptions = Prescription.from_rows(cur.fetchall())
+    
+    next_cursor = None
+    if (len(prescriptions) > limit):
+        prescriptions = prescriptions[:limit]
+        last = prescriptions[-1]
+        next_cursor = encode_cursor(last.prescribed_on.isoformat(), last.prescription_id)
+    return prescriptions, next_cursor
+
+
+# Total billed, paid and outstanding over all of a patient's prescriptions
+# (one aggregate, grouped on paid, over idx_prescription_patient_paid)
+def fetch_prescription_totals(cur, patient_id):
+    cur.execute(queries.PRESCRIPTION_TOTALS_SQL, {'patient_id': patient_id})
+    totals = {'prescriptions': 0, 'total_billed': Decimal(0), 'total_paid': Decimal(0),
+              'total_outstanding': Decimal(0)}
+    for row in cur.fetchall():
+        billed = row['billed'] or Decimal(0)
+        totals['prescriptions'] += row['prescriptions']
+        totals['total_billed'] += billed
+        totals['total_paid' if row['paid'] else 'total_outstanding'] += billed
+    return totals
+
+
+# The connection pool is exhausted (see MYSQL_POOL_TIMEOUT)
+@app.errorhandler(PoolTimeout)
+def handle_pool_timeout(e):
+    if (request.is_json):
+        return jsonify({"success": False, "message": "The server is busy. Please try again."}), 503
+    return "The server is busy. Please try again.", 503
+
+
+# Too many password checks are queued (see HASH_QUEUE_LIMIT)
+@app.errorhandler(HashingBusy)
+def handle_hashing_busy(e):
+    return "Too many sign-in requests right now. Please try again in a moment.", 429, {'Retry-After': '1'}
+
+
+# Connection pool statistics (only reachable from the local host)
+@app.route('/internal/pool-stats', methods=['GET'])
+def pool_stats():
+    if (request.remote_addr not in ('127.0.0.1', '::1')):
+        abort(404)
+    return jsonify(mysql.pool.stats())
+
+
+# Prometheus metrics, summed over every gunicorn worker (only reachable
+# from METRICS_ALLOWED_NETWORKS)
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    if (not metrics.allowed(request.remote_addr)):
+        abort(404)
+    body, content_type = metrics.render()
+    return body, 200, {'Content-Type': content_type}
+
+
+# A 304 response if the client's copy (If-None-Match) is still current
+def not_modified(etag):
+    if (not request.if_none_match.contains(etag)):
+        return None
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# Attach a validator to a JSON response (clients must revalidate before reuse)
+def with_etag(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# A JSON response from an endpoints.py (body, status), with its validator
+def json_result(result, etag=None):
+    body, status = result
+    response = jsonify(body)
+    response.status_code = status
+    return with_etag(response, etag) if (etag and status == 200) else response
+
+
+# Read from the primary if any of the (scope, key) versions changed too
+# recently to be on the replicas (a stale response would be cached under
+# the new ETag)
+def read_fresh(*keys):
+    if (versions.changed_within(app.config['MYSQL_REPLICA_LAG'], *keys)):
+        mysql.use_primary()
+
+
 # User Registration (Patient)
 @app.route('/register-patient', methods=['GET', 'POST'])
 def register_patient():
@@ -83,27 +342,20 @@ def register_patient():
         email = request.form.get('email')
         password = request.form.get('password')
 
+        # Hash the password (before taking a database connection)
+        password_hash = hasher.hash(password)
+
         cur = mysql.connection.cursor()
         try:
             # Check for existing users
-            cur.execute("""SELECT user_id
-                           FROM User
-                           WHERE email = %s
-                        """, (email,))
+            cur.execute(queries.EMAIL_TAKEN_SQL, {'email': email})
             if (cur.fetchone()):
                 flash('That email address is already in use.', 'error')
                 return redirect(url_for('register_patient'))
 
-            # Hash the password
-            password_hash = generate_password_hash(password)
-
             # Check if the patient exists in the database
-            cur.execute("""SELECT patient_id, user_id
-                           FROM patient 
-                           WHERE first_name = %s
-                               AND last_name = %s
-                               AND address = %s
-                        """, (first_name, last_name, address))
+            cur.execute(queries.PATIENT_MATCH_SQL, {'first_name': first_name, 'last_name': last_name,
+                                                    'address': address})
             patient = cur.fetchone()
 
             # If the patient exists...
@@ -191,28 +443,20 @@ def register_doctor():
         email = request.form.get('email')
         password = request.form.get('password')
 
+        # Hash the password (before taking a database connection)
+        password_hash = hasher.hash(password)
+
         cur = mysql.connection.cursor()
         try:
             # Check for existing users
-            cur.execute("""SELECT user_id
-                           FROM User
-                           WHERE email = %s
-                        """, (email,))
+            cur.execute(queries.EMAIL_TAKEN_SQL, {'email': email})
             if (cur.fetchone()):
                 flash('That email address is already in use.', 'error')
                 return redirect(url_for('register_doctor'))
 
-            # Hash the password
-            password_hash = generate_password_hash(password)
-
             # Check if the doctor exists in the database
-            cur.execute("""SELECT doctor_id, user_id
-                           FROM doctor 
-                           WHERE doctor_firstname = %s
-                               AND doctor_lastname = %s
-                               AND doctor_address = %s
-                               AND department_id = %s
-                        """, (first_name, last_name, address, department))
+            cur.execute(queries.DOCTOR_MATCH_SQL, {'doctor_firstname': first_name, 'doctor_lastname': last_name,
+                                                   'doctor_address': address, 'department_id': department})
             doctor = cur.fetchone()
 
             # If the doctor exists...
@@ -283,14 +527,16 @@ def login():
 
         # Retrieve the user from the database
         cur = mysql.connection.cursor()
-        cur.execute("""SELECT * FROM User
-                       WHERE email = %s
-                    """, (email,))
+        cur.execute(queries.LOGIN_SQL, {'email': email})
         user_row = cur.fetchone()
         cur.close()
 
         # Check that the user exists, and the password is correct
-        if (user_row and check_password_hash(user_row['password'], password)):
+        if (user_row and hasher.verify(user_row['password'], password)):
+            # Upgrade a hash made with older parameters (while we have the password)
+            if (hasher.needs_rehash(user_row['password'])):
+                rehash_password(user_row, password)
+            
             # Log in the user (session start)
             curr_user = User(
                             id = user_row['user_id'],
@@ -310,6 +556,28 @@ def login():
     return render_template('login.html')
 
 
+# Replace a user's password hash with one using the current parameters
+def rehash_password(user_row, password):
+    try:
+        new_hash = hasher.hash(password)
+    except HashingBusy:
+        return  # Try again on a later login
+    
+    cur = mysql.connection.cursor()
+    try:
+        # Only if the password hasn't been changed in the meantime
+        cur.execute("""UPDATE User
+                       SET password = %s
+                       WHERE user_id = %s
+                           AND password = %s
+                    """, (new_hash, user_row['user_id'], user_row['password']))
+        mysql.connection.commit()
+    except Exception:
+        mysql.connection.rollback()
+    finally:
+        cur.close()
+
+
 # User Logout
 @app.route('/logout', methods=['GET'])
 @login_required
@@ -320,6 +588,7 @@ def logout():
 
 # Route for Patient Homepage
 @app.route('/patient/home')
+@mysql.read_only
 @login_required
 def patient_home():
     # Check that the user is a patient
@@ -332,11 +601,9 @@ def patient_home():
     upcoming_appointments = []
     
     try:
-        cur.execute("""SELECT p.*, i.*
-                       FROM patient p
-                       LEFT JOIN insurance i
-                       ON p.patient_id = i.patient_id
-                       WHERE p.user_id = %s""", (current_user.id,))
+        # The current insurance and next appointment come from the
+        # patient's summary row (kept up to date by triggers)
+        cur.execute(queries.PATIENT_HOME_SQL, {'patient_id': current_user.patient_id})
         patient_data = cur.fetchone()
         
         # Check that the patient exists
@@ -345,41 +612,17 @@ def patient_home():
         
         patient_id = patient_data['patient_id']
         
-        # Fetch upcoming appointments in the next 7 days
+        # Fetch upcoming appointments in the next 7 days, unless the next
+        # one is later than that (or there is none). A next appointment in
+        # the past only means the summary has aged, so check the table.
         today = datetime.now().date()
         seven_days_later = today + timedelta(days=7)
+        next_date = patient_data.pop('next_appointment_date')
         
-        cur.execute("""SELECT a.appointment_id, a.appointment_date, a.appointment_time, 
-                              a.description, d.doctor_firstname, d.doctor_lastname, r.room_id
-                       FROM appointment a
-                       LEFT JOIN doctor d ON a.doctor_id = d.doctor_id
-                       LEFT JOIN room r ON a.room_id = r.room_id
-                       WHERE a.patient_id = %s
-                           AND a.appointment_date >= %s
-                           AND a.appointment_date <= %s
-                       ORDER BY a.appointment_date ASC, a.appointment_time ASC
-                    """, (patient_id, today, seven_days_later))
-        appointments_raw = cur.fetchall()
-        
-        # Convert timedelta objects to time objects for appointment_time
-        upcoming_appointments = []
-        for appt in appointments_raw:
-            if (hasattr(appt, 'keys')):
-                appt_dict = dict(appt)
-            else:
-                appt_dict = appt
-            
-            if (appt_dict.get('appointment_time')):
-                appt_time = appt_dict['appointment_time']
-                if (isinstance(appt_time, timedelta)):
-                    # Convert timedelta to time
-                    total_seconds = int(appt_time.total_seconds())
-                    hours = total_seconds // 3600
-                    minutes = (total_seconds % 3600) // 60
-                    seconds = total_seconds % 60
-                    appt_dict['appointment_time'] = dt_time(hours, minutes, seconds)
-            
-            upcoming_appointments.append(appt_dict)
+        if (next_date is not None and next_date <= seven_days_later):
+            cur.execute(queries.UPCOMING_APPOINTMENTS_SQL, {'patient_id': patient_id, 'today': today,
+                                                            'week_later': seven_days_later})
+            upcoming_appointments = Appointment.from_rows(cur.fetchall())
         
     except Exception as e:
         mysql.connection.rollback()
@@ -393,6 +636,7 @@ def patient_home():
 
 
 @app.route('/patient/search-appointments', methods=['POST'])
+@mysql.read_only
 @login_required
 def search_appointments():
     # Check that the user is a patient
@@ -402,60 +646,24 @@ def search_appointments():
     data = request.json
     search_query = data.get('query', '').strip()
     
+    # Get patient_id for the logged-in user
+    patient_id = current_user.patient_id
+    
+    if (patient_id is None):
+        abort(404)
+    
+    # Nothing to send if the patient's appointments haven't changed
+    read = endpoints.search_appointments(versions, patient_id, search_query, datetime.now().date())
+    response = not_modified(read.etag)
+    if (response):
+        return response
+    
+    read_fresh(*read.fresh)
     cur = mysql.connection.cursor()
     try:
-        # Get patient_id for the logged-in user
-        cur.execute("""SELECT patient_id
-                       FROM patient
-                       WHERE user_id = %s
-                    """, (current_user.id,))
-        patient = cur.fetchone()
-        
-        if (not patient):
-            abort(404)
-        
-        patient_id = patient['patient_id']
-        
-        # Calculate date range (next 7 days)
-        today = datetime.now().date()
-        seven_days_later = today + timedelta(days=7)
-        
-        if (search_query):
-            # Call the stored procedure
-            cur.execute("""CALL search_appointment(%s, %s, %s, %s)""", 
-                       (patient_id, today, seven_days_later, search_query))
-            results = cur.fetchall()
-        else:
-            # If no query, return all appointments in next 7 days
-            cur.execute("""SELECT a.appointment_id, a.appointment_date, a.appointment_time, 
-                                  a.description, d.doctor_firstname, d.doctor_lastname, r.room_id
-                           FROM appointment a
-                           LEFT JOIN doctor d ON a.doctor_id = d.doctor_id
-                           LEFT JOIN room r ON a.room_id = r.room_id
-                           WHERE a.patient_id = %s
-                               AND a.appointment_date >= %s
-                               AND a.appointment_date <= %s
-                           ORDER BY a.appointment_date ASC, a.appointment_time ASC
-                        """, (patient_id, today, seven_days_later))
-            results = cur.fetchall()
-        
-        # Format the results for JSON response
-        appointments = []
-        for row in results:
-            appointments.append({
-                'appointment_id': row.get('appointment_id'),
-                'appointment_date': row.get('appointment_date').strftime('%Y-%m-%d') if row.get('appointment_date') else None,
-                'appointment_time': str(row.get('appointment_time')) if row.get('appointment_time') else None,
-                'description': row.get('description') or 'No description',
-                'doctor_firstname': row.get('doctor_firstname', ''),
-                'doctor_lastname': row.get('doctor_lastname', ''),
-                'room_id': row.get('room_id')
-            })
-        
-        return jsonify({
-            "success": True,
-            "appointments": appointments
-        })
+        # The search procedure, or every appointment of the next 7 days
+        cur.execute(read.sql, read.params)
+        return json_result(endpoints.appointments_response(cur.fetchall()), read.etag)
         
     except Exception as e:
         return jsonify({"success": False, "message": f"Error: {str(e)}"}), 500
@@ -464,6 +672,45 @@ def search_appointments():
         cur.close()
 
 
+# Check a set of profile edits ({field: value}) against the tables'
+# editable fields. Returns the values to write, by table, and the values
+# to display; raises ValueError (with the message for the user) if any
+# field is unknown or any date is invalid.
+def validate_profile_updates(updates, tables):
+    if (not isinstance(updates, dict) or not updates):
+        raise ValueError('No fields to update.')
+    
+    changes = {}
+    display = {}
+    for field, value in updates.items():
+        table = next((table for table, fields in tables.items() if field in fields), None)
+        if (table is None):
+            raise ValueError('Invalid field.')
+        
+        display[field] = value
+        
+        # Validate dates (YYYY-MM-DD) and format their display (MM-DD-YYYY)
+        if (field in PROFILE_DATE_FIELDS):
+            try:
+                display[field] = datetime.strptime(value, '%Y-%m-%d').date().strftime('%m-%d-%Y')
+            except (TypeError, ValueError):
+                raise ValueError('Invalid date format.')
+        
+        changes.setdefault(table, {})[field] = value
+    return changes, display
+
+
+# Write validated profile edits: one UPDATE per table, keyed on the
+# logged-in user's own id
+def apply_profile_updates(cur, key_column, key, changes):
+    for table, values in changes.items():
+        assignments = ', '.join(f'`{field}` = %s' for field in values)
+        cur.execute(f"""UPDATE {table}
+                        SET {assignments}
+                        WHERE {key_column} = %s
+                    """, (*values.values(), key))
+
+
 @app.route('/patient/update', methods=['POST'])
 @login_required
 def update_patient_info():
@@ -472,79 +719,60 @@ def update_patient_info():
     new_value = data.get('value')
     patient_id = data.get('patient_id') 
     
+    response = update_patient_profile(patient_id, {update_field: new_value})
+    if (isinstance(response, tuple)):
+        return response  # Error
+    return jsonify({
+        "success": True, 
+        "message": "Update successful", 
+        "new_value": response[update_field]
+    })
+
+
+# Route for saving several profile edits at once (patient and insurance
+# fields), in one transaction
+@app.route('/patient/profile', methods=['PATCH'])
+@login_required
+def patch_patient_profile():
+    data = request.json or {}
+    
+    response = update_patient_profile(data.get('patient_id'), data.get('fields'))
+    if (isinstance(response, tuple)):
+        return response  # Error
+    return jsonify({
+        "success": True, 
+        "message": "Update successful", 
+        "new_values": response
+    })
+
+
+# Apply profile edits for the logged-in patient; returns the new display
+# values, or an error response
+def update_patient_profile(patient_id, updates):
+    # Retrieve the logged-in patient
+    patient_db_id = current_user.patient_id
+    
+    if (patient_db_id is None):
+        return jsonify({"success": False, "message": "Patient not found."}), 404
+    
+    # Check that the user is editing their own data
+    if (str(patient_db_id) != str(patient_id)):
+        return jsonify({"success": False, "message": "Authorization error."}), 403
+    
+    try:
+        changes, display = validate_profile_updates(updates, PATIENT_PROFILE_TABLES)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
     cur = mysql.connection.cursor()
     try:
-        # Retrieve the logged-in patient
-        cur.execute("""SELECT patient_id
-                       FROM patient
-                       WHERE user_id = %s
-                    """, (current_user.id,))
-        patient = cur.fetchone()
+        apply_profile_updates(cur, 'patient_id', patient_db_id, changes)
         
-        if (not patient):
-            return jsonify({"success": False, "message": "Patient not found."}), 404
-        
-        # Check that the user is editing their own data
-        patient_db_id = patient['patient_id']
-        if (str(patient_db_id) != str(patient_id)):
-            return jsonify({"success": False, "message": "Authorization error."}), 403
-
-        # Initialize response value
-        response_value = new_value
-        
-        # Update the Patient table
-        if (update_field in ALLOWED_PATIENT_FIELDS):
-            # Validate date_of_birth (YYYY-MM-DD)
-            if (update_field == 'date_of_birth'):
-                try:
-                    datetime.strptime(new_value, '%Y-%m-%d')
-                except ValueError:
-                    return jsonify({"success": False, "message": "Invalid date format."}), 400
-            
-            cur.execute(f"""UPDATE patient 
-                            SET `{update_field}` = %s 
-                            WHERE patient_id = %s
-                        """, (new_value, patient_db_id))
-            
-            # Format the date display (MM-DD-YYYY)
-            if (update_field == 'date_of_birth' and new_value):
-                try:
-                    date_obj = datetime.strptime(new_value, '%Y-%m-%d').date()
-                    response_value = date_obj.strftime('%m-%d-%Y')
-                except:
-                    response_value = new_value
-                    
-        # (Or) Update the Insurance table
-        elif (update_field in ALLOWED_INSURANCE_FIELDS):
-            # Validate date_of_expiry (YYYY-MM-DD)
-            if (update_field == 'date_of_expiry'):
-                try:
-                    datetime.strptime(new_value, '%Y-%m-%d')
-                except ValueError:
-                    return jsonify({"success": False, "message": "Invalid date format."}), 400
-            
-            cur.execute(f"""UPDATE insurance 
-                            SET `{update_field}` = %s 
-                            WHERE patient_id = %s
-                        """, (new_value, patient_db_id))
-            
-            # Format the date display (MM-DD-YYYY)
-            if (update_field == 'date_of_expiry' and new_value):
-                try:
-                    date_obj = datetime.strptime(new_value, '%Y-%m-%d').date()
-                    response_value = date_obj.strftime('%m-%d-%Y')
-                except:
-                    response_value = new_value
-        else:
-            return jsonify({"success": False, "message": "Invalid field."}), 400
-        
-        # Commit the queries and send a response
+        # Commit the queries
         mysql.connection.commit()
-        return jsonify({
-            "success": True, 
-            "message": "Update successful", 
-            "new_value": response_value
-        })
+        versions.bump('patient', patient_db_id)
+        versions.bump('patients')
+        return display
         
     except Exception as e:
         mysql.connection.rollback()
@@ -556,6 +784,7 @@ def update_patient_info():
 
 # Route for Patient Appointments
 @app.route('/patient/appointments')
+@mysql.read_only
 @login_required
 def patient_appointments():
     # Check that the user is a patient
@@ -565,11 +794,11 @@ def patient_appointments():
     # Retrieve patient data and appointments
     cur = mysql.connection.cursor()
     try:
-        # Get patient_id for the logged-in user
+        # Get the logged-in patient's name for the greeting
         cur.execute("""SELECT patient_id, first_name, last_name
                        FROM patient
-                       WHERE user_id = %s
-                    """, (current_user.id,))
+                       WHERE patient_id = %s
+                    """, (current_user.patient_id,))
         patient = cur.fetchone()
         
         if (not patient):
@@ -577,119 +806,160 @@ def patient_appointments():
         
         patient_id = patient['patient_id']
         
-        # Fetch all appointments for this patient
-        cur.execute("""SELECT a.*, d.doctor_firstname, d.doctor_lastname, r.room_id
-                       FROM appointment a
-                       LEFT JOIN doctor d ON a.doctor_id = d.doctor_id
-                       LEFT JOIN room r ON a.room_id = r.room_id
-                       WHERE a.patient_id = %s
-                       ORDER BY a.appointment_date DESC, a.appointment_time DESC
-                    """, (patient_id,))
-        appointments_raw = cur.fetchall()
-        
-        # Convert timedelta objects to time objects for appointment_time
-        appointments = []
-        for appt in appointments_raw:
-            if (hasattr(appt, 'keys')):
-                appt_dict = dict(appt)
-            else:
-                appt_dict = appt
-            
-            if (appt_dict.get('appointment_time')):
-                appt_time = appt_dict['appointment_time']
-                if (isinstance(appt_time, timedelta)):
-                    # Convert timedelta to time
-                    total_seconds = int(appt_time.total_seconds())
-                    hours = total_seconds // 3600
-                    minutes = (total_seconds % 3600) // 60
-                    seconds = total_seconds % 60
-                    appt_dict['appointment_time'] = dt_time(hours, minutes, seconds)
-            
-            appointments.append(appt_dict)
+        # Fetch the first page of appointments for this patient
+        # (further pages are loaded lazily from /patient/appointments/page)
+        appointments, next_cursor = fetch_appointment_page(cur, patient_id)
         
     except Exception as e:
         flash(f'An error occurred: {e}', 'error')
         appointments = []
+        next_cursor = None
         
     finally:
         cur.close()
     
     return render_template('patient/appointments.html', 
                          patient=patient, 
-                         appointments=appointments)
+                         appointments=appointments,
+                         next_cursor=next_cursor)
+
+
+# Route for fetching a page of patient appointments (newest first)
+@app.route('/patient/appointments/page', methods=['GET'])
+@mysql.read_only
+@login_required
+def patient_appointments_page():
+    # Check that the user is a patient
+    if (current_user.role != 'patient'):
+        abort(403)
+    
+    # Get patient_id for the logged-in user
+    patient_id = current_user.patient_id
+    
+    if (patient_id is None):
+        return jsonify({"success": False, "message": "Patient not found"}), 404
+    
+    cur = mysql.connection.cursor()
+    try:
+        appointments, next_cursor = fetch_appointment_page(cur, patient_id,
+                                                           request.args.get('cursor'),
+                                                           page_size_arg())
+        return jsonify({
+            "success": True,
+            "appointments": appointments,
+            "next_cursor": next_cursor
+        })
+        
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Error: {e}"}), 500
+    
+    finally:
+        cur.close()
 
 
 # Route for fetching patient appointments by date
 @app.route('/patient/appointments-by-date', methods=['POST'])
+@mysql.read_only
 @login_required
 def patient_appointments_by_date():
     # Check that the user is a patient
     if (current_user.role != 'patient'):
         abort(403)
     
-    data = request.json
-    selected_date = data.get('date', '').strip()
+    # Parse the date (YYYY-MM-DD)
+    try:
+        date_obj = endpoints.selected_date(request.json)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
     
-    if not selected_date:
-        return jsonify({"success": False, "message": "Date is required"}), 400
+    # Get patient_id for the logged-in user
+    patient_id = current_user.patient_id
     
+    if (patient_id is None):
+        return jsonify({"success": False, "message": "Patient not found"}), 404
+    
+    # Nothing to send if the patient's appointments haven't changed
+    read = endpoints.appointments_by_date(versions, patient_id, date_obj)
+    response = not_modified(read.etag)
+    if (response):
+        return response
+    
+    read_fresh(*read.fresh)
     cur = mysql.connection.cursor()
     try:
-        # Get patient_id for the logged-in user
-        cur.execute("""SELECT patient_id
-                       FROM patient
-                       WHERE user_id = %s
-                    """, (current_user.id,))
-        patient = cur.fetchone()
-        
-        if (not patient):
-            return jsonify({"success": False, "message": "Patient not found"}), 404
-        
-        patient_id = patient['patient_id']
+        # Fetch appointments for the selected date (using stored procedure)
+        cur.execute(read.sql, read.params)
+        return json_result(endpoints.appointments_response(cur.fetchall()), read.etag)
         
-        # Parse the date (YYYY-MM-DD)
-        try:
-            date_obj = datetime.strptime(selected_date, '%Y-%m-%d').date()
-        except ValueError:
-            return jsonify({"success": False, "message": "Invalid date format. Please use YYYY-MM-DD"}), 400
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Error: {e}"}), 500
+    
+    finally:
+        cur.close()
+
+
+# Route for fetching patient appointments over a date range (e.g. a calendar month)
+@app.route('/patient/appointments-by-range', methods=['POST'])
+@mysql.read_only
+@login_required
+def patient_appointments_by_range():
+    # Check that the user is a patient
+    if (current_user.role != 'patient'):
+        abort(403)
+    
+    data = request.json
+    start = data.get('start', '').strip()
+    end = data.get('end', '').strip()
+    
+    if (not start or not end):
+        return jsonify({"success": False, "message": "Start and end dates are required"}), 400
+    
+    # Parse the dates (YYYY-MM-DD)
+    try:
+        start_date = datetime.strptime(start, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end, '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid date format. Please use YYYY-MM-DD"}), 400
+    
+    # Limit the size of a single request
+    if (end_date < start_date or (end_date - start_date).days > MAX_APPOINTMENT_RANGE_DAYS):
+        return jsonify({"success": False, "message": f"The date range must span at most {MAX_APPOINTMENT_RANGE_DAYS} days"}), 400
+    
+    # Get patient_id for the logged-in user
+    patient_id = current_user.patient_id
+    
+    if (patient_id is None):
+        return jsonify({"success": False, "message": "Patient not found"}), 404
+    
+    # Nothing to send if the patient's appointments haven't changed
+    etag = versions.etag('by-range', patient_id, versions.version('patient', patient_id),
+                         versions.version('doctors'), start_date, end_date)
+    response = not_modified(etag)
+    if (response):
+        return response
+    
+    read_fresh(('patient', patient_id), ('doctors', 0))
+    cur = mysql.connection.cursor()
+    try:
+        # Fetch every appointment in the range (one query for the whole month)
+        cur.execute(queries.APPOINTMENTS_BY_RANGE_SQL, {'patient_id': patient_id, 'start': start_date,
+                                                        'end': end_date})
         
-        # Fetch appointments for the selected date (using stored procedure)
-        cur.execute("""CALL get_patient_appointments_by_date(%s, %s)""", (patient_id, date_obj))
-        appointments_raw = cur.fetchall()
-        
-        # Convert timedelta objects to time objects for appointment_time
-        appointments_list = []
-        for appt in appointments_raw:
-            if (hasattr(appt, 'keys')):
-                appt_dict = dict(appt)
-            else:
-                appt_dict = appt
-            
-            if (appt_dict.get('appointment_time')):
-                appt_time = appt_dict['appointment_time']
-                if (isinstance(appt_time, timedelta)):
-                    # Convert timedelta to time
-                    total_seconds = int(appt_time.total_seconds())
-                    hours = total_seconds // 3600
-                    minutes = (total_seconds % 3600) // 60
-                    seconds = total_seconds % 60
-                    appt_dict['appointment_time'] = dt_time(hours, minutes, seconds)
-            
-            # Convert date and time to strings for JSON
-            if (appt_dict.get('appointment_date')):
-                appt_dict['appointment_date'] = appt_dict['appointment_date'].strftime('%Y-%m-%d')
-            if (appt_dict.get('appointment_time')):
-                if (isinstance(appt_dict['appointment_time'], str)):
-                    appt_dict['appointment_time'] = appt_dict['appointment_time']
-                else:
-                    appt_dict['appointment_time'] = appt_dict['appointment_time'].strftime('%H:%M:%S')
-            
-            appointments_list.append(appt_dict)
+        # Group the appointments by day (with per-day counts for the calendar)
+        days = {}
+        for appt in Appointment.from_rows(cur.fetchall()):
+            days.setdefault(appt.appointment_date.isoformat(), []).append(appt)
         
-        return jsonify({
+        return with_etag(jsonify({
             "success": True,
-            "appointments": appointments_list
-        })
+            "start": start_date,
+            "end": end_date,
+            "days": days,
+            "counts": {day: len(appts) for day, appts in days.items()}
+        }), etag)
         
     except Exception as e:
         return jsonify({"success": False, "message": f"Error: {e}"}), 500
@@ -715,40 +985,23 @@ def cancel_appointment():
     cur = mysql.connection.cursor()
     try:
         # Get patient_id for the logged-in user
-        cur.execute("""SELECT patient_id
-                       FROM patient
-                       WHERE user_id = %s
-                    """, (current_user.id,))
-        patient = cur.fetchone()
+        patient_id = current_user.patient_id
         
-        if (not patient):
+        if (patient_id is None):
             return jsonify({"success": False, "message": "Patient not found"}), 404
         
-        patient_id = patient['patient_id']
+        # Delete the appointment if it belongs to this patient
+        cur.execute(*endpoints.cancel_appointment(patient_id, appointment_id))
+        cancelled = cur.fetchone()
+        cur.nextset()  # The CALL's own status result
         
-        # Verify that the appointment belongs to this patient
-        cur.execute("""SELECT appointment_id, appointment_date
-                       FROM appointment
-                       WHERE appointment_id = %s
-                           AND patient_id = %s
-                    """, (appointment_id, patient_id))
-        appointment = cur.fetchone()
-        
-        if (not appointment):
-            return jsonify({"success": False, "message": "Appointment not found or does not belong to this patient"}), 404
-        
-        # Delete the appointment
-        cur.execute("""DELETE FROM appointment
-                       WHERE appointment_id = %s
-                           AND patient_id = %s
-                    """, (appointment_id, patient_id))
+        refused = endpoints.cancel_refused(cancelled)
+        if (refused):
+            mysql.connection.rollback()
+            return json_result(refused)
         
         mysql.connection.commit()
-        
-        return jsonify({
-            "success": True,
-            "message": "Appointment cancelled successfully"
-        })
+        return json_result(endpoints.appointment_cancelled(versions, patient_id, cancelled))
         
     except Exception as e:
         mysql.connection.rollback()
@@ -758,8 +1011,72 @@ def cancel_appointment():
         cur.close()
 
 
+# Route for booking an appointment (refused if the doctor or the room is
+# already taken for any of its minutes)
+@app.route('/patient/appointments/book', methods=['POST'])
+@login_required
+def book_appointment():
+    # Check that the user is a patient
+    if (current_user.role != 'patient'):
+        abort(403)
+    
+    data = request.json or {}
+    
+    # Get patient_id for the logged-in user
+    patient_id = current_user.patient_id
+    
+    if (patient_id is None):
+        return jsonify({"success": False, "message": "Patient not found"}), 404
+    
+    # Validate the slot: a date from today on, a start time (HH:MM) and a
+    # duration ending by midnight
+    try:
+        doctor_id = int(data.get('doctor_id'))
+        room_id = int(data.get('room_id'))
+        day = datetime.strptime(data.get('date') or '', '%Y-%m-%d').date()
+        start_time = datetime.strptime(data.get('time') or '', '%H:%M').time()
+        duration = int(data.get('duration_minutes'))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "doctor_id, room_id, date (YYYY-MM-DD), time (HH:MM) "
+                                                     "and duration_minutes are required"}), 400
+    
+    if (day < datetime.now().date()):
+        return jsonify({"success": False, "message": "Appointments cannot be booked in the past"}), 400
+    if (not 0 < duration <= app.config['BOOKING_MAX_MINUTES']
+            or start_time.hour * 60 + start_time.minute + duration > 24 * 60):
+        return jsonify({"success": False, "message": "Invalid duration"}), 400
+    if (reference.room(room_id) is None):
+        return jsonify({"success": False, "message": "Room not found"}), 404
+    
+    description = (data.get('description') or '').strip()[:255] or None
+    
+    try:
+        appointment_id = booking.book(mysql.connection, patient_id, doctor_id, room_id, day,
+                                      start_time, duration, description)
+        
+    except BookingConflict as e:
+        next_available = None
+        if (e.next_available is not None):
+            next_available = '%02d:%02d' % divmod(e.next_available, 60)
+        return jsonify({"success": False, "message": str(e), "next_available": next_available}), 409
+    
+    except Exception as e:
+        mysql.connection.rollback()
+        # Foreign key violation: no such doctor
+        if (getattr(e, 'args', (None,))[0] == 1452):
+            return jsonify({"success": False, "message": "Doctor not found"}), 404
+        return jsonify({"success": False, "message": f"Error: {e}"}), 500
+    
+    return jsonify({
+        "success": True,
+        "message": "Appointment booked successfully",
+        "appointment_id": appointment_id
+    }), 201
+
+
 # Route for Doctor Homepage
 @app.route('/doctor/home')
+@mysql.read_only
 @login_required
 def doctor_home():
     # Check that the user is a doctor
@@ -768,18 +1085,18 @@ def doctor_home():
     
     # Retrieve data using the user's ID
     cur = mysql.connection.cursor()
-    cur.execute("""SELECT d.*, dep.*
-                   FROM doctor d
-                   LEFT JOIN department dep
-                   ON d.department_id = dep.department_id
-                   WHERE user_id = %s
-                """, (current_user.id,))
+    cur.execute(queries.DOCTOR_HOME_SQL, {'doctor_id': current_user.doctor_id})
     doctor_data = cur.fetchone()
     cur.close()
     
     # Check that the doctor exists
     if (not doctor_data):
         abort(404)
+    
+    # Add the department's details (from the reference cache)
+    department = reference.department(doctor_data['department_id'])
+    doctor_data['department_name'] = department.department_name if department else None
+    doctor_data['officelocation'] = department.officelocation if department else None
 
     return render_template('doctor/home.html', doctor=doctor_data)
 
@@ -792,39 +1109,59 @@ def update_doctor_info():
     new_value = data.get('value')
     doctor_id = data.get('doctor_id')
     
+    response = update_doctor_profile(doctor_id, {update_field: new_value})
+    if (isinstance(response, tuple)):
+        return response  # Error
+    return jsonify({
+        "success": True, 
+        "message": "Update successful", 
+        "new_value": response[update_field]
+    })
+
+
+# Route for saving several profile edits at once, in one transaction
+@app.route('/doctor/profile', methods=['PATCH'])
+@login_required
+def patch_doctor_profile():
+    data = request.json or {}
+    
+    response = update_doctor_profile(data.get('doctor_id'), data.get('fields'))
+    if (isinstance(response, tuple)):
+        return response  # Error
+    return jsonify({
+        "success": True, 
+        "message": "Update successful", 
+        "new_values": response
+    })
+
+
+# Apply profile edits for the logged-in doctor; returns the new display
+# values, or an error response
+def update_doctor_profile(doctor_id, updates):
+    # Retrieve the logged-in doctor
+    doctor_db_id = current_user.doctor_id
+    
+    if (doctor_db_id is None):
+        return jsonify({"success": False, "message": "Doctor not found."}), 404
+    
+    # Check that the user is editing their own data
+    if (str(doctor_db_id) != str(doctor_id)):
+        return jsonify({"success": False, "message": "Authorization error."}), 403
+    
+    try:
+        changes, display = validate_profile_updates(updates, DOCTOR_PROFILE_TABLES)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
     cur = mysql.connection.cursor()
     try:
-        # Retrieve the logged-in doctor
-        cur.execute("""SELECT doctor_id
-                       FROM doctor
-                       WHERE user_id = %s
-                    """, (current_user.id,))
-        doctor = cur.fetchone()
-        
-        if (not doctor):
-            return jsonify({"success": False, "message": "Doctor not found."}), 404
-        
-        # Check that the user is editing their own data
-        doctor_db_id = doctor['doctor_id']
-        if (str(doctor_db_id) != str(doctor_id)):
-            return jsonify({"success": False, "message": "Authorization error."}), 403
-        
-        # Update the Doctor table
-        if (update_field in ALLOWED_DOCTOR_FIELDS):
-            cur.execute(f"""UPDATE doctor 
-                            SET `{update_field}` = %s 
-                            WHERE doctor_id = %s
-                        """, (new_value, doctor_db_id))
-        else:
-            return jsonify({"success": False, "message": "Invalid field."}), 400
+        apply_profile_updates(cur, 'doctor_id', doctor_db_id, changes)
         
-        # Commit the queries and send a response
+        # Commit the queries
         mysql.connection.commit()
-        return jsonify({
-            "success": True, 
-            "message": "Update successful", 
-            "new_value": new_value
-        })
+        versions.bump('doctor', doctor_db_id)
+        versions.bump('doctors')
+        return display
         
     except Exception as e:
         mysql.connection.rollback()
@@ -837,6 +1174,7 @@ def update_doctor_info():
 # Route for Doctor Appointments
 @app.route('/doctor/appointments')
 @app.route('/doctor/appointment/<int:appointment_id>')
+@mysql.read_only
 @login_required
 def doctor_appointments(appointment_id=None):
     # Check that the user is a doctor
@@ -849,90 +1187,52 @@ def doctor_appointments(appointment_id=None):
     cur = mysql.connection.cursor()
     try:
         # Get doctor_id for the logged-in user
-        cur.execute("""SELECT doctor_id
-                       FROM doctor
-                       WHERE user_id = %s
-                    """, (current_user.id,))
-        doctor = cur.fetchone()
+        doctor_id = current_user.doctor_id
         
-        if (not doctor):
+        if (doctor_id is None):
             abort(404)
         
-        doctor_id = doctor['doctor_id']
+        # Fetch the whole day (with each appointment's patient) in one query.
+        # If an appointment_id is provided in the URL, the day is that appointment's date.
+        cur.execute(queries.DOCTOR_DAY_SQL, {'doctor_id': doctor_id, 'appointment_id': appointment_id,
+                                             'date': selected_date})
+        rows = cur.fetchall()
         
-        # Determine the selected appointment and date
-        selected_appointment = None
-        patient = None
+        appointments = Appointment.from_rows(rows)
+        patients = {row['patient_id']: Patient.from_row(row) for row in rows
+                    if row['patient_id'] is not None}
         
-        # If appointment_id is provided in URL, fetch it first to get its date
-        if (appointment_id):
-            cur.execute("""SELECT a.appointment_id as id,
-                                  a.appointment_time as time,
-                                  a.patient_id,
-                                  a.doctor_id,
-                                  a.room_id,
-                                  a.appointment_date as date,
-                                  a.description,
-                                  a.duration_minutes as duration
-                           FROM appointment a
-                           WHERE a.appointment_id = %s
-                               AND a.doctor_id = %s
-                        """, (appointment_id, doctor_id))
-            selected_appointment = cur.fetchone()
-            
-            # Use the appointment's date if found
-            if (selected_appointment):
-                selected_date = selected_appointment['date'].strftime('%Y-%m-%d')
-        
-        # Fetch all appointments for this doctor on the selected date
-        cur.execute("""SELECT a.appointment_id as id,
-                              a.appointment_time as time,
-                              CONCAT(p.first_name, ' ', p.last_name) as patient_name,
-                              a.patient_id,
-                              a.doctor_id,
-                              a.room_id,
-                              a.appointment_date as date,
-                              a.description,
-                              a.duration_minutes as duration
-                       FROM appointment a
-                       LEFT JOIN patient p ON a.patient_id = p.patient_id
-                       WHERE a.doctor_id = %s
-                           AND a.appointment_date = %s
-                       ORDER BY a.appointment_time ASC
-                    """, (doctor_id, selected_date))
-        appointments = cur.fetchall()
-        
-        # If no appointment was selected but appointments exist, select the first one
-        if (not selected_appointment and appointments):
+        # Select the requested appointment (or the first one of the day)
+        selected_appointment = next((appt for appt in appointments
+                                     if appt.appointment_id == appointment_id), None)
+        if (selected_appointment):
+            selected_date = selected_appointment.appointment_date.isoformat()
+        elif (appointments):
             selected_appointment = appointments[0]
-            appointment_id = selected_appointment['id']
         
-        # If an appointment is selected, fetch patient information
-        if (selected_appointment):
-            cur.execute("""SELECT patient_id as id,
-                                  first_name,
-                                  last_name,
-                                  date_of_birth as dob,
-                                  weight_lb as weight,
-                                  height_in as height,
-                                  age,
-                                  address
-                           FROM patient
-                           WHERE patient_id = %s
-                        """, (selected_appointment['patient_id'],))
-            patient = cur.fetchone()
+        patient = patients.get(selected_appointment.patient_id) if selected_appointment else None
         
     except Exception as e:
         flash(f'An error occurred: {e}', 'error')
         appointments = []
+        patients = {}
         selected_appointment = None
         patient = None
         
     finally:
         cur.close()
     
+    # Details for every slot are embedded in the page, so switching
+    # between appointments does not need a round trip
+    day = {
+        'appointments': {appt.appointment_id: appt for appt in appointments},
+        'patients': patients
+    }
+    
     return render_template('doctor/appointments.html',
                          appointments=appointments,
+                         patients=patients,
+                         day=day,
                          selected_date=selected_date,
                          selected_appointment=selected_appointment,
                          patient=patient)
@@ -940,88 +1240,39 @@ def doctor_appointments(appointment_id=None):
 
 # Route to fetch doctor appointments and patient details
 @app.route('/doctor/appointments/<int:appointment_id>/details', methods=['GET'])
+@mysql.read_only
 @login_required
 def get_appointment_details(appointment_id):
     # Check that the user is a doctor
     if (current_user.role != 'doctor'):
         abort(403)
     
+    # Get doctor_id for the logged-in user
+    doctor_id = current_user.doctor_id
+    
+    if (doctor_id is None):
+        return jsonify({"success": False, "message": "Doctor not found."}), 404
+    
+    read = endpoints.appointment_details(versions, doctor_id, appointment_id)
+    read_fresh(*read.fresh)
     cur = mysql.connection.cursor()
     try:
-        # Get doctor_id for the logged-in user
-        cur.execute("""SELECT doctor_id
-                       FROM doctor
-                       WHERE user_id = %s
-                    """, (current_user.id,))
-        doctor = cur.fetchone()
-        
-        if (not doctor):
-            return jsonify({"success": False, "message": "Doctor not found."}), 404
-        
-        doctor_id = doctor['doctor_id']
-        
-        # Fetch appointment details
-        cur.execute("""SELECT a.appointment_id as id,
-                              a.appointment_time as time,
-                              a.patient_id,
-                              a.doctor_id,
-                              a.room_id,
-                              a.appointment_date as date,
-                              a.description,
-                              a.duration_minutes as duration
-                       FROM appointment a
-                       WHERE a.appointment_id = %s
-                           AND a.doctor_id = %s
-                    """, (appointment_id, doctor_id))
+        # Fetch appointment details (only the doctor's own)
+        cur.execute(read.sql, read.params)
         appointment = cur.fetchone()
         
-        if (not appointment):
-            return jsonify({"success": False, "message": "Appointment not found."}), 404
+        refused = endpoints.details_refused(appointment)
+        if (refused):
+            return json_result(refused)
         
-        # Fetch patient information
-        cur.execute("""SELECT patient_id as id,
-                              first_name,
-                              last_name,
-                              date_of_birth as dob,
-                              weight_lb as weight,
-                              height_in as height,
-                              age,
-                              address
-                       FROM patient
-                       WHERE patient_id = %s
-                    """, (appointment['patient_id'],))
-        patient = cur.fetchone()
+        # Nothing more to send if neither the doctor's appointments nor any patient changed
+        response = not_modified(read.etag)
+        if (response):
+            return response
         
-        # Format the response
-        appointment_data = {
-            'id': appointment['id'],
-            'time': str(appointment['time']) if appointment['time'] else None,
-            'patient_id': appointment['patient_id'],
-            'doctor_id': appointment['doctor_id'],
-            'room_id': appointment['room_id'],
-            'date': appointment['date'].strftime('%Y-%m-%d') if appointment['date'] else None,
-            'description': appointment['description'],
-            'duration': appointment['duration']
-        }
-        
-        patient_data = None
-        if (patient):
-            patient_data = {
-                'id': patient['id'],
-                'first_name': patient['first_name'],
-                'last_name': patient['last_name'],
-                'dob': patient['dob'].strftime('%Y-%m-%d') if patient['dob'] else None,
-                'weight': patient['weight'],
-                'height': patient['height'],
-                'age': patient['age'],
-                'address': patient['address']
-            }
-        
-        return jsonify({
-            "success": True,
-            "appointment": appointment_data,
-            "patient": patient_data
-        })
+        # Fetch patient information
+        cur.execute(*endpoints.appointment_patient(appointment))
+        return json_result(endpoints.details_response(appointment, cur.fetchone()), read.etag)
         
     except Exception as e:
         return jsonify({"success": False, "message": f"Error: {str(e)}"}), 500
@@ -1033,6 +1284,7 @@ def get_appointment_details(appointment_id):
 # Route for Patient Treatments
 @app.route('/patient/treatments')
 @app.route('/patient/treatments/<int:prescription_id>')
+@mysql.read_only
 @login_required
 def patient_treatments(prescription_id=None):
     # Check that the user is a patient
@@ -1042,66 +1294,83 @@ def patient_treatments(prescription_id=None):
     cur = mysql.connection.cursor()
     try:
         # Get patient_id for the logged-in user
-        cur.execute("""SELECT patient_id
-                       FROM patient
-                       WHERE user_id = %s
-                    """, (current_user.id,))
-        patient = cur.fetchone()
+        patient_id = current_user.patient_id
         
-        if (not patient):
+        if (patient_id is None):
             abort(404)
         
-        patient_id = patient['patient_id']
+        # The first page of the prescription history and its totals
+        # (further pages are served by /patient/prescriptions)
+        prescriptions, next_cursor = fetch_prescription_page(cur, patient_id)
+        totals = fetch_prescription_totals(cur, patient_id)
         
-        # If a specific prescription_id is provided, fetch that one
+        # Show the requested prescription, or the most recent one
         if (prescription_id):
-            cur.execute("""SELECT p.prescription_id as id,
-                                  t.treatment_name as name,
-                                  t.duration_days as duration,
-                                  t.description,
-                                  CASE WHEN p.paid = TRUE THEN 0 ELSE t.bill END as total_amount,
-                                  p.prescribed_on,
-                                  p.notes,
-                                  p.paid
-                           FROM prescription p
-                           JOIN treatment t ON p.treatment_name = t.treatment_name 
-                               AND p.duration_days = t.duration_days
-                           WHERE p.prescription_id = %s
-                               AND p.patient_id = %s
-                        """, (prescription_id, patient_id))
-            treatment = cur.fetchone()
-            
-            if (not treatment):
-                abort(404)
+            treatment = next((p for p in prescriptions if p.prescription_id == prescription_id), None)
+            if (treatment is None):
+                cur.execute(queries.PRESCRIPTION_SQL, {'prescription_id': prescription_id,
+                                                       'patient_id': patient_id})
+                row = cur.fetchone()
+                
+                if (not row):
+                    abort(404)
+                treatment = Prescription.from_row(row)
         else:
-            # Fetch the most recent prescription for this patient
-            cur.execute("""SELECT p.prescription_id as id,
-                                  t.treatment_name as name,
-                                  t.duration_days as duration,
-                                  t.description,
-                                  CASE WHEN p.paid = TRUE THEN 0 ELSE t.bill END as total_amount,
-                                  p.prescribed_on,
-                                  p.notes,
-                                  p.paid
-                           FROM prescription p
-                           JOIN treatment t ON p.treatment_name = t.treatment_name 
-                               AND p.duration_days = t.duration_days
-                           WHERE p.patient_id = %s
-                           ORDER BY p.prescribed_on DESC, p.prescription_id DESC
-                           LIMIT 1
-                        """, (patient_id,))
-            treatment = cur.fetchone()
+            treatment = prescriptions[0] if prescriptions else None
         
     except Exception as e:
         flash(f'An error occurred: {e}', 'error')
         treatment = None
         prescriptions = []
+        next_cursor = None
+        totals = None
         
     finally:
         cur.close()
     
     return render_template('patient/treatments.html',
-                         treatment=treatment)
+                         treatment=treatment,
+                         prescriptions=prescriptions,
+                         next_cursor=next_cursor,
+                         totals=totals)
+
+
+# Route for fetching a page of a patient's prescriptions (newest first),
+# with the totals over all of them
+@app.route('/patient/prescriptions', methods=['GET'])
+@mysql.read_only
+@login_required
+def patient_prescriptions_page():
+    # Check that the user is a patient
+    if (current_user.role != 'patient'):
+        abort(403)
+    
+    # Get patient_id for the logged-in user
+    patient_id = current_user.patient_id
+    
+    if (patient_id is None):
+        return jsonify({"success": False, "message": "Patient not found"}), 404
+    
+    cur = mysql.connection.cursor()
+    try:
+        prescriptions, next_cursor = fetch_prescription_page(cur, patient_id,
+                                                             request.args.get('cursor'),
+                                                             page_size_arg())
+        return jsonify({
+            "success": True,
+            "prescriptions": prescriptions,
+            "next_cursor": next_cursor,
+            "totals": fetch_prescription_totals(cur, patient_id)
+        })
+        
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Error: {e}"}), 500
+    
+    finally:
+        cur.close()
 
 
 # Route for paying a patient's bill
@@ -1115,49 +1384,66 @@ def patient_pay_bill(prescription_id):
     cur = mysql.connection.cursor()
     try:
         # Get patient_id for the logged-in user
-        cur.execute("""SELECT patient_id
-                       FROM patient
-                       WHERE user_id = %s
-                    """, (current_user.id,))
-        patient = cur.fetchone()
+        patient_id = current_user.patient_id
         
-        if (not patient):
+        if (patient_id is None):
             return jsonify({"success": False, "message": "Patient not found."}), 404
         
-        patient_id = patient['patient_id']
+        # Mark the bill paid, if it is this patient's and still unpaid
+        sql, bill = endpoints.pay_bill(patient_id, prescription_id)
+        cur.execute(sql, bill)
         
-        # Verify the prescription belongs to this patient and get treatment info
-        cur.execute("""SELECT p.prescription_id,
-                              p.paid,
-                              t.bill
-                       FROM prescription p
-                       JOIN treatment t ON p.treatment_name = t.treatment_name 
-                           AND p.duration_days = t.duration_days
-                       WHERE p.prescription_id = %s
-                         AND p.patient_id = %s
-                    """, (prescription_id, patient_id))
-        prescription = cur.fetchone()
-        
-        if (not prescription):
-            return jsonify({"success": False, "message": "Prescription not found or unauthorized."}), 404
-        
-        # Check if bill is already paid
-        if (prescription['paid']):
-            return jsonify({"success": False, "message": "Bill is already paid."}), 400
-        
-        # Update the prescription paid status to TRUE
-        cur.execute("""UPDATE prescription
-                       SET paid = TRUE
-                       WHERE prescription_id = %s
-                    """, (prescription_id,))
+        if (cur.rowcount == 0):
+            # Tell apart an unknown prescription from one already paid
+            cur.execute(queries.BILL_STATUS_SQL, bill)
+            return json_result(endpoints.bill_refused(cur.fetchone()))
         
         # Commit the changes
         mysql.connection.commit()
+        return json_result(endpoints.bill_paid(versions, patient_id))
+        
+    except Exception as e:
+        mysql.connection.rollback()
+        return jsonify({"success": False, "message": f"Error: {str(e)}"}), 500
+    
+    finally:
+        cur.close()
+
+
+# Route for paying all of a patient's outstanding bills at once
+@app.route('/patient/treatments/pay-all', methods=['POST'])
+@login_required
+def patient_pay_all_bills():
+    # Check that the user is a patient
+    if (current_user.role != 'patient'):
+        abort(403)
+    
+    cur = mysql.connection.cursor()
+    try:
+        # Get patient_id for the logged-in user
+        patient_id = current_user.patient_id
+        
+        if (patient_id is None):
+            return jsonify({"success": False, "message": "Patient not found."}), 404
+        
+        # Mark every unpaid bill of this patient paid
+        cur.execute(queries.PAY_ALL_BILLS_SQL, {'patient_id': patient_id})
+        paid = cur.rowcount
+        
+        if (paid == 0):
+            return jsonify({"success": False, "message": "There are no outstanding bills."}), 400
+        
+        # The new totals, as seen by this transaction
+        totals = fetch_prescription_totals(cur, patient_id)
+        
+        mysql.connection.commit()
+        versions.bump('patient', patient_id)
         
         return jsonify({
             "success": True,
-            "message": "Bill paid successfully!",
-            "new_amount": 0
+            "message": f"{paid} bill{'s' if paid != 1 else ''} paid successfully!",
+            "paid": paid,
+            "totals": totals
         })
         
     except Exception as e:
@@ -1170,6 +1456,7 @@ def patient_pay_bill(prescription_id):
 
 # Route for Patient Medical Record
 @app.route('/patient/medical-record')
+@mysql.read_only
 @login_required
 def patient_medical_record():
     # Check that the user is a patient
@@ -1179,51 +1466,67 @@ def patient_medical_record():
     cur = mysql.connection.cursor()
     try:
         # Get patient_id for the logged-in user
-        cur.execute("""SELECT patient_id
-                       FROM patient
-                       WHERE user_id = %s
-                    """, (current_user.id,))
-        patient = cur.fetchone()
+        patient_id = current_user.patient_id
         
-        if (not patient):
+        if (patient_id is None):
             abort(404)
         
-        patient_id = patient['patient_id']
+        # The latest record and blood test date, from the patient's summary row
+        cur.execute(queries.LATEST_MEDICAL_RECORD_SQL, {'patient_id': patient_id})
+        medical_record = cur.fetchone()
         
-        # Fetch all medical records
-        cur.execute("""SELECT medicalrecord_id as record_id,
-                                patient_id as account_id,
-                                diagnosis as diagnoses,
-                                result
-                        FROM medicalrecord
-                        WHERE patient_id = %s
-                        ORDER BY medicalrecord_id DESC
-                    """, (patient_id,))
-        medical_records = cur.fetchall()
-        
-        # Retrieve the most recent medical record for display
-        medical_record = medical_records[0] if medical_records else None
-        
-        # Retrieve the most recent blood test date
-        cur.execute("""SELECT MAX(time) as last_bloodtest_date
-                       FROM bloodtest
-                       WHERE patient_id = %s
-                    """, (patient_id,))
-        bloodtest_result = cur.fetchone()
-        last_bloodtest_date = bloodtest_result['last_bloodtest_date'] if bloodtest_result and bloodtest_result['last_bloodtest_date'] else None
+        # No medical record yet
+        if (medical_record and medical_record['record_id'] is None):
+            medical_record = None
         
-        # Add the most recent blood test date to the medical record dictionary
-        if medical_record:
-            medical_record['last_bloodtest_date'] = last_bloodtest_date
+        # The first page of the record history (older pages are loaded on
+        # demand from /patient/medical-records)
+        medical_records, next_cursor = fetch_medical_record_page(cur, patient_id)
         
     except Exception as e:
         flash(f'An error occurred: {e}', 'error')
         medical_record = None
         medical_records = []
+        next_cursor = None
         
     finally:
         cur.close()
     
-    return render_template('patient/medical_record.html',
-                        medical_record=medical_record,
-                        medical_records=medical_records) 
\ No newline at end of file
+    return render_template('patient/medical_record.html', medical_record=medical_record,
+                           medical_records=medical_records, next_cursor=next_cursor)
+
+
+# Route for fetching a page of patient medical records (newest first)
+@app.route('/patient/medical-records', methods=['GET'])
+@mysql.read_only
+@login_required
+def patient_medical_records_page():
+    # Check that the user is a patient
+    if (current_user.role != 'patient'):
+        abort(403)
+    
+    # Get patient_id for the logged-in user
+    patient_id = current_user.patient_id
+    
+    if (patient_id is None):
+        return jsonify({"success": False, "message": "Patient not found"}), 404
+    
+    cur = mysql.connection.cursor()
+    try:
+        medical_records, next_cursor = fetch_medical_record_page(cur, patient_id,
+                                                                 request.args.get('cursor'),
+                                                                 page_size_arg())
+        return jsonify({
+            "success": True,
+            "medical_records": medical_records,
+            "next_cursor": next_cursor
+        })
+        
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Error: {e}"}), 500
+    
+    finally:
+        cur.close()
@@ -0,0 +1,446 @@
+# Async serving mode (`gunicorn asgi:app -k uvicorn_worker.UvicornWorker`).
+#
+# The small JSON endpoints below run on the event loop with an aiomysql
+# pool, so one process serves many of them while they wait on MySQL.
+# Every other route (and any request these handlers don't answer
+# themselves, e.g. a missing login or a 403) goes to the Flask app, which
+# runs in a thread pool. Users are authenticated from the Flask session
+# cookie, like flask_login does.
+#
+# The endpoints' statements and responses come from endpoints.py (shared
+# with the Flask routes), and they are traced, read from the replicas and
+# kept on the primary after a write the same way as the Flask routes.
+import asyncio
+import itertools
+import json
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import aiomysql
+import pymysql.converters
+from a2wsgi import WSGIMiddleware
+from itsdangerous import BadSignature
+from pymysql.constants import FIELD_TYPE
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_etags, quote_etag
+
+import endpoints
+import queries
+from app import User, app as flask_app, cache_user, mysql, sql_instrumentation, user_cache, versions
+from db import PoolTimeout, time_of_day
+from instrumentation import async_instrumented, async_trace
+from metrics import IN_FLIGHT, REQUEST_LATENCY, REQUESTS
+
+# Same conversions as the sync pool (TIME columns as datetime.time)
+CONVERSIONS = pymysql.converters.conversions.copy()
+CONVERSIONS[FIELD_TYPE.TIME] = lambda value: time_of_day(pymysql.converters.convert_timedelta(value))
+
+flask_app.config.setdefault('ASYNC_POOL_MIN_SIZE', 1)
+flask_app.config.setdefault('ASYNC_POOL_MAX_SIZE', 20)
+flask_app.config.setdefault('ASYNC_WSGI_THREADS', 10)
+config = flask_app.config
+
+flask_asgi = WSGIMiddleware(flask_app, workers=config['ASYNC_WSGI_THREADS'])
+session_interface = flask_app.session_interface
+session_serializer = session_interface.get_signing_serializer(flask_app)
+pool = None
+replicas = []  # One pool per MYSQL_REPLICAS entry
+replica_down_until = []
+next_replica = itertools.count()
+
+
+async def acquire(source):
+    try:
+        return await asyncio.wait_for(source.acquire(), config['MYSQL_POOL_TIMEOUT'])
+    except asyncio.TimeoutError:
+        raise PoolTimeout(f"No database connection available after {config['MYSQL_POOL_TIMEOUT']}s")
+
+
+# A connection from the next healthy replica (the primary's pool and
+# None if there is none)
+async def acquire_replica():
+    start = next(next_replica)
+    for i in range(len(replicas)):
+        index = (start + i) % len(replicas)
+        if (replica_down_until[index] > time.monotonic()):
+            continue
+        try:
+            return replicas[index], await acquire(replicas[index])
+        except PoolTimeout:
+            continue  # Busy, not down
+        except Exception as e:
+            flask_app.logger.warning('Replica %d unavailable, skipping it for %ss: %s', index,
+                                     config['MYSQL_REPLICA_RETRY_INTERVAL'], e)
+            replica_down_until[index] = time.monotonic() + config['MYSQL_REPLICA_RETRY_INTERVAL']
+    return pool, None
+
+
+# A connection for the request (any open transaction is rolled back
+# before it is returned). A read-only endpoint reads from a replica, like
+# a @mysql.read_only route, unless its session wrote something recently
+# or one of the `fresh` versions changed too recently to have replicated.
+@asynccontextmanager
+async def connection(request=None, fresh=()):
+    source, conn = pool, None
+    if (request is not None and request.state.read_only and replicas
+            and request.state.session.get('_mysql_primary_until', 0) <= time.time()
+            and not versions.changed_within(config['MYSQL_REPLICA_LAG'], *fresh)):
+        source, conn = await acquire_replica()
+    if (conn is None):
+        conn = await acquire(pool)
+    try:
+        yield conn
+    finally:
+        try:
+            await conn.rollback()
+        except Exception:
+            conn.close()
+        source.release(conn)
+
+
+def create_pool(minsize, **options):
+    return aiomysql.create_pool(
+        db=config['MYSQL_DB'],
+        charset=config['MYSQL_CHARSET'],
+        minsize=minsize,
+        maxsize=config['ASYNC_POOL_MAX_SIZE'],
+        pool_recycle=config['MYSQL_POOL_MAX_LIFETIME'],
+        cursorclass=async_instrumented(aiomysql.DictCursor),
+        conv=CONVERSIONS,
+        autocommit=False,
+        **options
+    )
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global pool, replicas, replica_down_until
+    pool = await create_pool(config['ASYNC_POOL_MIN_SIZE'],
+                             host=config['MYSQL_HOST'],
+                             port=int(config['MYSQL_PORT']),
+                             user=config['MYSQL_USER'],
+                             password=config['MYSQL_PASSWORD'])
+    # Replica connections are only opened when needed (one that is down
+    # must not keep the app from starting)
+    replicas = [await create_pool(0,
+                                  host=options['host'],
+                                  port=options['port'],
+                                  user=options['user'],
+                                  password=options['passwd'],
+                                  connect_timeout=options['connect_timeout'])
+                for options in mysql.replica_options]
+    replica_down_until = [0.0] * len(replicas)
+    try:
+        yield
+    finally:
+        for source in [pool] + replicas:
+            source.close()
+            await source.wait_closed()
+
+
+# The Flask session from its cookie ({} if there is no valid session)
+def load_session(request):
+    cookie = request.cookies.get(config['SESSION_COOKIE_NAME'])
+    if (not cookie):
+        return {}
+    try:
+        return session_serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+
+# Keep this browser session's reads on the primary for a while after it
+# changed something (as MySQLPool does for the Flask routes)
+def remember_write(response, session):
+    session['_mysql_primary_until'] = time.time() + config['MYSQL_REPLICA_LAG']
+    samesite = session_interface.get_cookie_samesite(flask_app)
+    response.set_cookie(
+        config['SESSION_COOKIE_NAME'],
+        session_serializer.dumps(session),
+        max_age=int(flask_app.permanent_session_lifetime.total_seconds()) if session.get('_permanent') else None,
+        path=session_interface.get_cookie_path(flask_app),
+        domain=session_interface.get_cookie_domain(flask_app),
+        secure=session_interface.get_cookie_secure(flask_app),
+        httponly=session_interface.get_cookie_httponly(flask_app),
+        samesite=samesite.lower() if samesite else None
+    )
+    response.headers.append('Vary', 'Cookie')
+
+
+# Same lookup (and cache) as load_user in app.py
+async def load_user(user_id):
+    user_row = user_cache.get(str(user_id))
+    if (user_row):
+        return User(**user_row)
+
+    async with connection() as conn, conn.cursor() as cur:
+        await cur.execute(queries.LOAD_USER_SQL, {'user_id': user_id})
+        user_row = await cur.fetchone()
+
+    if (user_row):
+        return cache_user(user_id, user_row)
+
+
+def json_response(data, status=200, etag=None):
+    headers = {}
+    if (etag):
+        headers = {'ETag': quote_etag(etag), 'Cache-Control': 'private, no-cache'}
+    return Response(flask_app.json.dumps(data), status, headers, media_type='application/json')
+
+
+# A JSON response from an endpoints.py (body, status), with its validator
+def json_result(result, etag=None):
+    body, status = result
+    return json_response(body, status, etag if status == 200 else None)
+
+
+# A 304 response if the client's copy (If-None-Match) is still current
+def not_modified(request, etag):
+    if (not parse_etags(request.headers.get('if-none-match')).contains(etag)):
+        return None
+    return Response(status_code=304, headers={'ETag': quote_etag(etag), 'Cache-Control': 'private, no-cache'})
+
+
+# Hands a request (whose body was already read) to the Flask app
+class Delegate:
+    def __init__(self, body):
+        self.body = body
+
+    async def __call__(self, scope, receive, send):
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if (not sent):
+                sent = True
+                return {'type': 'http.request', 'body': self.body, 'more_body': False}
+            return await receive()
+
+        await flask_asgi(scope, replay, send)
+
+
+# Wrap an async handler(request, user, data): it runs only for a logged-in
+# user with a JSON body (when one is expected), and returns None to leave
+# the request to the Flask app (which answers it exactly as before).
+# `endpoint` is the Flask route's, whose rule labels the request in the
+# metrics and the slow query log; read_only is @mysql.read_only.
+def json_endpoint(endpoint, expects_body=True, read_only=False):
+    rule = next(flask_app.url_map.iter_rules(endpoint)).rule
+
+    def decorator(handler):
+        async def wrapper(request):
+            started = time.perf_counter()
+            IN_FLIGHT.inc()
+            trace = sql_instrumentation.start_trace()
+            token = async_trace.set(trace)
+            try:
+                response = await handle(request)
+            finally:
+                IN_FLIGHT.dec()
+                async_trace.reset(token)
+            if (not isinstance(response, Delegate)):
+                if (trace is not None):
+                    trace.endpoint, trace.route = endpoint, f'{request.method} {rule}'
+                    timing = sql_instrumentation.finish_trace(trace, response,
+                                                              f'{request.method} {request.url.path}')
+                    if (timing):
+                        response.headers.append('Server-Timing', timing)
+                REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - started)
+                REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+            return response
+
+        async def handle(request):
+            body = await request.body()
+            data = None
+            if (expects_body):
+                try:
+                    data = json.loads(body) if 'json' in request.headers.get('content-type', '') else None
+                except ValueError:
+                    pass
+                if (not isinstance(data, dict)):
+                    return Delegate(body)
+
+            session = load_session(request)
+            request.state.session = session
+            request.state.read_only = read_only
+            try:
+                user_id = session.get('_user_id')
+                try:
+                    user = await load_user(user_id) if user_id is not None else None
+                except PoolTimeout:
+                    raise
+                except Exception as e:
+                    print(f"Error loading user: {e}")
+                    user = None
+                response = await handler(request, user, data) if user else None
+            except PoolTimeout:
+                return json_response({"success": False, "message": "The server is busy. Please try again."}, 503)
+            if (response is None):
+                return Delegate(body)
+
+            if (replicas and not read_only and response.status_code < 400):
+                remember_write(response, session)
+            return response
+
+        return wrapper
+    return decorator
+
+
+@json_endpoint('search_appointments', read_only=True)
+async def search_appointments(request, user, data):
+    if (user.role != 'patient' or user.patient_id is None):
+        return None  # 403 / 404
+
+    # Nothing to send if the patient's appointments haven't changed
+    read = endpoints.search_appointments(versions, user.patient_id, data.get('query', '').strip(),
+                                         datetime.now().date())
+    response = not_modified(request, read.etag)
+    if (response):
+        return response
+
+    async with connection(request, read.fresh) as conn, conn.cursor() as cur:
+        try:
+            await cur.execute(read.sql, read.params)
+            return json_result(endpoints.appointments_response(await cur.fetchall()), read.etag)
+
+        except Exception as e:
+            return json_response({"success": False, "message": f"Error: {str(e)}"}, 500)
+
+
+@json_endpoint('patient_appointments_by_date', read_only=True)
+async def patient_appointments_by_date(request, user, data):
+    if (user.role != 'patient'):
+        return None  # 403
+
+    try:
+        date_obj = endpoints.selected_date(data)
+    except ValueError as e:
+        return json_response({"success": False, "message": str(e)}, 400)
+
+    patient_id = user.patient_id
+    if (patient_id is None):
+        return json_response({"success": False, "message": "Patient not found"}, 404)
+
+    # Nothing to send if the patient's appointments haven't changed
+    read = endpoints.appointments_by_date(versions, patient_id, date_obj)
+    response = not_modified(request, read.etag)
+    if (response):
+        return response
+
+    async with connection(request, read.fresh) as conn, conn.cursor() as cur:
+        try:
+            await cur.execute(read.sql, read.params)
+            return json_result(endpoints.appointments_response(await cur.fetchall()), read.etag)
+
+        except Exception as e:
+            return json_response({"success": False, "message": f"Error: {e}"}, 500)
+
+
+@json_endpoint('cancel_appointment')
+async def cancel_appointment(request, user, data):
+    if (user.role != 'patient'):
+        return None  # 403
+
+    appointment_id = data.get('appointment_id')
+    if (not appointment_id):
+        return json_response({"success": False, "message": "Appointment ID is required"}, 400)
+
+    patient_id = user.patient_id
+    if (patient_id is None):
+        return json_response({"success": False, "message": "Patient not found"}, 404)
+
+    async with connection(request) as conn, conn.cursor() as cur:
+        try:
+            # Delete the appointment if it belongs to this patient
+            await cur.execute(*endpoints.cancel_appointment(patient_id, appointment_id))
+            cancelled = await cur.fetchone()
+            await cur.nextset()  # The CALL's own status result
+
+            refused = endpoints.cancel_refused(cancelled)
+            if (refused):
+                await conn.rollback()
+                return json_result(refused)
+
+            await conn.commit()
+            return json_result(endpoints.appointment_cancelled(versions, patient_id, cancelled))
+
+        except Exception as e:
+            await conn.rollback()
+            return json_response({"success": False, "message": f"Error: {e}"}, 500)
+
+
+@json_endpoint('get_appointment_details', expects_body=False, read_only=True)
+async def get_appointment_details(request, user, data):
+    if (user.role != 'doctor'):
+        return None  # 403
+
+    doctor_id = user.doctor_id
+    if (doctor_id is None):
+        return json_response({"success": False, "message": "Doctor not found."}, 404)
+
+    read = endpoints.appointment_details(versions, doctor_id, request.path_params['appointment_id'])
+
+    async with connection(request, read.fresh) as conn, conn.cursor() as cur:
+        try:
+            # Only the doctor's own appointment
+            await cur.execute(read.sql, read.params)
+            appointment = await cur.fetchone()
+
+            refused = endpoints.details_refused(appointment)
+            if (refused):
+                return json_result(refused)
+
+            # Nothing more to send if neither the doctor's appointments nor any patient changed
+            response = not_modified(request, read.etag)
+            if (response):
+                return response
+
+            await cur.execute(*endpoints.appointment_patient(appointment))
+            return json_result(endpoints.details_response(appointment, await cur.fetchone()), read.etag)
+
+        except Exception as e:
+            return json_response({"success": False, "message": f"Error: {str(e)}"}, 500)
+
+
+@json_endpoint('patient_pay_bill', expects_body=False)
+async def patient_pay_bill(request, user, data):
+    if (user.role != 'patient'):
+        return None  # 403
+
+    patient_id = user.patient_id
+    if (patient_id is None):
+        return json_response({"success": False, "message": "Patient not found."}, 404)
+
+    async with connection(request) as conn, conn.cursor() as cur:
+        try:
+            # Mark the bill paid, if it is this patient's and still unpaid
+            sql, bill = endpoints.pay_bill(patient_id, request.path_params['prescription_id'])
+            await cur.execute(sql, bill)
+
+            if (cur.rowcount == 0):
+                # Tell apart an unknown prescription from one already paid
+                await cur.execute(queries.BILL_STATUS_SQL, bill)
+                return json_result(endpoints.bill_refused(await cur.fetchone()))
+
+            await conn.commit()
+            return json_result(endpoints.bill_paid(versions, patient_id))
+
+        except Exception as e:
+            await conn.rollback()
+            return json_response({"success": False, "message": f"Error: {str(e)}"}, 500)
+
+
+app = Starlette(
+    routes=[
+        Route('/patient/search-appointments', search_appointments, methods=['POST']),
+        Route('/patient/appointments-by-date', patient_appointments_by_date, methods=['POST']),
+        Route('/patient/appointments/cancel', cancel_appointment, methods=['POST']),
+        Route('/doctor/appointments/{appointment_id:int}/details', get_appointment_details, methods=['GET']),
+        Route('/patient/treatments/{prescription_id:int}/pay', patient_pay_bill, methods=['POST']),
+        Mount('/', app=flask_asgi)
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,108 @@
+"""
+Sync vs. async serving benchmark for the JSON endpoints.
+
+Runs the same mix of JSON requests, at rising concurrency, against the
+usual sync server and the async one (asgi.py), and reports throughput and
+latency for each. Start both on a generated dataset (`flask generate-data`,
+whose users all log in with "loadtest"):
+
+    gunicorn app:app --bind :8000 --workers 4
+    gunicorn asgi:app --bind :8001 --workers 4 -k uvicorn_worker.UvicornWorker
+
+    python benchmarks/bench_async.py --target sync=http://localhost:8000 \\
+        --target async=http://localhost:8001 --concurrency 16,64,256
+
+Cancel and pay-bill modify data and are only included with --writes.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from load_test import Session, connect, load_accounts, summarize
+
+# The endpoints served by asgi.py (relative frequency)
+PATIENT_ACTIONS = {'appointments_by_date': 4, 'search_appointments': 4}
+DOCTOR_ACTIONS = {'appointment_details': 1}
+WRITE_ACTIONS = {'cancel_appointment': 1, 'pay_bill': 1}
+
+
+def run(sessions, duration):
+    deadline = time.monotonic() + duration
+    samples, errors, lock = [], [0], threading.Lock()
+
+    def worker(session, actions, weights):
+        while (time.monotonic() < deadline):
+            action = session.rng.choices(actions, weights=weights)[0]
+            started = time.perf_counter()
+            status = session.perform(action)
+            elapsed = (time.perf_counter() - started) * 1000
+            if (status is None):
+                continue
+            with lock:
+                samples.append(elapsed)
+                if (status == 'error' or status >= 400):
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(session, list(actions), list(actions.values())))
+               for session, actions in sessions]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(samples, errors[0], time.monotonic() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', action='append', required=True, metavar='NAME=URL',
+                        help='Server to benchmark (repeat for each).')
+    parser.add_argument('--concurrency', default='16,64,256', help='Concurrent clients, per round.')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per round.')
+    parser.add_argument('--doctor-share', type=float, default=0.2, help='Share of doctor clients.')
+    parser.add_argument('--password', default='loadtest')
+    parser.add_argument('--writes', action='store_true', help='Include cancel and pay-bill.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the results as JSON.')
+    args = parser.parse_args()
+
+    targets = [target.split('=', 1) for target in args.target]
+    levels = [int(level) for level in args.concurrency.split(',')]
+    patient_actions = dict(PATIENT_ACTIONS, **(WRITE_ACTIONS if args.writes else {}))
+
+    conn = connect()
+    cur = conn.cursor()
+    doctors = max(1, round(max(levels) * args.doctor_share))
+    accounts = ([(account, 'patient') for account in load_accounts(cur, 'patient', max(levels) - doctors, args.password)]
+                + [(account, 'doctor') for account in load_accounts(cur, 'doctor', doctors, args.password)])
+    conn.close()
+    random.Random(args.seed).shuffle(accounts)
+    if (not accounts):
+        sys.exit('No accounts with appointments found (run `flask generate-data` first).')
+
+    results = {}
+    print(f"{'target':>8} {'clients':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, url in targets:
+        results[name] = {}
+        for level in levels:
+            rng = random.Random(args.seed)
+            sessions = [(Session(url, dict(account), role, random.Random(rng.random())),
+                         patient_actions if role == 'patient' else DOCTOR_ACTIONS)
+                        for account, role in (accounts * level)[:level]]
+            result = run(sessions, args.duration)
+            results[name][level] = result
+            print(f"{name:>8} {level:>8} {result['throughput']:>9.1f} {result['p50_ms'] or 0:>8.1f} "
+                  f"{result['p95_ms'] or 0:>8.1f} {result['p99_ms'] or 0:>8.1f} {result['errors']:>7}")
+
+    if (args.output):
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'duration': args.duration, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Row-decoding micro-benchmark: the per-row timedelta conversion loops the
+routes used to run versus driver-level converters + Appointment records.
+
+    python benchmarks/bench_decode.py --rows 10000 --rows 100000
+
+No database is needed; rows are synthesized in the shape MySQLdb's
+DictCursor returns them.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import date, time as dt_time, timedelta
+
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from models import Appointment, RecordJSONProvider
+
+
+def make_rows(n, time_value):
+    rows = []
+    for i in range(n):
+        rows.append({
+            'appointment_id': i,
+            'patient_id': i % 1000,
+            'doctor_id': i % 15,
+            'room_id': 101 + i % 5,
+            'appointment_date': date(2025, 1, 1) + timedelta(days=i % 365),
+            'appointment_time': time_value(i),
+            'duration_minutes': 30,
+            'description': 'Cardiology consult',
+            'doctor_firstname': 'Emily',
+            'doctor_lastname': 'Clark'
+        })
+    return rows
+
+
+# What patient_appointments_by_date did for every row before
+def legacy_decode(rows):
+    appointments_list = []
+    for appt in rows:
+        if (hasattr(appt, 'keys')):
+            appt_dict = dict(appt)
+        else:
+            appt_dict = appt
+
+        if (appt_dict.get('appointment_time')):
+            appt_time = appt_dict['appointment_time']
+            if (isinstance(appt_time, timedelta)):
+                total_seconds = int(appt_time.total_seconds())
+                hours = total_seconds // 3600
+                minutes = (total_seconds % 3600) // 60
+                seconds = total_seconds % 60
+                appt_dict['appointment_time'] = dt_time(hours, minutes, seconds)
+
+        if (appt_dict.get('appointment_date')):
+            appt_dict['appointment_date'] = appt_dict['appointment_date'].strftime('%Y-%m-%d')
+        if (appt_dict.get('appointment_time')):
+            appt_dict['appointment_time'] = appt_dict['appointment_time'].strftime('%H:%M:%S')
+
+        appointments_list.append(appt_dict)
+    return appointments_list
+
+
+# Best-of-N wall time (ms) and the peak memory (MiB) of one traced run
+def measure(fn, *args, repeat=3):
+    elapsed = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        elapsed.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, min(elapsed), peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, action='append', help='Row counts to test (repeatable).')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    legacy_json = app.json
+    record_json = RecordJSONProvider(app)
+
+    for n in (args.rows or [10000, 100000]):
+        # MySQLdb's default TIME decoding vs the converter registered in db.py
+        legacy_rows = make_rows(n, lambda i: timedelta(hours=8 + i % 9, minutes=i % 4 * 15))
+        record_rows = make_rows(n, lambda i: dt_time(8 + i % 9, i % 4 * 15))
+
+        decoded, legacy_ms, legacy_mb = measure(legacy_decode, legacy_rows)
+        _, legacy_json_ms, _ = measure(legacy_json.dumps, decoded)
+
+        records, record_ms, record_mb = measure(Appointment.from_rows, record_rows)
+        _, record_json_ms, _ = measure(record_json.dumps, records)
+
+        print(f'{n:,} rows')
+        print(f'  legacy loop : decode {legacy_ms:8.1f} ms  json {legacy_json_ms:8.1f} ms  '
+              f'total {legacy_ms + legacy_json_ms:8.1f} ms  peak {legacy_mb:6.1f} MiB')
+        print(f'  records     : decode {record_ms:8.1f} ms  json {record_json_ms:8.1f} ms  '
+              f'total {record_ms + record_json_ms:8.1f} ms  peak {record_mb:6.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Login throughput benchmark.
+
+Against a running server, many clients log in concurrently while one
+more keeps loading a cheap page, to show how a login burst affects the
+rest of the site:
+
+    python benchmarks/bench_login.py --url http://localhost:8000 \\
+        --email patient@example.com --password secret --clients 32
+
+With --local (no server or database needed), compare hashing inline in
+threads with the bounded process pool from hashing.py.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] if samples else 0.0
+
+
+def summarize(name, samples, elapsed, extra=''):
+    if (not samples):
+        print(f'{name:>14}: no requests completed')
+        return
+    print(f'{name:>14}: {len(samples) / elapsed:8.1f} req/s  '
+          f'p50 {percentile(samples, 0.5):7.1f} ms  p95 {percentile(samples, 0.95):7.1f} ms  '
+          f'max {max(samples):7.1f} ms{extra}')
+
+
+# One client logging in over and over (each with its own session)
+def login_loop(args, deadline, samples, statuses):
+    body = urllib.parse.urlencode({'email': args.email, 'password': args.password}).encode()
+    while (time.monotonic() < deadline):
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+        started = time.perf_counter()
+        try:
+            with opener.open(args.url + '/login', data=body, timeout=30) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except OSError:
+            status = 'error'
+        samples.append((time.perf_counter() - started) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+
+
+# A client loading the (cheap) login page, to measure everyone else's latency
+def page_loop(args, deadline, samples):
+    while (time.monotonic() < deadline):
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(args.url + '/login', timeout=30) as response:
+                response.read()
+        except OSError:
+            pass
+        samples.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.05)
+
+
+def run_http(args):
+    deadline = time.monotonic() + args.duration
+    login_samples, page_samples, statuses = [], [], {}
+
+    threads = [threading.Thread(target=login_loop, args=(args, deadline, login_samples, statuses))
+               for _ in range(args.clients)]
+    threads.append(threading.Thread(target=page_loop, args=(args, deadline, page_samples)))
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    codes = ', '.join(f'{code}: {count}' for code, count in sorted(statuses.items(), key=str))
+    summarize('login', login_samples, elapsed, f'  ({codes})')
+    summarize('other page', page_samples, elapsed)
+
+
+def run_local(args):
+    from flask import Flask
+    from hashing import PasswordHasher
+
+    app = Flask(__name__)
+    app.config.update(HASH_POOL_SIZE=args.pool_size, HASH_QUEUE_LIMIT=args.clients)
+    hasher = PasswordHasher(app)
+    pwhash = generate_password_hash('secret', app.config['PASSWORD_HASH_METHOD'])
+    hasher.verify(pwhash, 'secret')  # Start the pool
+
+    for name, verify in (('inline', lambda: check_password_hash(pwhash, 'secret')),
+                         ('process pool', lambda: hasher.verify(pwhash, 'secret'))):
+        samples = []
+
+        def timed():
+            started = time.perf_counter()
+            verify()
+            samples.append((time.perf_counter() - started) * 1000)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=args.clients) as executor:
+            for _ in range(args.logins):
+                executor.submit(timed)
+        elapsed = time.monotonic() - started
+        summarize(name, samples, elapsed, f'  (mean {statistics.fmean(samples):.1f} ms)')
+
+    hasher.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--email')
+    parser.add_argument('--password')
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent logins.')
+    parser.add_argument('--duration', type=float, default=15, help='Seconds to run (HTTP mode).')
+    parser.add_argument('--local', action='store_true', help='Benchmark hashing in-process only.')
+    parser.add_argument('--logins', type=int, default=200, help='Password checks (local mode).')
+    parser.add_argument('--pool-size', type=int, default=2, help='Hashing processes (local mode).')
+    args = parser.parse_args()
+
+    if (args.local):
+        run_local(args)
+    elif (not args.email or not args.password):
+        parser.error('--email and --password are required (or use --local)')
+    else:
+        run_http(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Appointment search benchmark: the original six-way LIKE predicate versus
+the search_appointment procedure from migration 002.
+
+Run against a database with a large appointment table, e.g.
+
+    python benchmarks/bench_search.py --patients 50 --days 365 --query card
+
+Both variants must return the same appointments; any difference is reported.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import MySQLdb
+from MySQLdb import cursors
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import config
+
+# The WHERE clause search_appointment used before migration 002
+LEGACY_SEARCH = """
+    SELECT a.appointment_id
+    FROM appointment a
+    INNER JOIN doctor d ON a.doctor_id = d.doctor_id
+    WHERE a.patient_id = %(patient_id)s
+        AND a.appointment_date >= %(start)s
+        AND a.appointment_date <= %(end)s
+        AND (
+            CONCAT(d.doctor_firstname, ' ', d.doctor_lastname) COLLATE utf8mb4_unicode_ci LIKE CONCAT('%%', %(query)s, '%%') COLLATE utf8mb4_unicode_ci
+            OR CAST(a.room_id AS CHAR) COLLATE utf8mb4_unicode_ci LIKE CONCAT('%%', %(query)s, '%%') COLLATE utf8mb4_unicode_ci
+            OR CAST(a.appointment_date AS CHAR) COLLATE utf8mb4_unicode_ci LIKE CONCAT('%%', %(query)s, '%%') COLLATE utf8mb4_unicode_ci
+            OR CAST(a.appointment_time AS CHAR) COLLATE utf8mb4_unicode_ci LIKE CONCAT('%%', %(query)s, '%%') COLLATE utf8mb4_unicode_ci
+            OR CAST(a.duration_minutes AS CHAR) COLLATE utf8mb4_unicode_ci LIKE CONCAT('%%', %(query)s, '%%') COLLATE utf8mb4_unicode_ci
+            OR a.description COLLATE utf8mb4_unicode_ci LIKE CONCAT('%%', %(query)s, '%%') COLLATE utf8mb4_unicode_ci
+        )
+    ORDER BY a.appointment_date ASC, a.appointment_time ASC
+"""
+
+
+def connect():
+    return MySQLdb.connect(host=config.MYSQL_HOST, port=config.MYSQL_PORT,
+                           user=config.MYSQL_USER, passwd=config.MYSQL_PASSWORD,
+                           db=config.MYSQL_DB, charset='utf8mb4',
+                           cursorclass=cursors.DictCursor)
+
+
+def timed(fn, iterations):
+    samples = []
+    result = None
+    for _ in range(iterations):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, samples
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'mean': statistics.fmean(samples),
+        'p50': samples[len(samples) // 2],
+        'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        'max': samples[-1]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--query', default='a')
+    parser.add_argument('--days', type=int, default=7, help='Width of the search window.')
+    parser.add_argument('--patients', type=int, default=20, help='Busiest patients to search for.')
+    parser.add_argument('--iterations', type=int, default=5)
+    args = parser.parse_args()
+
+    conn = connect()
+    cur = conn.cursor()
+
+    start = datetime.now().date()
+    end = start + timedelta(days=args.days)
+
+    cur.execute("""SELECT COUNT(*) AS n FROM appointment""")
+    total_rows = cur.fetchone()['n']
+    cur.execute("""SELECT patient_id, COUNT(*) AS n
+                   FROM appointment
+                   WHERE appointment_date BETWEEN %s AND %s
+                   GROUP BY patient_id
+                   ORDER BY n DESC
+                   LIMIT %s""", (start, end, args.patients))
+    patients = cur.fetchall()
+    if (not patients):
+        print('No appointments in the search window; generate a dataset first.')
+        return 1
+
+    legacy_samples, new_samples = [], []
+    mismatches = 0
+    for patient in patients:
+        params = {'patient_id': patient['patient_id'], 'start': start, 'end': end, 'query': args.query}
+
+        def legacy():
+            cur.execute(LEGACY_SEARCH, params)
+            return [row['appointment_id'] for row in cur.fetchall()]
+
+        def procedure():
+            cur.execute("""CALL search_appointment(%s, %s, %s, %s)""",
+                        (params['patient_id'], start, end, args.query))
+            rows = [row['appointment_id'] for row in cur.fetchall()]
+            while (cur.nextset()):
+                pass
+            return rows
+
+        legacy_rows, samples = timed(legacy, args.iterations)
+        legacy_samples.extend(samples)
+        new_rows, samples = timed(procedure, args.iterations)
+        new_samples.extend(samples)
+
+        if (legacy_rows != new_rows):
+            mismatches += 1
+            print(f"patient {patient['patient_id']}: results differ "
+                  f"({len(legacy_rows)} legacy vs {len(new_rows)} indexed)")
+
+    busiest = patients[0]['n']
+    print(f'appointment rows: {total_rows:,}; busiest patient has {busiest:,} appointments in the window')
+    for name, samples in (('legacy LIKE', legacy_samples), ('search_appointment', new_samples)):
+        stats = summarize(samples)
+        print(f"{name:>20}: mean {stats['mean']:.2f} ms  p50 {stats['p50']:.2f} ms  "
+              f"p95 {stats['p95']:.2f} ms  max {stats['max']:.2f} ms")
+
+    cur.close()
+    conn.close()
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Concurrent booking stress test.
+
+Logs in a number of patients and, round after round, has all of them book
+the same doctor and room at the same moment (every other client asks for
+a slot starting --stagger minutes later, so the requests overlap without
+being identical). Exactly one booking per round may succeed; the others
+must be refused with a 409. Afterwards the day is checked in the database
+for overlapping appointments of the doctor or the room.
+
+Run against a server on a generated dataset (`flask generate-data`, whose
+users all log in with "loadtest"):
+
+    python benchmarks/booking_stress.py --url http://localhost:8000 --clients 64 --rounds 10
+
+The bookings are made on a day far enough ahead to be free (--date) and
+cancelled afterwards unless --keep is given.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from load_test import Session, connect, load_accounts, percentile
+
+# Appointments of the doctor or room that overlap another on the same day
+OVERLAPS_SQL = """SELECT a.appointment_id AS first, b.appointment_id AS second
+                  FROM appointment a
+                  JOIN appointment b ON b.appointment_date = a.appointment_date
+                      AND b.appointment_id > a.appointment_id
+                      AND (b.doctor_id = a.doctor_id OR b.room_id = a.room_id)
+                      AND b.appointment_time < ADDTIME(a.appointment_time, SEC_TO_TIME(a.duration_minutes * 60))
+                      AND a.appointment_time < ADDTIME(b.appointment_time, SEC_TO_TIME(b.duration_minutes * 60))
+                  WHERE a.appointment_date = %s AND (a.doctor_id = %s OR a.room_id = %s)"""
+
+
+def run_round(sessions, payloads):
+    barrier = threading.Barrier(len(sessions))
+    statuses, latencies, lock = Counter(), [], threading.Lock()
+
+    def client(session, payload):
+        barrier.wait()
+        started = time.perf_counter()
+        status = session.post_json('/patient/appointments/book', payload)
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            statuses[status] += 1
+            latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(session, payload))
+               for session, payload in zip(sessions, payloads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent bookings per round.')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--date', type=date.fromisoformat, default=date.today() + timedelta(days=365),
+                        help='Day to book (default: a year from today).')
+    parser.add_argument('--doctor-id', type=int, help='Default: the first doctor.')
+    parser.add_argument('--room-id', type=int, help='Default: the first room.')
+    parser.add_argument('--duration', type=int, default=30, help='Minutes per booking.')
+    parser.add_argument('--stagger', type=int, default=15, help='Minutes between the two competing start times.')
+    parser.add_argument('--password', default='loadtest')
+    parser.add_argument('--keep', action='store_true', help="Don't cancel the bookings afterwards.")
+    args = parser.parse_args()
+    if (args.stagger >= args.duration):
+        parser.error('--stagger must be shorter than --duration (the two start times must overlap)')
+
+    conn = connect()
+    cur = conn.cursor()
+    if (args.doctor_id is None):
+        cur.execute("""SELECT MIN(doctor_id) AS id FROM doctor""")
+        args.doctor_id = cur.fetchone()['id']
+    if (args.room_id is None):
+        cur.execute("""SELECT MIN(room_id) AS id FROM room""")
+        args.room_id = cur.fetchone()['id']
+    accounts = load_accounts(cur, 'patient', args.clients, args.password)
+    if (len(accounts) < 2):
+        sys.exit('Not enough patient accounts (run `flask generate-data` first).')
+
+    sessions = [Session(args.url, dict(account), 'patient', None) for account in accounts]
+    print(f'{len(sessions)} clients booking doctor {args.doctor_id} / room {args.room_id} on {args.date}')
+    print(f"{'round':>5} {'slot':>6} {'booked':>7} {'refused':>8} {'other':>6} {'p50 ms':>8} {'max ms':>8}")
+
+    failures = 0
+    for n in range(args.rounds):
+        start = 8 * 60 + n * (args.duration + args.stagger) * 2  # Rounds never overlap
+        payloads = []
+        for i in range(len(sessions)):
+            minute = start + (args.stagger if i % 2 else 0)
+            payloads.append({
+                'doctor_id': args.doctor_id,
+                'room_id': args.room_id,
+                'date': args.date.isoformat(),
+                'time': '%02d:%02d' % divmod(minute, 60),
+                'duration_minutes': args.duration,
+                'description': f'Booking stress test, round {n + 1}'
+            })
+
+        statuses, latencies = run_round(sessions, payloads)
+        booked, refused = statuses.pop(201, 0), statuses.pop(409, 0)
+        other = sum(statuses.values())
+        failures += (booked != 1) + bool(other)
+        print(f"{n + 1:>5} {'%02d:%02d' % divmod(start, 60):>6} {booked:>7} {refused:>8} {other:>6} "
+              f"{percentile(latencies, 0.5):>8.1f} {latencies[-1]:>8.1f}"
+              + (f"  unexpected: {dict(statuses)}" if other else ''))
+
+    conn.commit()  # See the bookings made since this connection's snapshot
+    cur.execute(OVERLAPS_SQL, (args.date, args.doctor_id, args.room_id))
+    overlaps = cur.fetchall()
+    for row in overlaps:
+        print(f"Double booking: appointments {row['first']} and {row['second']} overlap")
+
+    # Cancel through the app, so its cached doctor/room days are invalidated
+    if (not args.keep):
+        by_patient = {session.account['patient_id']: session for session in sessions}
+        cur.execute(f"""SELECT appointment_id, patient_id FROM appointment
+                        WHERE appointment_date = %s AND doctor_id = %s
+                            AND patient_id IN ({', '.join(['%s'] * len(by_patient))})
+                     """, (args.date, args.doctor_id, *by_patient))
+        for row in cur.fetchall():
+            by_patient[row['patient_id']].post_json('/patient/appointments/cancel',
+                                                    {'appointment_id': row['appointment_id']})
+    conn.close()
+
+    if (failures or overlaps):
+        sys.exit(f'FAILED: {failures} bad rounds, {len(overlaps)} overlapping pairs')
+    print('ok: one booking per round, no overlaps')
+
+
+if __name__ == '__main__':
+    main()
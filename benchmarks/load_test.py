@@ -0,0 +1,368 @@
+"""
+Route-level load test.
+
+Drives the app's routes with a mix of concurrent patient and doctor
+sessions and reports p50/p95/p99 latency, throughput and MySQL queries per
+request for every route. Intended for a local server on a generated
+dataset (`flask generate-data`), whose users all log in with "loadtest":
+
+    python benchmarks/load_test.py --url http://localhost:8000 --users 32 \\
+        --mix patient=8,doctor=2 --duration 60 --output results/main.json
+
+    python benchmarks/load_test.py ... --output results/branch.json --compare results/main.json
+
+Queries per request are measured in a serial profiling pass, one route at
+a time, from the server's `Questions` counter (so nothing else should be
+using the database meanwhile). Cancel and pay-bill modify data; leave them
+out with --no-writes.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, datetime, timedelta
+from http.cookiejar import CookieJar
+
+import MySQLdb
+from MySQLdb import cursors
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import config
+
+# Relative frequency of each action within a session
+PATIENT_ACTIONS = {
+    'patient_home': 20,
+    'patient_appointments': 10,
+    'appointments_by_date': 15,
+    'appointments_by_range': 10,
+    'search_appointments': 15,
+    'patient_treatments': 10,
+    'pay_bill': 2,
+    'cancel_appointment': 2,
+    'login': 2
+}
+DOCTOR_ACTIONS = {
+    'doctor_home': 20,
+    'doctor_appointments': 30,
+    'appointment_details': 40,
+    'login': 2
+}
+WRITE_ACTIONS = ('pay_bill', 'cancel_appointment')
+SEARCH_TERMS = ['card', 'follow', 'review', '10:', 'a', 'Smith', 'vacc']
+
+
+def connect():
+    return MySQLdb.connect(host=config.MYSQL_HOST, port=config.MYSQL_PORT,
+                           user=config.MYSQL_USER, passwd=config.MYSQL_PASSWORD,
+                           db=config.MYSQL_DB, charset='utf8mb4',
+                           cursorclass=cursors.DictCursor)
+
+
+def questions(cur):
+    cur.execute("""SHOW GLOBAL STATUS LIKE 'Questions'""")
+    return int(cur.fetchone()['Value'])
+
+
+# Everything a session needs to know about its account
+def load_accounts(cur, role, limit, password):
+    if (role == 'patient'):
+        cur.execute("""SELECT u.email, p.patient_id
+                       FROM User u
+                       JOIN patient p ON p.user_id = u.user_id
+                       WHERE u.role = 'patient'
+                       ORDER BY u.user_id
+                       LIMIT %s""", (limit,))
+        accounts = cur.fetchall()
+        for account in accounts:
+            cur.execute("""SELECT appointment_date FROM appointment
+                           WHERE patient_id = %s
+                           ORDER BY appointment_date DESC
+                           LIMIT 20""", (account['patient_id'],))
+            account['dates'] = [row['appointment_date'] for row in cur.fetchall()]
+            cur.execute("""SELECT appointment_id FROM appointment
+                           WHERE patient_id = %s AND appointment_date >= CURDATE()
+                           LIMIT 20""", (account['patient_id'],))
+            account['cancellable'] = [row['appointment_id'] for row in cur.fetchall()]
+            cur.execute("""SELECT prescription_id FROM prescription
+                           WHERE patient_id = %s AND NOT paid
+                           LIMIT 20""", (account['patient_id'],))
+            account['unpaid'] = [row['prescription_id'] for row in cur.fetchall()]
+    else:
+        cur.execute("""SELECT u.email, d.doctor_id
+                       FROM User u
+                       JOIN doctor d ON d.user_id = u.user_id
+                       WHERE u.role = 'doctor'
+                       ORDER BY u.user_id
+                       LIMIT %s""", (limit,))
+        accounts = cur.fetchall()
+        for account in accounts:
+            cur.execute("""SELECT appointment_id, appointment_date FROM appointment
+                           WHERE doctor_id = %s
+                           ORDER BY appointment_date DESC
+                           LIMIT 50""", (account['doctor_id'],))
+            rows = cur.fetchall()
+            account['appointments'] = [row['appointment_id'] for row in rows]
+            account['dates'] = sorted({row['appointment_date'] for row in rows})
+    for account in accounts:
+        account['password'] = password
+    return [account for account in accounts if account.get('dates')]
+
+
+# One logged-in browser session
+class Session:
+    def __init__(self, base_url, account, role, rng):
+        self.base_url = base_url
+        self.account = account
+        self.role = role
+        self.rng = rng
+        self.login()
+
+    def login(self):
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+        body = urllib.parse.urlencode({'email': self.account['email'], 'password': self.account['password']})
+        return self.request('/login', body.encode(), content_type='application/x-www-form-urlencoded')
+
+    def request(self, path, data=None, content_type='application/json'):
+        request = urllib.request.Request(self.base_url + path, data=data)
+        if (data is not None):
+            request.add_header('Content-Type', content_type)
+        try:
+            with self.opener.open(request, timeout=30) as response:
+                response.read()
+                # Redirected to the login page: the session was lost
+                if (path != '/login' and urllib.parse.urlparse(response.geturl()).path == '/login'):
+                    return 401
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except OSError:
+            return 'error'
+
+    def post_json(self, path, payload):
+        return self.request(path, json.dumps(payload).encode())
+
+    def iso_date(self):
+        return self.rng.choice(self.account['dates']).isoformat()
+
+    # Perform one action; returns the HTTP status
+    def perform(self, action):
+        rng = self.rng
+        if (action == 'login'):
+            return self.login()
+        if (action == 'patient_home'):
+            return self.request('/patient/home')
+        if (action == 'patient_appointments'):
+            return self.request('/patient/appointments')
+        if (action == 'appointments_by_date'):
+            return self.post_json('/patient/appointments-by-date', {'date': self.iso_date()})
+        if (action == 'appointments_by_range'):
+            day = date.fromisoformat(self.iso_date()).replace(day=1)
+            end = (day + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+            return self.post_json('/patient/appointments-by-range', {'start': day.isoformat(), 'end': end.isoformat()})
+        if (action == 'search_appointments'):
+            return self.post_json('/patient/search-appointments', {'query': rng.choice(SEARCH_TERMS)})
+        if (action == 'patient_treatments'):
+            return self.request('/patient/treatments')
+        if (action == 'pay_bill'):
+            if (not self.account['unpaid']):
+                return None
+            return self.request(f"/patient/treatments/{self.account['unpaid'].pop()}/pay", b'')
+        if (action == 'cancel_appointment'):
+            if (not self.account['cancellable']):
+                return None
+            return self.post_json('/patient/appointments/cancel',
+                                  {'appointment_id': self.account['cancellable'].pop()})
+        if (action == 'doctor_home'):
+            return self.request('/doctor/home')
+        if (action == 'doctor_appointments'):
+            return self.request('/doctor/appointments?date=' + self.iso_date())
+        if (action == 'appointment_details'):
+            return self.request(f"/doctor/appointments/{rng.choice(self.account['appointments'])}/details")
+        raise ValueError(f'Unknown action {action}')
+
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p))] if samples else None
+
+
+def summarize(samples, errors, elapsed):
+    samples = sorted(samples)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'throughput': round(len(samples) / elapsed, 2),
+        'mean_ms': round(sum(samples) / len(samples), 2) if samples else None,
+        'p50_ms': round(percentile(samples, 0.50), 2) if samples else None,
+        'p95_ms': round(percentile(samples, 0.95), 2) if samples else None,
+        'p99_ms': round(percentile(samples, 0.99), 2) if samples else None,
+        'max_ms': round(samples[-1], 2) if samples else None
+    }
+
+
+# Serial pass: MySQL statements issued per request, for every action
+def profile_queries(sessions, actions, cur, repeat):
+    result = {}
+    for action in actions:
+        session = next((s for s in sessions if action in (PATIENT_ACTIONS if s.role == 'patient' else DOCTOR_ACTIONS)), None)
+        if (session is None):
+            continue
+        before = questions(cur)
+        done = 0
+        for _ in range(repeat):
+            if (session.perform(action) is not None):
+                done += 1
+        # Discount the SHOW STATUS statement itself
+        after = questions(cur) - 1
+        if (done):
+            result[action] = round((after - before) / done, 2)
+    return result
+
+
+def run_load(sessions, args, weights_by_role):
+    deadline = time.monotonic() + args.duration
+    samples, errors, lock = {}, {}, threading.Lock()
+
+    def worker(session):
+        actions, weights = weights_by_role[session.role]
+        while (time.monotonic() < deadline):
+            action = session.rng.choices(actions, weights=weights)[0]
+            started = time.perf_counter()
+            status = session.perform(action)
+            elapsed = (time.perf_counter() - started) * 1000
+            if (status is None):
+                continue
+            with lock:
+                samples.setdefault(action, []).append(elapsed)
+                if (status == 'error' or status >= 400):
+                    errors[action] = errors.get(action, 0) + 1
+            if (args.think_ms):
+                time.sleep(session.rng.uniform(0, 2 * args.think_ms) / 1000)
+
+    threads = [threading.Thread(target=worker, args=(session,)) for session in sessions]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, errors, time.monotonic() - started
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        role, _, weight = part.partition('=')
+        mix[role.strip()] = float(weight or 1)
+    return mix
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nvs {baseline_path} ({baseline['meta'].get('commit', '?')[:10]})")
+    for route, stats in sorted(results['routes'].items()):
+        old = baseline['routes'].get(route)
+        if (not old or not old.get('p95_ms') or not stats.get('p95_ms')):
+            continue
+        change = (stats['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100
+        queries = ''
+        if (stats.get('queries_per_request') is not None and old.get('queries_per_request') is not None):
+            queries = f"  queries {old['queries_per_request']:g} -> {stats['queries_per_request']:g}"
+        print(f"{route:>24}: p95 {old['p95_ms']:8.1f} -> {stats['p95_ms']:8.1f} ms ({change:+.0f}%){queries}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--users', type=int, default=16, help='Concurrent sessions.')
+    parser.add_argument('--mix', default='patient=8,doctor=2', help='Share of patient/doctor sessions.')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of load.')
+    parser.add_argument('--think-ms', type=float, default=0, help='Mean pause between actions.')
+    parser.add_argument('--password', default='loadtest', help='Password of the test accounts.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--profile-repeat', type=int, default=20, help='Requests per route when counting queries.')
+    parser.add_argument('--no-writes', action='store_true', help='Skip cancel and pay-bill.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', help='Previous results file to compare with.')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    weights_by_role = {}
+    for role, table in (('patient', PATIENT_ACTIONS), ('doctor', DOCTOR_ACTIONS)):
+        actions = [action for action in table if not (args.no_writes and action in WRITE_ACTIONS)]
+        weights_by_role[role] = (actions, [table[action] for action in actions])
+
+    conn = connect()
+    cur = conn.cursor()
+    total_weight = sum(mix.values())
+    sessions = []
+    for role in ('patient', 'doctor'):
+        wanted = round(args.users * mix.get(role, 0) / total_weight)
+        if (not wanted):
+            continue
+        accounts = load_accounts(cur, role, wanted, args.password)
+        if (len(accounts) < wanted):
+            print(f'Only {len(accounts)} {role} accounts with appointments; run `flask generate-data` first.')
+        for n, account in enumerate(accounts):
+            sessions.append(Session(args.url.rstrip('/'), account, role, random.Random(f'{args.seed}:{role}:{n}')))
+    conn.commit()  # Don't keep a snapshot open during the run
+    if (not sessions):
+        return 1
+
+    actions = [action for role in ('patient', 'doctor') for action in weights_by_role[role][0]]
+    queries = profile_queries(sessions, dict.fromkeys(actions), cur, args.profile_repeat)
+
+    print(f'{len(sessions)} sessions for {args.duration:g}s against {args.url}')
+    samples, errors, elapsed = run_load(sessions, args, weights_by_role)
+    cur.close()
+    conn.close()
+
+    routes = {}
+    for action, action_samples in sorted(samples.items()):
+        routes[action] = summarize(action_samples, errors.get(action, 0), elapsed)
+        routes[action]['queries_per_request'] = queries.get(action)
+    all_samples = [sample for action_samples in samples.values() for sample in action_samples]
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    results = {
+        'meta': {
+            'commit': commit,
+            'url': args.url,
+            'users': len(sessions),
+            'mix': mix,
+            'duration': args.duration,
+            'seed': args.seed,
+            'writes': not args.no_writes,
+            'started_at': datetime.now().isoformat(timespec='seconds')
+        },
+        'total': summarize(all_samples, sum(errors.values()), elapsed),
+        'routes': routes
+    }
+
+    print(f"{'route':>24}  {'req/s':>8}  {'p50':>8}  {'p95':>8}  {'p99':>8}  {'errors':>6}  queries")
+    for route, stats in list(routes.items()) + [('TOTAL', results['total'])]:
+        if (not stats['requests']):
+            continue
+        print(f"{route:>24}  {stats['throughput']:8.1f}  {stats['p50_ms']:8.1f}  {stats['p95_ms']:8.1f}  "
+              f"{stats['p99_ms']:8.1f}  {stats['errors']:6}  {stats.get('queries_per_request', '')}")
+
+    if (args.output):
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if (args.compare):
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+
+from queries import DOCTOR_DAY_BOOKINGS_SQL, ROOM_DAY_BOOKINGS_SQL
+
+# Minutes in a day (appointments may not run past midnight)
+DAY_MINUTES = 24 * 60
+
+# MySQL errors after which a booking is simply retried
+RETRYABLE_ERRORS = (1205, 1213)  # Lock wait timeout, deadlock
+
+# The appointments of a doctor's or a room's day
+DAY_BOOKINGS_SQL = {'doctor': DOCTOR_DAY_BOOKINGS_SQL, 'room': ROOM_DAY_BOOKINGS_SQL}
+
+
+# A booking overlaps another appointment of the doctor or the room
+class BookingConflict(Exception):
+    def __init__(self, message, next_available=None):
+        super().__init__(message)
+        self.next_available = next_available  # Minutes since midnight, or None
+
+
+def minutes(value):
+    return value.hour * 60 + value.minute
+
+
+# The appointments of one doctor or room on one day, as [start, end)
+# intervals in minutes since midnight, sorted by start. reach[i] is the
+# interval ending last among the first i + 1, so an overlap check is one
+# binary search (even when stored intervals overlap each other).
+class DayIndex:
+    __slots__ = ('starts', 'ends', 'ids', 'reach', 'version', 'loaded_at')
+
+    def __init__(self, intervals=(), version=None):
+        intervals = sorted(intervals)
+        self.starts = [start for start, _, _ in intervals]
+        self.ends = [end for _, end, _ in intervals]
+        self.ids = [appointment_id for _, _, appointment_id in intervals]
+        self.reach = []
+        self._update_reach(0)
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def from_rows(cls, rows, version=None):
+        intervals = []
+        for row in rows:
+            start = minutes(row['appointment_time'])
+            intervals.append((start, start + row['duration_minutes'], row['appointment_id']))
+        return cls(intervals, version)
+
+    def _update_reach(self, i):
+        del self.reach[i:]
+        best = self.reach[i - 1] if i else (-1, None)
+        for end, appointment_id in zip(self.ends[i:], self.ids[i:]):
+            if (end > best[0]):
+                best = (end, appointment_id)
+            self.reach.append(best)
+
+    # The (end, appointment_id) of an interval overlapping [start, end),
+    # or None
+    def conflict(self, start, end):
+        i = bisect.bisect_left(self.starts, end)  # Intervals starting before `end`
+        if (i and self.reach[i - 1][0] > start):
+            return self.reach[i - 1]
+        return None
+
+
+# The earliest start at or after `start` where `duration` minutes are free
+# in every index (or None if there is none before midnight)
+def next_free(indexes, start, duration):
+    while (start + duration <= DAY_MINUTES):
+        blocking = [index.conflict(start, start + duration) for index in indexes]
+        blocking = [found for found in blocking if found]
+        if (not blocking):
+            return start
+        start = max(end for end, _ in blocking)
+    return None
+
+
+# Flask extension booking appointments without double-booking a doctor or
+# a room.
+#
+# Each process keeps a bounded cache of doctor-day and room-day DayIndexes,
+# invalidated through the VersionStore (every write path bumps the doctor's
+# and room's versions) and after BOOKING_INDEX_TTL seconds (writes from
+# elsewhere). It turns away requests for a taken slot without touching
+# the locks. The commit path doesn't trust it: it locks the doctor-day and
+# room-day rows of booking_lock, reloads both days from the database and
+# checks again before inserting, so concurrent bookings are serialized.
+class BookingEngine:
+    def __init__(self, app=None, versions=None):
+        self.versions = versions
+        self._days = OrderedDict()  # (kind, resource_id, date) -> DayIndex
+        self._lock = threading.Lock()
+        if (app is not None):
+            self.init_app(app, versions)
+
+    def init_app(self, app, versions):
+        app.config.setdefault('BOOKING_INDEX_TTL', 60)         # seconds
+        app.config.setdefault('BOOKING_INDEX_MAX_DAYS', 4096)  # cached doctor/room days per process
+        app.config.setdefault('BOOKING_MAX_MINUTES', 480)      # longest appointment
+        app.config.setdefault('BOOKING_RETRIES', 3)
+
+        self.app = app
+        self.versions = versions
+        app.extensions['booking'] = self
+
+    # The cached index of a doctor's or room's day (loaded if missing or
+    # out of date)
+    def day(self, cur, kind, resource_id, day):
+        key = (kind, resource_id, day)
+        version = self.versions.version(kind, resource_id)
+        with self._lock:
+            index = self._days.get(key)
+            if (index is not None and index.version == version
+                    and time.monotonic() - index.loaded_at < self.app.config['BOOKING_INDEX_TTL']):
+                self._days.move_to_end(key)
+                return index
+
+        index = self._load(cur, kind, resource_id, day, version)
+        self._remember(key, index)
+        return index
+
+    @staticmethod
+    def _load(cur, kind, resource_id, day, version=None):
+        cur.execute(DAY_BOOKINGS_SQL[kind], {f'{kind}_id': resource_id, 'date': day})
+        return DayIndex.from_rows(cur.fetchall(), version)
+
+    def _remember(self, key, index):
+        with self._lock:
+            self._days[key] = index
+            self._days.move_to_end(key)
+            while (len(self._days) > self.app.config['BOOKING_INDEX_MAX_DAYS']):
+                self._days.popitem(last=False)
+
+    @staticmethod
+    def _check(doctor_day, room_day, start, end):
+        if (doctor_day.conflict(start, end)):
+            raise BookingConflict('The doctor already has an appointment at that time.',
+                                  next_free((doctor_day, room_day), start, end - start))
+        if (room_day.conflict(start, end)):
+            raise BookingConflict('The room is already booked at that time.',
+                                  next_free((doctor_day, room_day), start, end - start))
+
+    # Book an appointment and return its id. Raises BookingConflict if the
+    # doctor or the room is taken; commits on success.
+    def book(self, conn, patient_id, doctor_id, room_id, day, start_time, duration, description=None):
+        start = minutes(start_time)
+        end = start + duration
+
+        # Turn away taken slots from the cached indexes (without locking)
+        cur = conn.cursor()
+        try:
+            self._check(self.day(cur, 'doctor', doctor_id, day), self.day(cur, 'room', room_id, day),
+                        start, end)
+        finally:
+            cur.close()
+
+        for attempt in range(self.app.config['BOOKING_RETRIES']):
+            try:
+                return self._book_locked(conn, patient_id, doctor_id, room_id, day, start_time,
+                                         duration, description)
+            except BookingConflict:
+                raise
+            except Exception as e:
+                conn.rollback()
+                if (getattr(e, 'args', (None,))[0] not in RETRYABLE_ERRORS
+                        or attempt + 1 == self.app.config['BOOKING_RETRIES']):
+                    raise
+
+    def _book_locked(self, conn, patient_id, doctor_id, room_id, day, start_time, duration, description):
+        start = minutes(start_time)
+        end = start + duration
+        versions = (self.versions.version('doctor', doctor_id), self.versions.version('room', room_id))
+
+        # A new transaction, so its reads see every booking committed
+        # before the locks were granted
+        conn.rollback()
+        cur = conn.cursor()
+        try:
+            # Lock (creating them if needed) the doctor-day and room-day
+            # rows, always in this order. An upsert takes the same exclusive
+            # lock as SELECT ... FOR UPDATE, but works for a missing row.
+            cur.execute("""INSERT INTO booking_lock (resource, resource_id, lock_date)
+                           VALUES ('doctor', %s, %s), ('room', %s, %s)
+                           ON DUPLICATE KEY UPDATE lock_date = VALUES(lock_date)
+                        """, (doctor_id, day, room_id, day))
+
+            doctor_day = self._load(cur, 'doctor', doctor_id, day, versions[0])
+            room_day = self._load(cur, 'room', room_id, day, versions[1])
+            self._remember(('doctor', doctor_id, day), doctor_day)
+            self._remember(('room', room_id, day), room_day)
+            try:
+                self._check(doctor_day, room_day, start, end)
+            except BookingConflict:
+                conn.rollback()
+                raise
+
+            cur.execute("""INSERT INTO appointment (patient_id, doctor_id, room_id, appointment_date,
+                                                    appointment_time, duration_minutes, description)
+                           VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        """, (patient_id, doctor_id, room_id, day, start_time, duration, description))
+            appointment_id = cur.lastrowid
+            conn.commit()
+        finally:
+            cur.close()
+
+        self.versions.bump('patient', patient_id)
+        self.versions.bump('doctor', doctor_id)
+        self.versions.bump('room', room_id)
+        return appointment_id
@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# A bounded, thread-safe LRU cache whose entries also expire after a TTL
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Return the cached value for a key (or None on a miss / expired entry)
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if (entry is None):
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if (expires_at <= now):
+                # Drop the stale entry
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            # Mark the entry as most recently used
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    # Store a value, evicting the least recently used entries when full
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while (len(self._data) > self.maxsize):
+                self._data.popitem(last=False)
+
+    # Remove a single key (e.g. after the underlying row changes)
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    # Remove every entry
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    # Hit/miss counters and current size
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,533 @@
+import os
+import re
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from werkzeug.security import generate_password_hash
+
+import queries
+from db import MySQLPool
+from generator import DatasetGenerator, insert_batches, load_data
+from importer import Importer, read_rows
+from slowlog import CALL, call_arguments, procedure_statements, read_entries, summarize
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'migrations')
+
+
+# Register the app's CLI commands (`flask <command>`)
+def register_commands(app):
+    app.cli.add_command(migrate_command)
+    app.cli.add_command(explain_check_command)
+    app.cli.add_command(reference_refresh_command)
+    app.cli.add_command(import_users_command)
+    app.cli.add_command(generate_data_command)
+    app.cli.add_command(slow_queries_command)
+    app.cli.add_command(replica_status_command)
+    app.cli.add_command(summary_check_command)
+
+
+# Open a connection with a (possibly different) database account
+def admin_connection(user=None, password=None, **options):
+    config = dict(current_app.config)
+    if (user):
+        config['MYSQL_USER'] = user
+        config['MYSQL_PASSWORD'] = password
+    return MySQLPool.connect(config, **options)
+
+
+# Split a .sql file into statements (honouring `DELIMITER` like the mysql client)
+def split_sql(text):
+    statements = []
+    delimiter = ';'
+    buffer = []
+    in_comment = False
+
+    for line in text.splitlines():
+        stripped = line.strip()
+
+        # Skip comments between statements
+        if (not buffer):
+            if (in_comment):
+                in_comment = '*/' not in stripped
+                continue
+            if (stripped.startswith('/*')):
+                in_comment = '*/' not in stripped
+                continue
+            if (not stripped or stripped.startswith('--')):
+                continue
+
+        match = re.match(r'(?i)^DELIMITER\s+(\S+)$', stripped)
+        if (match):
+            delimiter = match.group(1)
+            continue
+
+        buffer.append(line)
+        if (stripped.endswith(delimiter)):
+            statement = '\n'.join(buffer).rstrip()[:-len(delimiter)].strip()
+            if (statement):
+                statements.append(statement)
+            buffer = []
+
+    if (''.join(buffer).strip()):
+        statements.append('\n'.join(buffer).strip())
+    return statements
+
+
+# Apply pending migrations from database/migrations (in file-name order)
+@click.command('migrate')
+@click.option('--user', envvar='MYSQL_ADMIN_USER', help='Account with DDL privileges.')
+@click.option('--password', envvar='MYSQL_ADMIN_PASSWORD', default='')
+@click.option('--dry-run', is_flag=True, help='List the pending migrations only.')
+@with_appcontext
+def migrate_command(user, password, dry_run):
+    conn = admin_connection(user, password)
+    cur = conn.cursor()
+    try:
+        cur.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                           version VARCHAR(100) PRIMARY KEY,
+                           applied_at DATETIME NOT NULL
+                       )""")
+        cur.execute("""SELECT version FROM schema_migrations""")
+        applied = {row['version'] for row in cur.fetchall()}
+
+        pending = sorted(f for f in os.listdir(MIGRATIONS_DIR)
+                         if f.endswith('.sql') and f[:-4] not in applied)
+        if (not pending):
+            click.echo('Database is up to date.')
+            return
+
+        for filename in pending:
+            version = filename[:-4]
+            click.echo(f'Applying {version}...')
+            if (dry_run):
+                continue
+
+            with open(os.path.join(MIGRATIONS_DIR, filename), encoding='utf-8') as f:
+                for statement in split_sql(f.read()):
+                    cur.execute(statement)
+
+            cur.execute("""INSERT INTO schema_migrations (version, applied_at)
+                           VALUES (%s, %s)
+                        """, (version, datetime.now()))
+            conn.commit()
+
+    except Exception as e:
+        conn.rollback()
+        click.echo(f'Migration failed: {e}', err=True)
+        sys.exit(1)
+
+    finally:
+        cur.close()
+        conn.close()
+
+
+# Hot queries issued by the app: every *_SQL statement of queries.py (the
+# routes run nothing else on their hot paths)
+PLAN_CHECKS = [(name[:-len('_SQL')].lower(), sql) for name, sql in vars(queries).items()
+               if name.endswith('_SQL')]
+
+# Stored procedures the app calls (every *_CALL statement of queries.py),
+# checked through the statements of their bodies
+PROCEDURE_CHECKS = [sql for name, sql in vars(queries).items() if name.endswith('_CALL')]
+
+
+# Sample parameter values taken from the current data
+def plan_check_params(cur):
+    cur.execute("""SELECT a.appointment_id, a.patient_id, a.doctor_id, a.room_id, a.appointment_date,
+                          p.first_name, p.last_name, p.address,
+                          d.doctor_firstname, d.doctor_lastname, d.doctor_address, d.department_id
+                   FROM appointment a
+                   JOIN patient p ON p.patient_id = a.patient_id
+                   JOIN doctor d ON d.doctor_id = a.doctor_id
+                   ORDER BY a.appointment_id
+                   LIMIT 1""")
+    params = dict(cur.fetchone() or {})
+    cur.execute("""SELECT prescription_id FROM prescription ORDER BY prescription_id LIMIT 1""")
+    params.update(cur.fetchone() or {'prescription_id': 0})
+    cur.execute("""SELECT MAX(medicalrecord_id) AS after_id FROM medicalrecord""")
+    params.update(cur.fetchone() or {'after_id': 0})
+    cur.execute("""SELECT user_id, email FROM User ORDER BY user_id LIMIT 1""")
+    params.update(cur.fetchone() or {'user_id': 0, 'email': ''})
+
+    today = datetime.now().date()
+    params.update({
+        'date': params.get('appointment_date', today),
+        'today': today,
+        'week_later': today + timedelta(days=7),
+        'start': today,
+        'end': today + timedelta(days=31),
+        'after_date': params.get('appointment_date', today),
+        'after_time': '23:59:59',
+        'limit': 21,
+        'first_id': params.get('patient_id', 0),
+        'last_id': params.get('patient_id', 0),
+        'query': 'a'
+    })
+    return params
+
+
+# Full scans and filesorts in a (tabular) EXPLAIN
+def explain_problems(cur, sql, params):
+    cur.execute('EXPLAIN ' + sql, params)
+    problems = []
+    for row in cur.fetchall():
+        extra = row.get('Extra') or ''
+        if (row.get('type') == 'ALL'):
+            problems.append(f"full scan of {row['table']}")
+        if ('Using filesort' in extra):
+            problems.append(f"filesort on {row['table']}")
+    return problems
+
+
+# EXPLAIN every hot query, and every statement of the stored procedures
+# the app calls (as stored on the server), and fail on full table scans,
+# filesorts or statements that cannot be explained. Reading procedure
+# bodies needs SHOW_ROUTINE, and explaining refresh_patient_summary an
+# account that may write patient_summary (see --user).
+@click.command('explain-check')
+@click.option('--user', envvar='MYSQL_ADMIN_USER', help="Account to explain as (default: the app's).")
+@click.option('--password', envvar='MYSQL_ADMIN_PASSWORD', default='')
+@with_appcontext
+def explain_check_command(user, password):
+    conn = admin_connection(user, password)
+    cur = conn.cursor()
+    checks = failures = 0
+    try:
+        params = plan_check_params(cur)
+
+        # (name, sql, parameters, or the reason it can't be checked)
+        statements = [(name, sql, params, None) for name, sql in PLAN_CHECKS]
+        for call in PROCEDURE_CHECKS:
+            name = CALL.match(call).group(1)
+            try:
+                body, names = procedure_statements(cur, name)
+            except LookupError as e:
+                statements.append((f'PROCEDURE {name}', None, None, str(e)))
+                continue
+            arguments = dict(zip(names, call_arguments(call, params)))
+            for i, sql in enumerate(body, 1):
+                label = f'PROCEDURE {name}' + (f' ({i})' if len(body) > 1 else '')
+                statements.append((label, sql, arguments, None))
+
+        for name, sql, arguments, error in statements:
+            checks += 1
+            if (error):
+                problems = [error]
+            else:
+                try:
+                    problems = explain_problems(cur, sql, arguments)
+                except Exception as e:
+                    problems = [f'cannot explain: {e}']
+
+            if (problems):
+                failures += 1
+                click.echo(f'FAIL  {name}: ' + ', '.join(problems))
+            else:
+                click.echo(f'ok    {name}')
+
+    finally:
+        cur.close()
+        conn.close()
+
+    if (failures):
+        click.echo(f'{failures} of {checks} statements have a bad plan.', err=True)
+        sys.exit(1)
+
+
+# The statements (or endpoints) that spent the most time over the slow
+# query threshold, with the problems found in their latest plan
+@click.command('slow-queries')
+@click.option('--path', help='Slow query log (default: SLOW_QUERY_LOG).')
+@click.option('--hours', type=float, help='Only entries from the last N hours.')
+@click.option('--by', type=click.Choice(['statement', 'endpoint']), default='statement', show_default=True)
+@click.option('--limit', default=10, show_default=True)
+@with_appcontext
+def slow_queries_command(path, hours, by, limit):
+    path = path or current_app.config['SLOW_QUERY_LOG']
+    since = datetime.now() - timedelta(hours=hours) if hours else None
+    try:
+        summary = summarize(read_entries(path, since), by)
+    except FileNotFoundError:
+        click.echo(f'No slow queries logged ({path} does not exist).')
+        return
+
+    if (not summary):
+        click.echo('No slow queries logged.')
+        return
+    for group in summary[:limit]:
+        click.echo(f"{group['total_ms'] / 1000:8.1f}s total  {group['count']:6,}x  "
+                   f"p95 {group['p95_ms']:8.1f} ms  max {group['max_ms']:8.1f} ms")
+        click.echo(f"    {group[by][:200]}")
+        if (by == 'statement'):
+            click.echo(f"    endpoints: {', '.join(sorted(group['endpoints']))}")
+        if (group['problems']):
+            click.echo(f"    plan: {', '.join(group['problems'])}")
+
+
+# Check every replica in MYSQL_REPLICAS: reachable with the replica
+# account, read-only, and how far behind the primary it is. To try the
+# read/write split locally, run a second MySQL server replicating from the
+# first (e.g. on port 3307) and start the app with MYSQL_REPLICAS=127.0.0.1:3307.
+@click.command('replica-status')
+@click.option('--user', envvar='MYSQL_ADMIN_USER', help='Account allowed to read the replication status.')
+@click.option('--password', envvar='MYSQL_ADMIN_PASSWORD', default='')
+@with_appcontext
+def replica_status_command(user, password):
+    replica_options = current_app.extensions['mysql'].replica_options
+    if (not replica_options):
+        click.echo('No replicas configured (set MYSQL_REPLICAS).')
+        return
+
+    failures = 0
+    for options in replica_options:
+        name = f"{options['host']}:{options['port']}"
+        try:
+            conn = MySQLPool.connect(current_app.config, **options)
+        except Exception as e:
+            failures += 1
+            click.echo(f'FAIL  {name}: cannot connect as {options["user"]}: {e}')
+            continue
+
+        try:
+            cur = conn.cursor()
+            cur.execute("""SELECT @@read_only AS read_only, COUNT(*) AS appointments FROM appointment""")
+            row = cur.fetchone()
+            cur.close()
+        finally:
+            conn.close()
+
+        # The replication status needs a more privileged account
+        lag = 'unknown lag (use --user)'
+        if (user):
+            admin_conn = MySQLPool.connect(current_app.config, **dict(options, user=user, passwd=password))
+            try:
+                cur = admin_conn.cursor()
+                try:
+                    cur.execute("""SHOW REPLICA STATUS""")
+                except Exception:
+                    cur.execute("""SHOW SLAVE STATUS""")
+                status = cur.fetchone()
+                cur.close()
+            finally:
+                admin_conn.close()
+            if (status is None):
+                lag = 'not replicating'
+            else:
+                seconds = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+                lag = 'replication stopped' if seconds is None else f'{seconds}s behind'
+
+        problems = [] if row['read_only'] else ['not read-only']
+        if (lag in ('not replicating', 'replication stopped')):
+            problems.append(lag)
+        failures += bool(problems)
+        click.echo(f"{'FAIL' if problems else 'ok':<5} {name}: {row['appointments']:,} appointments, {lag}"
+                   + (f" ({', '.join(problems)})" if problems else ''))
+
+    if (failures):
+        sys.exit(1)
+
+
+# The patient_summary columns kept up to date by the triggers of migration 004
+SUMMARY_COLUMNS = ('latest_record_id', 'latest_diagnosis', 'latest_result', 'last_bloodtest_date',
+                   'insurance_id', 'insurance_company', 'insurance_expiry', 'next_appointment_id',
+                   'next_appointment_date', 'next_appointment_time', 'outstanding_balance')
+NEXT_APPOINTMENT_COLUMNS = ('next_appointment_id', 'next_appointment_date', 'next_appointment_time')
+
+# The summary rows of a patient_id range that differ from a recomputation
+# (one flag per column)
+SUMMARY_DIFF_SQL = f"""SELECT e.patient_id, s.patient_id IS NULL AS missing,
+                              s.next_appointment_date < CURDATE() AS past_appointment,
+                              {', '.join(f'NOT (e.{c} <=> s.{c}) AS {c}' for c in SUMMARY_COLUMNS)}
+                       FROM patient_summary_expected e
+                       LEFT JOIN patient_summary s ON s.patient_id = e.patient_id
+                       WHERE e.patient_id BETWEEN %s AND %s
+                           AND (s.patient_id IS NULL
+                                OR NOT ({' AND '.join(f'e.{c} <=> s.{c}' for c in SUMMARY_COLUMNS)}))"""
+
+
+# Recompute patient_summary in patient_id batches (one transaction each)
+def refresh_patient_summaries(conn, batch_size=1000, first=None):
+    cur = conn.cursor()
+    try:
+        cur.execute("""SELECT MIN(patient_id) AS first, MAX(patient_id) AS last FROM patient""")
+        bounds = cur.fetchone()
+        if (bounds['first'] is None):
+            return
+        for start in range(max(first or 0, bounds['first']), bounds['last'] + 1, batch_size):
+            cur.execute(queries.REFRESH_PATIENT_SUMMARY_CALL, {'first_id': start, 'last_id': start + batch_size - 1})
+            conn.commit()
+            yield min(start + batch_size - 1, bounds['last'])
+    finally:
+        cur.close()
+
+
+# Compare patient_summary with a recomputation from the source tables, in
+# batches. Rows whose next appointment has merely passed are reported as
+# stale; --fix recomputes the batches with differences, --rebuild all of them.
+@click.command('summary-check')
+@click.option('--batch-size', default=1000, show_default=True, help='Patients per batch.')
+@click.option('--fix', is_flag=True, help='Recompute the batches that differ.')
+@click.option('--rebuild', is_flag=True, help='Recompute every row without comparing.')
+@click.option('--user', envvar='MYSQL_ADMIN_USER', help='Account allowed to run refresh_patient_summary.')
+@click.option('--password', envvar='MYSQL_ADMIN_PASSWORD', default='')
+@with_appcontext
+def summary_check_command(batch_size, fix, rebuild, user, password):
+    conn = admin_connection(user, password)
+    started = time.monotonic()
+    try:
+        if (rebuild):
+            for done in refresh_patient_summaries(conn, batch_size):
+                click.echo(f'\rRebuilt patients up to {done:,}', nl=False)
+            click.echo(f'\nRebuilt in {time.monotonic() - started:.1f}s')
+            return
+
+        cur = conn.cursor()
+        cur.execute("""SELECT MIN(patient_id) AS first, MAX(patient_id) AS last FROM patient""")
+        bounds = cur.fetchone()
+        differences = dict.fromkeys(('missing', *SUMMARY_COLUMNS), 0)
+        wrong = stale = fixed = 0
+        for start in range(bounds['first'] or 0, (bounds['last'] or -1) + 1, batch_size):
+            cur.execute(SUMMARY_DIFF_SQL, (start, start + batch_size - 1))
+            rows = cur.fetchall()
+            for row in rows:
+                columns = [c for c in differences if row[c]]
+                if (row['past_appointment'] and set(columns) <= set(NEXT_APPOINTMENT_COLUMNS)):
+                    stale += 1
+                    continue
+                wrong += 1
+                for column in columns:
+                    differences[column] += 1
+
+            if (fix and rows):
+                cur.execute(queries.REFRESH_PATIENT_SUMMARY_CALL, {'first_id': start, 'last_id': start + batch_size - 1})
+                conn.commit()
+                fixed += len(rows)
+        cur.close()
+
+    except Exception as e:
+        conn.rollback()
+        click.echo(f'\nSummary check failed: {e}', err=True)
+        sys.exit(1)
+
+    finally:
+        conn.close()
+
+    click.echo(f'{wrong:,} rows differ, {stale:,} have a past next appointment '
+               f'({time.monotonic() - started:.1f}s)')
+    for column, count in differences.items():
+        if (count):
+            click.echo(f'  {column}: {count:,}')
+    if (fix):
+        click.echo(f'Recomputed {fixed:,} rows.')
+    elif (wrong):
+        sys.exit(1)
+
+
+# Make every worker reload the department/room cache
+# (run after changing those tables)
+@click.command('reference-refresh')
+@with_appcontext
+def reference_refresh_command():
+    current_app.extensions['reference'].invalidate()
+    click.echo('Reference data will be reloaded on the next request.')
+
+
+# Register patients or doctors in bulk from a CSV/NDJSON file, with the
+# registration forms' field names (and the same match-or-create rules)
+@click.command('import-users')
+@click.argument('role', type=click.Choice(['patient', 'doctor']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']),
+              help='File format (default: from the file extension).')
+@click.option('--chunk-size', default=500, show_default=True, help='Rows per transaction.')
+@click.option('--workers', type=int, help='Password hashing processes (default: one per core).')
+@with_appcontext
+def import_users_command(role, path, file_format, chunk_size, workers):
+    conn = MySQLPool.connect(current_app.config)
+    importer = Importer(conn, role, current_app.config['PASSWORD_HASH_METHOD'], workers)
+    started = time.monotonic()
+
+    def progress(stats):
+        elapsed = time.monotonic() - started
+        click.echo(f"{stats['rows']:,} rows  {stats['rows'] / elapsed:,.0f} rows/s")
+
+    try:
+        stats = importer.run(read_rows(path, file_format), chunk_size, progress)
+    except Exception as e:
+        # Completed chunks are committed; running the import again skips them
+        click.echo(f"Import failed after {importer.stats['rows']:,} rows: {e}", err=True)
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    elapsed = time.monotonic() - started
+    click.echo(f"Imported {stats['rows']:,} rows in {elapsed:.1f}s ({stats['rows'] / elapsed:,.0f} rows/s): "
+               f"{stats['created']:,} created, {stats['linked']:,} linked, {stats['skipped']:,} skipped")
+
+
+# Add a synthetic dataset (for load testing) on top of the existing data.
+# The same --seed and --as-of always generate the same rows.
+@click.command('generate-data')
+@click.option('--patients', default=100000, show_default=True)
+@click.option('--doctors', default=500, show_default=True)
+@click.option('--appointments', default=2000000, show_default=True)
+@click.option('--prescriptions', default=300000, show_default=True)
+@click.option('--bloodtests', default=300000, show_default=True)
+@click.option('--user-share', default=0.1, show_default=True, help='Share of patients with a login.')
+@click.option('--seed', default=1, show_default=True)
+@click.option('--as-of', type=click.DateTime(['%Y-%m-%d']), help='Date the data is centred on (default: today).')
+@click.option('--history-days', default=730, show_default=True)
+@click.option('--future-days', default=90, show_default=True)
+@click.option('--method', type=click.Choice(['load', 'insert']), default='load', show_default=True,
+              help='LOAD DATA LOCAL INFILE, or batched INSERTs.')
+@click.option('--user', envvar='MYSQL_ADMIN_USER', help='Account allowed to load data.')
+@click.option('--password', envvar='MYSQL_ADMIN_PASSWORD', default='')
+@with_appcontext
+def generate_data_command(patients, doctors, appointments, prescriptions, bloodtests, user_share,
+                          seed, as_of, history_days, future_days, method, user, password):
+    as_of = as_of.date() if as_of else date.today()
+    generator = DatasetGenerator(seed, as_of, patients, doctors, appointments, prescriptions, bloodtests,
+                                 user_share=user_share, history_days=history_days, future_days=future_days,
+                                 password_hash=generate_password_hash('loadtest',
+                                                                      current_app.config['PASSWORD_HASH_METHOD']))
+    conn = admin_connection(user, password, local_infile=(method == 'load'))
+    cur = conn.cursor()
+    try:
+        generator.prepare(cur)
+        # Per-row summary triggers would dominate the load; rebuild at the end
+        cur.execute("""SET @skip_patient_summary = 1""")
+        click.echo(f'Generating with seed {seed} as of {as_of} (generated users log in with "loadtest")')
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for table, columns, count, rows in generator.tables():
+                if (not count):
+                    continue
+                started = time.monotonic()
+                if (method == 'load'):
+                    progress = load_data(conn, table, columns, rows, tmp_dir)
+                else:
+                    progress = insert_batches(conn, table, columns, rows)
+
+                loaded = 0
+                for loaded in progress:
+                    rate = loaded / (time.monotonic() - started)
+                    click.echo(f'\r{table}: {loaded:,} / {count:,} rows ({rate:,.0f} rows/s)', nl=False)
+                click.echo()
+
+        for done in refresh_patient_summaries(conn, first=generator.first_patient_id):
+            click.echo(f'\rpatient_summary: patients up to {done:,}', nl=False)
+        click.echo()
+
+    except Exception as e:
+        conn.rollback()
+        click.echo(f'\nGeneration failed: {e}', err=True)
+        sys.exit(1)
+
+    finally:
+        cur.close()
+        conn.close()
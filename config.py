@@ -4,6 +4,67 @@ MYSQL_HOST = os.environ.get('MYSQL_HOST', 'localhost')
 MYSQL_USER = os.environ.get('MYSQL_USER', 'medical_app_user')
 MYSQL_PASSWORD = os.environ.get('MYSQL_PASSWORD', 'aws.cs3083!user')
 MYSQL_DB = os.environ.get('MYSQL_DB', 'medical_db')
+MYSQL_PORT = int(os.environ.get('MYSQL_PORT', 3306))
+
+# Connection pool (per worker process)
+MYSQL_POOL_MIN_SIZE = int(os.environ.get('MYSQL_POOL_MIN_SIZE', 1))
+MYSQL_POOL_MAX_SIZE = int(os.environ.get('MYSQL_POOL_MAX_SIZE', 10))
+MYSQL_POOL_MAX_LIFETIME = int(os.environ.get('MYSQL_POOL_MAX_LIFETIME', 1800))  # seconds
+MYSQL_POOL_PRE_PING = os.environ.get('MYSQL_POOL_PRE_PING', '1') == '1'
+MYSQL_POOL_TIMEOUT = float(os.environ.get('MYSQL_POOL_TIMEOUT', 5))  # seconds
 
 MYSQL_CURSORCLASS = 'DictCursor'
-SECRET_KEY = os.environ.get('SECRET_KEY', 'this-is-the-secret-key')
\ No newline at end of file
+SECRET_KEY = os.environ.get('SECRET_KEY', 'this-is-the-secret-key')
+
+# Read replicas (comma-separated host:port) for the routes marked
+# @mysql.read_only, the account they are read with, and how long a write
+# may take to reach them (a session reads from the primary for that long
+# after its own writes)
+MYSQL_REPLICAS = [replica for replica in os.environ.get('MYSQL_REPLICAS', '').split(',') if replica.strip()]
+MYSQL_REPLICA_USER = os.environ.get('MYSQL_REPLICA_USER', 'medical_readonly_user')
+MYSQL_REPLICA_PASSWORD = os.environ.get('MYSQL_REPLICA_PASSWORD', 'aws.cs3083!readonly')
+MYSQL_REPLICA_LAG = float(os.environ.get('MYSQL_REPLICA_LAG', 5))  # seconds
+
+# Cache of loaded users (see load_user)
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 300))  # seconds
+
+# Shared write counters behind the ETags of the JSON reads (see versions.py);
+# delete the file to invalidate every ETag
+VERSION_FILE = os.environ.get('VERSION_FILE', '/tmp/medical_app_versions')
+
+# Department / room cache (see reference.py)
+REFERENCE_TTL = int(os.environ.get('REFERENCE_TTL', 3600))  # seconds
+
+# Password hashing pool (see hashing.py). Give the method with all of its
+# parameters: stored hashes with a different prefix are rehashed on login.
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+# At most HASH_POOL_SIZE + HASH_QUEUE_LIMIT hashes are in flight on the
+# whole server (the workers count them in HASH_SLOT_FILE); more get a 429.
+HASH_POOL_SIZE = int(os.environ.get('HASH_POOL_SIZE', 2))      # processes per worker (started when needed)
+HASH_QUEUE_LIMIT = int(os.environ.get('HASH_QUEUE_LIMIT', 8))  # more hashes in flight before a 429
+HASH_TIMEOUT = float(os.environ.get('HASH_TIMEOUT', 5))        # seconds
+HASH_SLOT_FILE = os.environ.get('HASH_SLOT_FILE', '/tmp/medical_app_hash_slots')
+
+# Async serving mode (see asgi.py): aiomysql pool per process, and threads
+# running the Flask app for every other route
+ASYNC_POOL_MIN_SIZE = int(os.environ.get('ASYNC_POOL_MIN_SIZE', 1))
+ASYNC_POOL_MAX_SIZE = int(os.environ.get('ASYNC_POOL_MAX_SIZE', 20))
+ASYNC_WSGI_THREADS = int(os.environ.get('ASYNC_WSGI_THREADS', 10))
+
+# Per-request SQL tracing (see instrumentation.py): share of requests traced,
+# and how many identical statements in one request are logged as N+1
+SQL_TRACE_SAMPLE_RATE = float(os.environ.get('SQL_TRACE_SAMPLE_RATE', 0.1))
+SQL_TRACE_REPEAT_THRESHOLD = int(os.environ.get('SQL_TRACE_REPEAT_THRESHOLD', 3))
+
+# Statements slower than this are logged with their EXPLAIN plan (see slowlog.py)
+SQL_SLOW_QUERY_THRESHOLD = float(os.environ.get('SQL_SLOW_QUERY_THRESHOLD', 0.5)) or None  # seconds (0: off)
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', '/tmp/medical_app_slow_queries.ndjson')
+
+# Networks allowed to scrape /metrics (comma-separated CIDRs)
+METRICS_ALLOWED_NETWORKS = os.environ.get('METRICS_ALLOWED_NETWORKS', '127.0.0.1/32,::1/128').split(',')
+
+# Appointment booking (see booking.py): how long a cached doctor/room day
+# is trusted, and the longest appointment that can be booked
+BOOKING_INDEX_TTL = int(os.environ.get('BOOKING_INDEX_TTL', 60))  # seconds
+BOOKING_MAX_MINUTES = int(os.environ.get('BOOKING_MAX_MINUTES', 480))
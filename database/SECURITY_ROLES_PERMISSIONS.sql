@@ -24,6 +24,8 @@ GRANT SELECT ON medical_db.bloodtest TO 'medical_app_user'@'localhost';
 GRANT SELECT ON medical_db.medicalrecord TO 'medical_app_user'@'localhost';
 GRANT SELECT ON medical_db.insurance TO 'medical_app_user'@'localhost';
 GRANT SELECT ON medical_db.room TO 'medical_app_user'@'localhost';
+GRANT SELECT ON medical_db.patient_summary TO 'medical_app_user'@'localhost';
+GRANT SELECT ON medical_db.booking_lock TO 'medical_app_user'@'localhost';
 
 -- Grant INSERT permission (create new records)
 -- Users need to register, create appointments, etc.
@@ -33,6 +35,7 @@ GRANT INSERT ON medical_db.doctor TO 'medical_app_user'@'localhost';
 GRANT INSERT ON medical_db.appointment TO 'medical_app_user'@'localhost';
 GRANT INSERT ON medical_db.prescription TO 'medical_app_user'@'localhost';
 GRANT INSERT ON medical_db.insurance TO 'medical_app_user'@'localhost';
+GRANT INSERT ON medical_db.booking_lock TO 'medical_app_user'@'localhost';
 
 -- Grant UPDATE permission (modify existing records)
 -- Patients/doctors can update their profiles and modify appointments
@@ -43,6 +46,7 @@ GRANT UPDATE ON medical_db.appointment TO 'medical_app_user'@'localhost';
 GRANT UPDATE ON medical_db.insurance TO 'medical_app_user'@'localhost';
 GRANT UPDATE ON medical_db.medicalrecord TO 'medical_app_user'@'localhost';
 GRANT UPDATE ON medical_db.prescription TO 'medical_app_user'@'localhost';
+GRANT UPDATE ON medical_db.booking_lock TO 'medical_app_user'@'localhost';
 
 -- Grant DELETE permission (remove records)
 -- Allows deletion of appointments and user accounts
@@ -52,11 +56,20 @@ GRANT DELETE ON medical_db.User TO 'medical_app_user'@'localhost';
 -- Grant EXECUTE permission (call stored procedures)
 GRANT EXECUTE ON PROCEDURE medical_db.search_appointment TO 'medical_app_user'@'localhost';
 GRANT EXECUTE ON PROCEDURE medical_db.get_patient_appointments_by_date TO 'medical_app_user'@'localhost';
+GRANT EXECUTE ON PROCEDURE medical_db.cancel_patient_appointment TO 'medical_app_user'@'localhost';
+
+-- Read the bodies of the stored procedures (the slow query log explains a
+-- CALL through the statements of its procedure; MySQL 8.0.20+)
+GRANT SHOW_ROUTINE ON *.* TO 'medical_app_user'@'localhost';
 
 
 -- Read-only user can only read data (for reports and analytics)
 GRANT SELECT ON medical_db.* TO 'medical_readonly_user'@'localhost';
 
+-- The app's read-only routes run on replicas as this user (MYSQL_REPLICAS)
+GRANT EXECUTE ON PROCEDURE medical_db.search_appointment TO 'medical_readonly_user'@'localhost';
+GRANT EXECUTE ON PROCEDURE medical_db.get_patient_appointments_by_date TO 'medical_readonly_user'@'localhost';
+
 -- Backup user needs SELECT, SHOW VIEW, LOCK TABLES, and RELOAD
 GRANT SELECT, SHOW VIEW, LOCK TABLES ON medical_db.* TO 'medical_backup_user'@'localhost';
 GRANT RELOAD ON *.* TO 'medical_backup_user'@'localhost';
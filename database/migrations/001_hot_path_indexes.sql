@@ -0,0 +1,31 @@
+/**
+ * Migration 001: composite indexes for the hot access paths
+ * (apply with `flask migrate`)
+*/
+
+-- Patient appointment lists, day view and 7-day window
+-- (WHERE patient_id = ? AND appointment_date ... ORDER BY appointment_date, appointment_time)
+CREATE INDEX idx_appointment_patient_date_time
+    ON appointment (patient_id, appointment_date, appointment_time);
+
+-- Doctor day view
+-- (WHERE doctor_id = ? AND appointment_date = ? ORDER BY appointment_time)
+CREATE INDEX idx_appointment_doctor_date_time
+    ON appointment (doctor_id, appointment_date, appointment_time);
+
+-- Latest prescription for a patient
+-- (WHERE patient_id = ? ORDER BY prescribed_on DESC, prescription_id DESC)
+CREATE INDEX idx_prescription_patient_prescribed
+    ON prescription (patient_id, prescribed_on DESC, prescription_id DESC);
+
+-- Most recent blood test for a patient
+-- (SELECT MAX(time) ... WHERE patient_id = ?)
+CREATE INDEX idx_bloodtest_patient_time
+    ON bloodtest (patient_id, time);
+
+-- Match-or-create lookups used by registration
+CREATE INDEX idx_patient_name_address
+    ON patient (last_name, first_name, address);
+
+CREATE INDEX idx_doctor_name_address
+    ON doctor (doctor_lastname, doctor_firstname, doctor_address);
@@ -0,0 +1,85 @@
+/**
+ * Migration 002: indexed appointment search
+ *
+ * The searchable appointment fields are kept pre-rendered in a stored
+ * column, so search_appointment evaluates one LIKE per row instead of
+ * five CAST/CONCAT expressions. The rows it looks at come from a range
+ * scan of idx_appointment_patient_date_time (migration 001).
+*/
+
+-- Pre-rendered text of the searchable appointment fields
+-- (fields are separated by CHAR(31), so a match cannot span two fields)
+ALTER TABLE appointment
+    ADD COLUMN search_text VARCHAR(320)
+        CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+        GENERATED ALWAYS AS (CONCAT_WS(CHAR(31 USING utf8mb4),
+                                       CAST(room_id AS CHAR),
+                                       CAST(appointment_date AS CHAR),
+                                       CAST(appointment_time AS CHAR),
+                                       CAST(duration_minutes AS CHAR),
+                                       description)) STORED;
+
+DELIMITER $$
+
+DROP PROCEDURE IF EXISTS search_appointment$$
+
+CREATE PROCEDURE search_appointment(
+    IN p_patient_id INT,
+    IN p_start_date DATE,
+    IN p_end_date DATE,
+    IN p_query VARCHAR(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+)
+BEGIN
+    DECLARE v_pattern VARCHAR(102) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+        DEFAULT CONCAT('%', p_query, '%');
+
+    IF (LOCATE('%', p_query) = 0 AND LOCATE('_', p_query) = 0) THEN
+        SELECT a.appointment_id,
+               CONCAT(d.doctor_firstname, ' ', d.doctor_lastname) AS doctor_name,
+               a.room_id,
+               a.appointment_date,
+               a.appointment_time,
+               a.duration_minutes,
+               a.description,
+               d.doctor_firstname,
+               d.doctor_lastname
+        FROM appointment a
+        INNER JOIN doctor d ON a.doctor_id = d.doctor_id
+        WHERE a.patient_id = p_patient_id
+            AND a.appointment_date >= p_start_date
+            AND a.appointment_date <= p_end_date
+            AND (
+                a.search_text LIKE v_pattern
+                OR CONCAT(d.doctor_firstname, ' ', d.doctor_lastname) COLLATE utf8mb4_unicode_ci LIKE v_pattern
+            )
+        ORDER BY a.appointment_date ASC, a.appointment_time ASC;
+    ELSE
+        -- LIKE wildcards in the query could match across the CHAR(31)
+        -- separators, so match each field on its own (as before)
+        SELECT a.appointment_id,
+               CONCAT(d.doctor_firstname, ' ', d.doctor_lastname) AS doctor_name,
+               a.room_id,
+               a.appointment_date,
+               a.appointment_time,
+               a.duration_minutes,
+               a.description,
+               d.doctor_firstname,
+               d.doctor_lastname
+        FROM appointment a
+        INNER JOIN doctor d ON a.doctor_id = d.doctor_id
+        WHERE a.patient_id = p_patient_id
+            AND a.appointment_date >= p_start_date
+            AND a.appointment_date <= p_end_date
+            AND (
+                CONCAT(d.doctor_firstname, ' ', d.doctor_lastname) COLLATE utf8mb4_unicode_ci LIKE v_pattern
+                OR CAST(a.room_id AS CHAR) COLLATE utf8mb4_unicode_ci LIKE v_pattern
+                OR CAST(a.appointment_date AS CHAR) COLLATE utf8mb4_unicode_ci LIKE v_pattern
+                OR CAST(a.appointment_time AS CHAR) COLLATE utf8mb4_unicode_ci LIKE v_pattern
+                OR CAST(a.duration_minutes AS CHAR) COLLATE utf8mb4_unicode_ci LIKE v_pattern
+                OR a.description COLLATE utf8mb4_unicode_ci LIKE v_pattern
+            )
+        ORDER BY a.appointment_date ASC, a.appointment_time ASC;
+    END IF;
+END$$
+
+DELIMITER ;
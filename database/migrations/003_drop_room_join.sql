@@ -0,0 +1,36 @@
+/**
+ * Migration 003: get_patient_appointments_by_date without the room join
+ *
+ * room_id is read from the appointment itself; the room table is only
+ * needed for its details, which the app keeps in its reference cache.
+ *
+ * Dropping a procedure also drops the EXECUTE grants on it (as in 002):
+ * re-run the GRANT EXECUTE statements from
+ * database/SECURITY_ROLES_PERMISSIONS*.sql after migrating.
+*/
+
+DELIMITER $$
+
+DROP PROCEDURE IF EXISTS get_patient_appointments_by_date$$
+
+CREATE PROCEDURE get_patient_appointments_by_date(IN p_patient_id INT, IN p_date DATE)
+BEGIN
+    SELECT
+        a.appointment_id,
+        a.patient_id,
+        a.doctor_id,
+        a.appointment_date,
+        a.appointment_time,
+        a.duration_minutes,
+        a.description,
+        d.doctor_firstname,
+        d.doctor_lastname,
+        a.room_id
+    FROM appointment a
+    LEFT JOIN doctor d ON d.doctor_id = a.doctor_id
+    WHERE a.patient_id = p_patient_id
+        AND a.appointment_date = p_date
+    ORDER BY a.appointment_time ASC;
+END$$
+
+DELIMITER ;
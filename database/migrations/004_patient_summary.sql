@@ -0,0 +1,274 @@
+/**
+ * Migration 004: per-patient summary table
+ *
+ * patient_summary holds what the patient home and medical record pages
+ * show besides the patient row itself (latest medical record, last blood
+ * test, current insurance, next appointment, outstanding balance), so
+ * both render from one primary key lookup.
+ *
+ * Triggers on the source tables recompute a patient's row whenever one
+ * of their rows changes. Bulk loads can skip them with
+ * `SET @skip_patient_summary = 1` and rebuild afterwards with
+ * `flask summary-check --rebuild` (which also reports rows that drifted).
+ * The next appointment goes stale as days pass; the app falls back to
+ * the appointment table when it is in the past.
+ *
+ * The app and read-only users need SELECT on patient_summary: re-run
+ * database/SECURITY_ROLES_PERMISSIONS*.sql after migrating.
+*/
+
+CREATE TABLE IF NOT EXISTS patient_summary (
+    patient_id INT PRIMARY KEY,
+    latest_record_id INT,
+    latest_diagnosis VARCHAR(500),
+    latest_result VARCHAR(500),
+    last_bloodtest_date DATE,
+    insurance_id INT,
+    insurance_company VARCHAR(500),
+    insurance_expiry DATE,
+    next_appointment_id INT,
+    next_appointment_date DATE,
+    next_appointment_time TIME,
+    outstanding_balance DECIMAL(19,4) NOT NULL DEFAULT 0,
+    refreshed_on DATE NOT NULL,
+    FOREIGN KEY (patient_id) REFERENCES patient(patient_id) ON DELETE CASCADE
+);
+
+-- What every patient's summary row should contain (computed from scratch)
+CREATE OR REPLACE VIEW patient_summary_expected AS
+SELECT
+    p.patient_id,
+    m.medicalrecord_id AS latest_record_id,
+    m.diagnosis AS latest_diagnosis,
+    m.result AS latest_result,
+    (SELECT MAX(b.time) FROM bloodtest b WHERE b.patient_id = p.patient_id) AS last_bloodtest_date,
+    i.insurance_id,
+    i.company AS insurance_company,
+    i.date_of_expiry AS insurance_expiry,
+    a.appointment_id AS next_appointment_id,
+    a.appointment_date AS next_appointment_date,
+    a.appointment_time AS next_appointment_time,
+    (SELECT COALESCE(SUM(t.bill), 0)
+     FROM prescription r
+     JOIN treatment t ON t.treatment_name = r.treatment_name AND t.duration_days = r.duration_days
+     WHERE r.patient_id = p.patient_id AND r.paid IS NOT TRUE) AS outstanding_balance
+FROM patient p
+LEFT JOIN medicalrecord m ON m.medicalrecord_id =
+    (SELECT MAX(m2.medicalrecord_id) FROM medicalrecord m2 WHERE m2.patient_id = p.patient_id)
+LEFT JOIN insurance i ON i.insurance_id =
+    (SELECT MAX(i2.insurance_id) FROM insurance i2 WHERE i2.patient_id = p.patient_id)
+LEFT JOIN appointment a ON a.appointment_id =
+    (SELECT a2.appointment_id FROM appointment a2
+     WHERE a2.patient_id = p.patient_id AND a2.appointment_date >= CURDATE()
+     ORDER BY a2.appointment_date ASC, a2.appointment_time ASC, a2.appointment_id ASC
+     LIMIT 1);
+
+DELIMITER $$
+
+DROP PROCEDURE IF EXISTS refresh_patient_summary$$
+
+-- Recompute the summary rows of patients p_from..p_to
+CREATE PROCEDURE refresh_patient_summary(IN p_from INT, IN p_to INT)
+BEGIN
+    INSERT INTO patient_summary (
+        patient_id, latest_record_id, latest_diagnosis, latest_result, last_bloodtest_date,
+        insurance_id, insurance_company, insurance_expiry,
+        next_appointment_id, next_appointment_date, next_appointment_time,
+        outstanding_balance, refreshed_on)
+    SELECT e.patient_id, e.latest_record_id, e.latest_diagnosis, e.latest_result, e.last_bloodtest_date,
+           e.insurance_id, e.insurance_company, e.insurance_expiry,
+           e.next_appointment_id, e.next_appointment_date, e.next_appointment_time,
+           e.outstanding_balance, CURDATE()
+    FROM patient_summary_expected e
+    WHERE e.patient_id BETWEEN p_from AND p_to
+    ON DUPLICATE KEY UPDATE
+        latest_record_id = VALUES(latest_record_id),
+        latest_diagnosis = VALUES(latest_diagnosis),
+        latest_result = VALUES(latest_result),
+        last_bloodtest_date = VALUES(last_bloodtest_date),
+        insurance_id = VALUES(insurance_id),
+        insurance_company = VALUES(insurance_company),
+        insurance_expiry = VALUES(insurance_expiry),
+        next_appointment_id = VALUES(next_appointment_id),
+        next_appointment_date = VALUES(next_appointment_date),
+        next_appointment_time = VALUES(next_appointment_time),
+        outstanding_balance = VALUES(outstanding_balance),
+        refreshed_on = VALUES(refreshed_on);
+END$$
+
+DROP TRIGGER IF EXISTS patient_summary_patient_insert$$
+CREATE TRIGGER patient_summary_patient_insert AFTER INSERT ON patient FOR EACH ROW
+BEGIN
+    IF (@skip_patient_summary IS NULL) THEN
+        CALL refresh_patient_summary(NEW.patient_id, NEW.patient_id);
+    END IF;
+END$$
+
+-- Appointments: only the date, time and patient decide the next appointment
+DROP TRIGGER IF EXISTS patient_summary_appointment_insert$$
+CREATE TRIGGER patient_summary_appointment_insert AFTER INSERT ON appointment FOR EACH ROW
+BEGIN
+    IF (@skip_patient_summary IS NULL) THEN
+        CALL refresh_patient_summary(NEW.patient_id, NEW.patient_id);
+    END IF;
+END$$
+
+DROP TRIGGER IF EXISTS patient_summary_appointment_update$$
+CREATE TRIGGER patient_summary_appointment_update AFTER UPDATE ON appointment FOR EACH ROW
+BEGIN
+    IF (@skip_patient_summary IS NULL
+        AND NOT (OLD.patient_id <=> NEW.patient_id
+                 AND OLD.appointment_date <=> NEW.appointment_date
+                 AND OLD.appointment_time <=> NEW.appointment_time)) THEN
+        CALL refresh_patient_summary(NEW.patient_id, NEW.patient_id);
+        IF (NOT OLD.patient_id <=> NEW.patient_id) THEN
+            CALL refresh_patient_summary(OLD.patient_id, OLD.patient_id);
+        END IF;
+    END IF;
+END$$
+
+DROP TRIGGER IF EXISTS patient_summary_appointment_delete$$
+CREATE TRIGGER patient_summary_appointment_delete AFTER DELETE ON appointment FOR EACH ROW
+BEGIN
+    IF (@skip_patient_summary IS NULL) THEN
+        CALL refresh_patient_summary(OLD.patient_id, OLD.patient_id);
+    END IF;
+END$$
+
+-- Prescriptions: the outstanding balance
+DROP TRIGGER IF EXISTS patient_summary_prescription_insert$$
+CREATE TRIGGER patient_summary_prescription_insert AFTER INSERT ON prescription FOR EACH ROW
+BEGIN
+    IF (@skip_patient_summary IS NULL) THEN
+        CALL refresh_patient_summary(NEW.patient_id, NEW.patient_id);
+    END IF;
+END$$
+
+DROP TRIGGER IF EXISTS patient_summary_prescription_update$$
+CREATE TRIGGER patient_summary_prescription_update AFTER UPDATE ON prescription FOR EACH ROW
+BEGIN
+    IF (@skip_patient_summary IS NULL
+        AND NOT (OLD.patient_id <=> NEW.patient_id
+                 AND OLD.paid <=> NEW.paid
+                 AND OLD.treatment_name <=> NEW.treatment_name
+                 AND OLD.duration_days <=> NEW.duration_days)) THEN
+        CALL refresh_patient_summary(NEW.patient_id, NEW.patient_id);
+        IF (NOT OLD.patient_id <=> NEW.patient_id) THEN
+            CALL refresh_patient_summary(OLD.patient_id, OLD.patient_id);
+        END IF;
+    END IF;
+END$$
+
+DROP TRIGGER IF EXISTS patient_summary_prescription_delete$$
+CREATE TRIGGER patient_summary_prescription_delete AFTER DELETE ON prescription FOR EACH ROW
+BEGIN
+    IF (@skip_patient_summary IS NULL) THEN
+        CALL refresh_patient_summary(OLD.patient_id, OLD.patient_id);
+    END IF;
+END$$
+
+-- A new bill changes the balance of everyone with an unpaid prescription of it
+DROP TRIGGER IF EXISTS patient_summary_treatment_update$$
+CREATE TRIGGER patient_summary_treatment_update AFTER UPDATE ON treatment FOR EACH ROW
+BEGIN
+    IF (@skip_patient_summary IS NULL AND NOT OLD.bill <=> NEW.bill) THEN
+        UPDATE patient_summary s
+        SET s.outstanding_balance = (
+            SELECT COALESCE(SUM(t.bill), 0)
+            FROM prescription r
+            JOIN treatment t ON t.treatment_name = r.treatment_name AND t.duration_days = r.duration_days
+            WHERE r.patient_id = s.patient_id AND r.paid IS NOT TRUE)
+        WHERE s.patient_id IN (
+            SELECT r.patient_id FROM prescription r
+            WHERE r.treatment_name = NEW.treatment_name AND r.duration_days = NEW.duration_days
+                AND r.paid IS NOT TRUE);
+    END IF;
+END$$
+
+-- Medical records, blood tests and insurance (any change may alter the latest one)
+DROP TRIGGER IF EXISTS patient_summary_medicalrecord_insert$$
+CREATE TRIGGER patient_summary_medicalrecord_insert AFTER INSERT ON medicalrecord FOR EACH ROW
+BEGIN
+    IF (@skip_patient_summary IS NULL) THEN
+        CALL refresh_patient_summary(NEW.patient_id, NEW.patient_id);
+    END IF;
+END$$
+
+DROP TRIGGER IF EXISTS patient_summary_medicalrecord_update$$
+CREATE TRIGGER patient_summary_medicalrecord_update AFTER UPDATE ON medicalrecord FOR EACH ROW
+BEGIN
+    IF (@skip_patient_summary IS NULL) THEN
+        CALL refresh_patient_summary(NEW.patient_id, NEW.patient_id);
+        IF (NOT OLD.patient_id <=> NEW.patient_id) THEN
+            CALL refresh_patient_summary(OLD.patient_id, OLD.patient_id);
+        END IF;
+    END IF;
+END$$
+
+DROP TRIGGER IF EXISTS patient_summary_medicalrecord_delete$$
+CREATE TRIGGER patient_summary_medicalrecord_delete AFTER DELETE ON medicalrecord FOR EACH ROW
+BEGIN
+    IF (@skip_patient_summary IS NULL) THEN
+        CALL refresh_patient_summary(OLD.patient_id, OLD.patient_id);
+    END IF;
+END$$
+
+DROP TRIGGER IF EXISTS patient_summary_bloodtest_insert$$
+CREATE TRIGGER patient_summary_bloodtest_insert AFTER INSERT ON bloodtest FOR EACH ROW
+BEGIN
+    IF (@skip_patient_summary IS NULL) THEN
+        CALL refresh_patient_summary(NEW.patient_id, NEW.patient_id);
+    END IF;
+END$$
+
+DROP TRIGGER IF EXISTS patient_summary_bloodtest_update$$
+CREATE TRIGGER patient_summary_bloodtest_update AFTER UPDATE ON bloodtest FOR EACH ROW
+BEGIN
+    IF (@skip_patient_summary IS NULL
+        AND NOT (OLD.patient_id <=> NEW.patient_id AND OLD.time <=> NEW.time)) THEN
+        CALL refresh_patient_summary(NEW.patient_id, NEW.patient_id);
+        IF (NOT OLD.patient_id <=> NEW.patient_id) THEN
+            CALL refresh_patient_summary(OLD.patient_id, OLD.patient_id);
+        END IF;
+    END IF;
+END$$
+
+DROP TRIGGER IF EXISTS patient_summary_bloodtest_delete$$
+CREATE TRIGGER patient_summary_bloodtest_delete AFTER DELETE ON bloodtest FOR EACH ROW
+BEGIN
+    IF (@skip_patient_summary IS NULL) THEN
+        CALL refresh_patient_summary(OLD.patient_id, OLD.patient_id);
+    END IF;
+END$$
+
+DROP TRIGGER IF EXISTS patient_summary_insurance_insert$$
+CREATE TRIGGER patient_summary_insurance_insert AFTER INSERT ON insurance FOR EACH ROW
+BEGIN
+    IF (@skip_patient_summary IS NULL) THEN
+        CALL refresh_patient_summary(NEW.patient_id, NEW.patient_id);
+    END IF;
+END$$
+
+DROP TRIGGER IF EXISTS patient_summary_insurance_update$$
+CREATE TRIGGER patient_summary_insurance_update AFTER UPDATE ON insurance FOR EACH ROW
+BEGIN
+    IF (@skip_patient_summary IS NULL) THEN
+        CALL refresh_patient_summary(NEW.patient_id, NEW.patient_id);
+        IF (NOT OLD.patient_id <=> NEW.patient_id) THEN
+            CALL refresh_patient_summary(OLD.patient_id, OLD.patient_id);
+        END IF;
+    END IF;
+END$$
+
+DROP TRIGGER IF EXISTS patient_summary_insurance_delete$$
+CREATE TRIGGER patient_summary_insurance_delete AFTER DELETE ON insurance FOR EACH ROW
+BEGIN
+    IF (@skip_patient_summary IS NULL) THEN
+        CALL refresh_patient_summary(OLD.patient_id, OLD.patient_id);
+    END IF;
+END$$
+
+DELIMITER ;
+
+-- Backfill every existing patient
+CALL refresh_patient_summary(0, 2147483647);
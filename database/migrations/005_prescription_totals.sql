@@ -0,0 +1,12 @@
+/**
+ * Migration 005: index for a patient's prescription totals
+ *
+ * The billed / paid / outstanding totals of the prescription history
+ * (GET /patient/prescriptions) are one aggregate over a patient's
+ * prescriptions, grouped on paid. With the treatment key in the index it
+ * is answered from the index alone, plus a primary key lookup of each
+ * treatment's bill.
+*/
+
+CREATE INDEX idx_prescription_patient_paid
+    ON prescription (patient_id, paid, treatment_name, duration_days);
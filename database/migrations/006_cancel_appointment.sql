@@ -0,0 +1,35 @@
+/**
+ * Migration 006: cancel an appointment in one round trip
+ *
+ * Deletes the appointment only if it belongs to the patient, and returns
+ * its doctor_id (NULL if nothing was deleted) so the app can invalidate
+ * the doctor's cached views. The row is locked between the check and the
+ * delete.
+ *
+ * The app user needs EXECUTE on the new procedure: re-run the GRANT
+ * EXECUTE statements from database/SECURITY_ROLES_PERMISSIONS*.sql after
+ * migrating.
+*/
+
+DELIMITER $$
+
+DROP PROCEDURE IF EXISTS cancel_patient_appointment$$
+
+CREATE PROCEDURE cancel_patient_appointment(IN p_appointment_id INT, IN p_patient_id INT)
+BEGIN
+    DECLARE v_doctor_id INT DEFAULT NULL;
+
+    SELECT doctor_id INTO v_doctor_id
+    FROM appointment
+    WHERE appointment_id = p_appointment_id
+        AND patient_id = p_patient_id
+    FOR UPDATE;
+
+    IF (v_doctor_id IS NOT NULL) THEN
+        DELETE FROM appointment WHERE appointment_id = p_appointment_id;
+    END IF;
+
+    SELECT v_doctor_id AS doctor_id;
+END$$
+
+DELIMITER ;
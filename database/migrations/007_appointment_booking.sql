@@ -0,0 +1,49 @@
+/**
+ * Migration 007: appointment booking
+ *
+ * booking_lock has one row per doctor-day and room-day that has been
+ * booked. A booking locks its doctor's and room's rows before checking
+ * for overlaps and inserting, so concurrent bookings of the same doctor
+ * or room on the same day are serialized (see booking.py).
+ *
+ * cancel_patient_appointment now also returns the room, so the app can
+ * invalidate its cached room occupancy. Dropping the procedure drops its
+ * EXECUTE grants (as in 002): re-run database/SECURITY_ROLES_PERMISSIONS*.sql
+ * after migrating, which also grants the app user access to booking_lock.
+*/
+
+CREATE TABLE IF NOT EXISTS booking_lock (
+    resource VARCHAR(10) NOT NULL,
+    resource_id INT NOT NULL,
+    lock_date DATE NOT NULL,
+    PRIMARY KEY (resource, resource_id, lock_date)
+);
+
+-- Room day view (overlap checks of a booking)
+-- (WHERE room_id = ? AND appointment_date = ?)
+CREATE INDEX idx_appointment_room_date_time
+    ON appointment (room_id, appointment_date, appointment_time);
+
+DELIMITER $$
+
+DROP PROCEDURE IF EXISTS cancel_patient_appointment$$
+
+CREATE PROCEDURE cancel_patient_appointment(IN p_appointment_id INT, IN p_patient_id INT)
+BEGIN
+    DECLARE v_doctor_id INT DEFAULT NULL;
+    DECLARE v_room_id INT DEFAULT NULL;
+
+    SELECT doctor_id, room_id INTO v_doctor_id, v_room_id
+    FROM appointment
+    WHERE appointment_id = p_appointment_id
+        AND patient_id = p_patient_id
+    FOR UPDATE;
+
+    IF (v_doctor_id IS NOT NULL) THEN
+        DELETE FROM appointment WHERE appointment_id = p_appointment_id;
+    END IF;
+
+    SELECT v_doctor_id AS doctor_id, v_room_id AS room_id;
+END$$
+
+DELIMITER ;
@@ -0,0 +1,390 @@
+import datetime
+import itertools
+import os
+import threading
+import time
+from decimal import Decimal
+from functools import wraps
+
+import MySQLdb
+from MySQLdb import converters, cursors, times
+from MySQLdb.constants import FIELD_TYPE
+from flask import current_app, g, request, session
+
+from instrumentation import instrumented
+
+
+# A TIME value (decoded by the driver as a timedelta) as a time of day,
+# unless it is outside 00:00:00-23:59:59 (e.g. a duration)
+def time_of_day(result):
+    if (isinstance(result, datetime.timedelta)
+            and datetime.timedelta(0) <= result < datetime.timedelta(days=1)):
+        seconds = result.seconds
+        return datetime.time(seconds // 3600, (seconds % 3600) // 60, seconds % 60,
+                             result.microseconds)
+    return result
+
+
+# Decode TIME columns as datetime.time (MySQLdb returns timedelta)
+def time_or_timedelta(value):
+    return time_of_day(times.TimeDelta_or_None(value))
+
+
+# Driver-level type conversions used by every pooled connection
+CONVERSIONS = converters.conversions.copy()
+CONVERSIONS.update({
+    FIELD_TYPE.TIME: time_or_timedelta,
+    FIELD_TYPE.DATE: times.Date_or_None,
+    FIELD_TYPE.DECIMAL: Decimal,
+    FIELD_TYPE.NEWDECIMAL: Decimal,
+    datetime.time: converters.Thing2Literal  # time parameters (e.g. pagination cursors)
+})
+
+
+# Raised when no connection becomes available within the checkout timeout
+class PoolTimeout(Exception):
+    pass
+
+
+# A bounded pool of MySQL connections for a single process
+class ConnectionPool:
+    def __init__(self, connect, min_size=1, max_size=10, max_lifetime=1800,
+                 pre_ping=True, timeout=5):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.pre_ping = pre_ping
+        self.timeout = timeout
+
+        self._cond = threading.Condition()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._idle = []           # [(conn, created_at)]
+        self._created_at = {}     # id(conn) -> created_at (for connections in use)
+        self._size = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'connections_closed': 0,
+            'ping_failures': 0
+        }
+
+    # Connections must never be shared with a forked child (e.g. gunicorn workers)
+    def _check_pid(self):
+        if (self._pid != os.getpid()):
+            # Keep the parent's sockets referenced so they aren't closed from here
+            self._inherited = self._idle
+            self._reset_state()
+
+    def _open(self):
+        return self._connect(), time.monotonic()
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    # Close a connection that held a slot, and free the slot
+    def _discard(self, conn):
+        self._close(conn)
+        with self._cond:
+            self._stats['connections_closed'] += 1
+            self._size -= 1
+            self._cond.notify()
+
+    def _expired(self, created_at):
+        return (self.max_lifetime and time.monotonic() - created_at > self.max_lifetime)
+
+    # Open connections up to min_size (called lazily, inside the worker
+    # process). Like checkout, it reserves the slots under the lock and
+    # connects outside it.
+    def _fill(self):
+        with self._cond:
+            self._check_pid()
+            missing = max(0, self.min_size - self._size)
+            self._size += missing
+        for opened in range(missing):
+            try:
+                conn, created_at = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= missing - opened
+                    self._cond.notify(missing - opened)
+                raise
+            with self._cond:
+                self._stats['connections_created'] += 1
+                self._idle.append((conn, created_at))
+                self._cond.notify()
+
+    # Take a connection from the pool, opening one if there is room.
+    # The lock is only held to pick an idle connection or reserve a slot;
+    # pinging and connecting happen outside it, so waiting threads aren't
+    # held up by another thread's round trip.
+    def checkout(self):
+        started = time.monotonic()
+        waited = False
+        self._fill()
+
+        while (True):
+            with self._cond:
+                self._check_pid()
+                while (True):
+                    # Reuse an idle connection
+                    if (self._idle):
+                        conn, created_at = self._idle.pop()
+                        break
+
+                    # Reserve a slot for a new connection if the pool is not full
+                    if (self._size < self.max_size):
+                        self._size += 1
+                        conn = None
+                        break
+
+                    # Otherwise, wait for a connection to be returned
+                    remaining = self.timeout - (time.monotonic() - started)
+                    if (remaining <= 0):
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                    waited = True
+                    self._cond.wait(remaining)
+
+            if (conn is None):
+                try:
+                    conn, created_at = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats['connections_created'] += 1
+                    return self._lease(conn, created_at, started, waited)
+
+            if (self._expired(created_at) or not self._ping(conn)):
+                self._discard(conn)
+                continue
+            with self._cond:
+                return self._lease(conn, created_at, started, waited)
+
+    def _lease(self, conn, created_at, started, waited):
+        self._created_at[id(conn)] = created_at
+        self._stats['checkouts'] += 1
+        if (waited):
+            wait_time = time.monotonic() - started
+            self._stats['waits'] += 1
+            self._stats['wait_time_total'] += wait_time
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+        return conn
+
+    def _ping(self, conn):
+        if (not self.pre_ping):
+            return True
+        try:
+            conn.ping()
+            return True
+        except Exception:
+            with self._cond:
+                self._stats['ping_failures'] += 1
+            return False
+
+    # Return a connection to the pool (any open transaction is rolled back)
+    def checkin(self, conn):
+        with self._cond:
+            if (self._pid != os.getpid()):
+                return
+            created_at = self._created_at.pop(id(conn), None)
+            if (created_at is None):
+                return
+
+        healthy = True
+        try:
+            conn.rollback()
+        except Exception:
+            healthy = False
+
+        if (healthy and not self._expired(created_at)):
+            with self._cond:
+                self._idle.append((conn, created_at))
+                self._cond.notify()
+        else:
+            self._discard(conn)
+
+    # Close every idle connection
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+    # Pool sizing statistics
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self._size,
+                'in_use': self._size - len(self._idle),
+                'idle': len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size
+            })
+            return stats
+
+
+# Flask extension exposing a pooled connection as `mysql.connection`
+# (a drop-in replacement for flask_mysqldb.MySQL).
+#
+# With MYSQL_REPLICAS set, routes marked @mysql.read_only read from a
+# replica (round-robin, falling back to the primary), and everything else
+# uses the primary. After a browser session writes something, its reads
+# stay on the primary for MYSQL_REPLICA_LAG seconds, so it sees its own
+# writes.
+class MySQLPool:
+    def __init__(self, app=None):
+        self.pool = None
+        self.replicas = []
+        if (app is not None):
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MYSQL_HOST', 'localhost')
+        app.config.setdefault('MYSQL_PORT', 3306)
+        app.config.setdefault('MYSQL_CHARSET', 'utf8mb4')
+        app.config.setdefault('MYSQL_CURSORCLASS', None)
+        app.config.setdefault('MYSQL_POOL_MIN_SIZE', 1)
+        app.config.setdefault('MYSQL_POOL_MAX_SIZE', 10)
+        app.config.setdefault('MYSQL_POOL_MAX_LIFETIME', 1800)
+        app.config.setdefault('MYSQL_POOL_PRE_PING', True)
+        app.config.setdefault('MYSQL_POOL_TIMEOUT', 5)
+        app.config.setdefault('MYSQL_REPLICAS', [])  # ['host:port', ...]
+        app.config.setdefault('MYSQL_REPLICA_USER', app.config.get('MYSQL_USER'))
+        app.config.setdefault('MYSQL_REPLICA_PASSWORD', app.config.get('MYSQL_PASSWORD'))
+        app.config.setdefault('MYSQL_REPLICA_LAG', 5)            # seconds
+        app.config.setdefault('MYSQL_REPLICA_RETRY_INTERVAL', 30)  # seconds
+
+        config = app.config
+        self.pool = self._make_pool(config, lambda: self.connect(config))
+        self.replica_options = []  # MySQLdb.connect options of each replica
+        for replica in config['MYSQL_REPLICAS']:
+            host, _, port = replica.strip().rpartition(':')
+            self.replica_options.append({
+                'host': host or replica.strip(),
+                'port': int(port) if host else int(config['MYSQL_PORT']),
+                'user': config['MYSQL_REPLICA_USER'],
+                'passwd': config['MYSQL_REPLICA_PASSWORD'],
+                'connect_timeout': 2
+            })
+        self.replicas = [self._make_pool(config, lambda options=options: self.connect(config, **options))
+                         for options in self.replica_options]
+        self._next_replica = itertools.count()
+        self._replica_down_until = [0.0] * len(self.replicas)
+
+        app.extensions['mysql'] = self
+        app.after_request(self._remember_write)
+        app.teardown_appcontext(self.teardown)
+
+    @staticmethod
+    def _make_pool(config, connect):
+        return ConnectionPool(
+            connect,
+            min_size=config['MYSQL_POOL_MIN_SIZE'],
+            max_size=config['MYSQL_POOL_MAX_SIZE'],
+            max_lifetime=config['MYSQL_POOL_MAX_LIFETIME'],
+            pre_ping=config['MYSQL_POOL_PRE_PING'],
+            timeout=config['MYSQL_POOL_TIMEOUT']
+        )
+
+    # Open a new (unpooled) connection using the app's settings
+    # (options are passed on to MySQLdb.connect, e.g. local_infile=True)
+    @staticmethod
+    def connect(config, **options):
+        kwargs = {
+            'host': config['MYSQL_HOST'],
+            'port': int(config['MYSQL_PORT']),
+            'user': config['MYSQL_USER'],
+            'passwd': config['MYSQL_PASSWORD'],
+            'db': config['MYSQL_DB'],
+            'charset': config['MYSQL_CHARSET'],
+            'conv': CONVERSIONS
+        }
+        if (config['MYSQL_CURSORCLASS']):
+            kwargs['cursorclass'] = instrumented(getattr(cursors, config['MYSQL_CURSORCLASS']))
+        kwargs.update(options)
+        return MySQLdb.connect(**kwargs)
+
+    # The connection checked out for the current app context
+    @property
+    def connection(self):
+        conn = g.get('_mysql_conn')
+        if (conn is None):
+            pool = self.pool
+            if (self.replicas and g.get('_mysql_read_only') and not g.get('_mysql_primary')
+                    and not self._sticky()):
+                pool, conn = self._checkout_replica()
+            if (conn is None):
+                conn = self.pool.checkout()
+            g._mysql_conn = conn
+            g._mysql_conn_pool = pool
+        return conn
+
+    # Mark a view as read-only: its queries may be served by a replica
+    # (place it right below @app.route, so that loading the user does too)
+    def read_only(self, view):
+        @wraps(view)
+        def decorated(*args, **kwargs):
+            g._mysql_read_only = True
+            return view(*args, **kwargs)
+        return decorated
+
+    # Read from the primary for the rest of this request (e.g. when the
+    # data was just changed by someone else and may not have replicated)
+    def use_primary(self):
+        g._mysql_primary = True
+        pool = g.get('_mysql_conn_pool')
+        if (pool is not None and pool is not self.pool):
+            g.pop('_mysql_conn_pool')
+            pool.checkin(g.pop('_mysql_conn'))
+
+    def _sticky(self):
+        return session.get('_mysql_primary_until', 0) > time.time()
+
+    # A connection from the next healthy replica (None if there is none)
+    def _checkout_replica(self):
+        start = next(self._next_replica)
+        for i in range(len(self.replicas)):
+            index = (start + i) % len(self.replicas)
+            if (self._replica_down_until[index] > time.monotonic()):
+                continue
+            try:
+                return self.replicas[index], self.replicas[index].checkout()
+            except PoolTimeout:
+                continue  # Busy, not down
+            except Exception as e:
+                current_app.logger.warning('Replica %d unavailable, skipping it for %ss: %s', index,
+                                           current_app.config['MYSQL_REPLICA_RETRY_INTERVAL'], e)
+                self._replica_down_until[index] = (time.monotonic()
+                                                   + current_app.config['MYSQL_REPLICA_RETRY_INTERVAL'])
+        return self.pool, None
+
+    # Keep this browser session's reads on the primary for a while after
+    # it changed something (so it doesn't read its own write from a lagging
+    # replica)
+    def _remember_write(self, response):
+        if (self.replicas and not g.get('_mysql_read_only') and g.get('_mysql_conn_pool') is self.pool
+                and request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400):
+            session['_mysql_primary_until'] = time.time() + current_app.config['MYSQL_REPLICA_LAG']
+        return response
+
+    def teardown(self, exception):
+        conn = g.pop('_mysql_conn', None)
+        pool = g.pop('_mysql_conn_pool', self.pool)
+        if (conn is not None):
+            pool.checkin(conn)
@@ -0,0 +1,126 @@
+# The JSON endpoints served both by the Flask app (app.py) and on the
+# event loop (asgi.py): their statements, ETags, ownership checks and
+# responses. The two only differ in how they run the statements and send
+# the response, so each endpoint below is split at its database calls.
+#
+# Responses are (body, status); `versions` is the app's VersionStore.
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import queries
+from models import Appointment, Patient
+
+# A read served with an ETag: its statement, the tag, and the versions
+# that keep it on the primary while they may not have replicated yet
+Read = namedtuple('Read', 'sql params etag fresh')
+
+
+def error(message, status):
+    return {"success": False, "message": message}, status
+
+
+def appointments_response(rows):
+    return {"success": True, "appointments": Appointment.from_rows(rows)}, 200
+
+
+# A patient's appointments for the next 7 days, matching the search (if
+# any). The patient is part of the tag, as a browser may be shared
+# between accounts.
+def search_appointments(versions, patient_id, search_query, today):
+    params = {'patient_id': patient_id, 'today': today, 'week_later': today + timedelta(days=7)}
+    if (search_query):
+        sql = queries.SEARCH_APPOINTMENT_CALL
+        params['query'] = search_query
+    else:
+        sql = queries.UPCOMING_APPOINTMENTS_SQL
+    etag = versions.etag('search', patient_id, versions.version('patient', patient_id),
+                         versions.version('doctors'), today, search_query)
+    return Read(sql, params, etag, (('patient', patient_id), ('doctors', 0)))
+
+
+# The day requested from appointments-by-date (raises ValueError with the
+# message for the user)
+def selected_date(data):
+    selected = data.get('date', '').strip()
+    if (not selected):
+        raise ValueError("Date is required")
+    try:
+        return datetime.strptime(selected, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError("Invalid date format. Please use YYYY-MM-DD")
+
+
+def appointments_by_date(versions, patient_id, date):
+    etag = versions.etag('by-date', patient_id, versions.version('patient', patient_id),
+                         versions.version('doctors'), date)
+    return Read(queries.APPOINTMENTS_BY_DATE_CALL, {'patient_id': patient_id, 'date': date}, etag,
+                (('patient', patient_id), ('doctors', 0)))
+
+
+# Delete an appointment if it belongs to the patient (the procedure
+# returns its doctor and room, or NULLs if there was none)
+def cancel_appointment(patient_id, appointment_id):
+    return queries.CANCEL_APPOINTMENT_CALL, {'appointment_id': appointment_id, 'patient_id': patient_id}
+
+
+# The error to roll back with, if the procedure deleted nothing
+def cancel_refused(cancelled):
+    if (cancelled is None or cancelled['doctor_id'] is None):
+        return error("Appointment not found or does not belong to this patient", 404)
+    return None
+
+
+# After the cancellation was committed
+def appointment_cancelled(versions, patient_id, cancelled):
+    versions.bump('patient', patient_id)
+    versions.bump('doctor', cancelled['doctor_id'])
+    versions.bump('room', cancelled['room_id'])
+    return {"success": True, "message": "Appointment cancelled successfully"}, 200
+
+
+# One of the doctor's appointments. The tag is taken before reading the
+# details, and the client's copy must only be honoured once the
+# appointment is known to be this doctor's (details_refused).
+def appointment_details(versions, doctor_id, appointment_id):
+    etag = versions.etag('details', doctor_id, appointment_id, versions.version('doctor', doctor_id),
+                         versions.version('patients'))
+    return Read(queries.APPOINTMENT_DETAILS_SQL, {'appointment_id': appointment_id, 'doctor_id': doctor_id},
+                etag, (('doctor', doctor_id), ('patients', 0)))
+
+
+def details_refused(appointment):
+    if (not appointment):
+        return error("Appointment not found.", 404)
+    return None
+
+
+# The patient of an appointment found by appointment_details
+def appointment_patient(appointment):
+    return queries.APPOINTMENT_PATIENT_SQL, {'patient_id': appointment['patient_id']}
+
+
+def details_response(appointment, patient):
+    return {
+        "success": True,
+        "appointment": Appointment.from_row(appointment),
+        "patient": Patient.from_row(patient) if patient else None
+    }, 200
+
+
+# Mark a bill paid, if it is the patient's and still unpaid; if no row
+# changed, BILL_STATUS_SQL (same parameters) tells why (bill_refused)
+def pay_bill(patient_id, prescription_id):
+    return queries.PAY_BILL_SQL, {'prescription_id': prescription_id, 'patient_id': patient_id}
+
+
+# The error for a bill that could not be paid, from its BILL_STATUS_SQL row
+def bill_refused(bill):
+    if (not bill):
+        return error("Prescription not found or unauthorized.", 404)
+    return error("Bill is already paid.", 400)
+
+
+# After the payment was committed
+def bill_paid(versions, patient_id):
+    versions.bump('patient', patient_id)
+    return {"success": True, "message": "Bill paid successfully!", "new_amount": 0}, 200
@@ -0,0 +1,313 @@
+import os
+import random
+from datetime import time, timedelta
+from itertools import accumulate
+
+FIRST_NAMES = [
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen',
+    'Daniel', 'Nancy', 'Matthew', 'Lisa', 'Anthony', 'Betty', 'Mark', 'Sandra', 'Steven', 'Ashley',
+    'Paul', 'Emily', 'Andrew', 'Donna', 'Joshua', 'Michelle', 'Kevin', 'Carol', 'Brian', 'Amanda',
+    'Wei', 'Priya', 'Mohammed', 'Sofia', 'Hiroshi', 'Fatima', 'Carlos', 'Aisha', 'Ivan', 'Mei'
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+    'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez', 'Lewis', 'Robinson',
+    'Walker', 'Young', 'Allen', 'King', 'Wright', 'Scott', 'Torres', 'Nguyen', 'Hill', 'Flores',
+    'Chen', 'Patel', 'Kim', 'Singh', 'Khan', 'Cohen', 'Rossi', 'Novak', 'Tanaka', 'Okafor'
+]
+STREETS = [
+    'Lighthouse Drive', 'Maplewood Avenue', 'Pinecrest Road', 'Birchwood Lane', 'Cedar Grove Drive',
+    'Elm Street', 'Willow Creek Road', 'Aspen Ridge Boulevard', 'Redwood Avenue', 'Spruce Court',
+    'Hudson Street', 'Ford Street', 'Rainbow Drive', 'Smith Street', 'Forest Drive', 'Riverbend Street'
+]
+CITIES = [
+    ('Springfield', 'MO', '65804'), ('Austin', 'TX', '73301'), ('Columbus', 'OH', '43215'),
+    ('Seattle', 'WA', '98101'), ('Orlando', 'FL', '32801'), ('Denver', 'CO', '80203'),
+    ('Madison', 'WI', '53703'), ('Phoenix', 'AZ', '85004'), ('San Diego', 'CA', '92103'),
+    ('Nashville', 'TN', '37201'), ('Boston', 'MA', '02108'), ('Atlanta', 'GA', '30303'),
+    ('Portland', 'OR', '97205'), ('Chicago', 'IL', '60601'), ('Raleigh', 'NC', '27601')
+]
+APPOINTMENT_DESCRIPTIONS = [
+    'Annual physical', 'Follow-up visit', 'Cardiology consult', 'ER follow-up', 'Lab results review',
+    'Medication review', 'Vaccination', 'Pre-operative assessment', 'Post-operative check',
+    'Allergy consultation', 'Imaging review', None
+]
+DURATIONS = [15, 20, 30, 45, 60]
+DURATION_WEIGHTS = [20, 15, 40, 15, 10]
+INSURANCE_COMPANIES = ['Aetna', 'Blue Cross Blue Shield', 'Cigna', 'UnitedHealthcare', 'Humana', 'Kaiser Permanente']
+DIAGNOSES = ['Hypertension', 'Type 2 diabetes', 'Asthma', 'Seasonal allergies', 'Hypothyroidism',
+             'Hyperlipidemia', 'Acid reflux', 'Sinusitis', 'Migraine', 'Healthy']
+RESULTS = ['Stable', 'Improving', 'Under observation', 'Resolved', 'Normal', 'Requires follow-up']
+BLOODTEST_RESULTS = ['Normal', 'Low iron', 'High cholesterol', 'Elevated glucose', 'Low vitamin D',
+                     'Elevated white cell count']
+PRESCRIPTION_NOTES = ['Take with food', 'Pain management', 'Blood pressure control', 'Allergy relief',
+                      'Cholesterol control', 'Respiratory infection', None]
+
+# Appointment slots (every 15 minutes, 08:00-17:45), busiest mid-morning
+TIME_SLOTS = [time(hour, minute) for hour in range(8, 18) for minute in (0, 15, 30, 45)]
+TIME_WEIGHTS = [3 if 9 <= slot.hour < 11 else 2 if 13 <= slot.hour < 16 else 1 for slot in TIME_SLOTS]
+
+# Share of appointments by weekday (Monday first)
+WEEKDAY_WEIGHTS = [1.0, 1.0, 1.0, 1.0, 0.9, 0.25, 0.05]
+
+
+# Cumulative weights of a Zipf-like distribution over n items (rank 1 is the most popular)
+def zipf_weights(n, exponent):
+    return list(accumulate(1 / rank ** exponent for rank in range(1, n + 1)))
+
+
+# A TSV field as LOAD DATA reads it
+def tsv_field(value):
+    if (value is None):
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+# Generates a synthetic dataset on top of the existing data. Every table
+# gets its own random stream derived from the seed, so the same seed (and
+# as_of date) always produces the same rows.
+class DatasetGenerator:
+    def __init__(self, seed, as_of, patients, doctors, appointments, prescriptions, bloodtests,
+                 user_share=0.1, history_days=730, future_days=90, password_hash=''):
+        self.seed = seed
+        self.as_of = as_of
+        self.patients = patients
+        self.doctors = doctors
+        self.appointments = appointments
+        self.prescriptions = prescriptions
+        self.bloodtests = bloodtests
+        self.user_share = user_share
+        self.history_days = history_days
+        self.future_days = future_days
+        self.password_hash = password_hash
+
+    def _rng(self, table):
+        return random.Random(f'{self.seed}:{table}')
+
+    # Read the ids to continue from and the reference data to point at
+    def prepare(self, cur):
+        offsets = {}
+        for table, column in (('User', 'user_id'), ('patient', 'patient_id'), ('doctor', 'doctor_id'),
+                              ('insurance', 'insurance_id'), ('medicalrecord', 'medicalrecord_id'),
+                              ('bloodtest', 'bloodtest_id'), ('prescription', 'prescription_id'),
+                              ('appointment', 'appointment_id')):
+            cur.execute(f"""SELECT COALESCE(MAX({column}), 0) AS n FROM {table}""")
+            offsets[table] = cur.fetchone()['n']
+        self.offsets = offsets
+
+        cur.execute("""SELECT department_id FROM department ORDER BY department_id""")
+        self.department_ids = [row['department_id'] for row in cur.fetchall()]
+        cur.execute("""SELECT room_id FROM room ORDER BY room_id""")
+        self.room_ids = [row['room_id'] for row in cur.fetchall()]
+        cur.execute("""SELECT treatment_name, duration_days FROM treatment
+                       ORDER BY treatment_name, duration_days""")
+        self.treatments = [(row['treatment_name'], row['duration_days']) for row in cur.fetchall()]
+        cur.execute("""SELECT doctor_id FROM doctor ORDER BY doctor_id""")
+        self.existing_doctor_ids = [row['doctor_id'] for row in cur.fetchall()]
+
+        if (not self.department_ids or not self.room_ids or not self.treatments):
+            raise ValueError('The department, room and treatment tables must be populated first')
+        if (self.appointments and not self.existing_doctor_ids and not self.doctors):
+            raise ValueError('Appointments need at least one doctor')
+
+        self.first_patient_id = offsets['patient'] + 1
+        self.first_doctor_id = offsets['doctor'] + 1
+        self.doctor_ids = self.existing_doctor_ids + list(range(self.first_doctor_id,
+                                                                self.first_doctor_id + self.doctors))
+
+    # (table, columns, row count, row iterator) in foreign-key order
+    def tables(self):
+        patient_users = int(self.patients * self.user_share)
+        return [
+            ('User', ('user_id', 'email', 'password', 'role'),
+             patient_users + self.doctors, self._users(patient_users)),
+            ('patient', ('patient_id', 'user_id', 'date_of_birth', 'first_name', 'last_name',
+                         'weight_lb', 'height_in', 'age', 'address'),
+             self.patients, self._patients(patient_users)),
+            ('doctor', ('doctor_id', 'user_id', 'department_id', 'doctor_firstname', 'doctor_lastname',
+                        'years_of_experience', 'doctor_address'),
+             self.doctors, self._doctors(patient_users)),
+            ('insurance', ('insurance_id', 'patient_id', 'date_of_expiry', 'company'),
+             self.patients, self._insurance()),
+            ('medicalrecord', ('medicalrecord_id', 'patient_id', 'diagnosis', 'result'),
+             self.patients, self._medical_records()),
+            ('bloodtest', ('bloodtest_id', 'patient_id', 'time', 'result'),
+             self.bloodtests, self._bloodtests()),
+            ('prescription', ('prescription_id', 'patient_id', 'treatment_name', 'duration_days',
+                              'prescribed_on', 'notes', 'paid'),
+             self.prescriptions, self._prescriptions()),
+            ('appointment', ('appointment_id', 'patient_id', 'doctor_id', 'room_id', 'appointment_date',
+                             'appointment_time', 'description', 'duration_minutes'),
+             self.appointments, self._appointments())
+        ]
+
+    def _address(self, rng):
+        city, state, zip_code = rng.choice(CITIES)
+        return f'{rng.randint(1, 9999)} {rng.choice(STREETS)}, {city}, {state} {zip_code}'
+
+    # Patients with accounts come first, then the doctors (all have accounts)
+    def _users(self, patient_users):
+        first_id = self.offsets['User'] + 1
+        for n in range(patient_users):
+            yield (first_id + n, f'patient{self.first_patient_id + n}@example.test', self.password_hash, 'patient')
+        for n in range(self.doctors):
+            yield (first_id + patient_users + n, f'doctor{self.first_doctor_id + n}@example.test',
+                   self.password_hash, 'doctor')
+
+    def _patients(self, patient_users):
+        rng = self._rng('patient')
+        first_user_id = self.offsets['User'] + 1
+        for n in range(self.patients):
+            born = self.as_of - timedelta(days=rng.randint(365, 95 * 365))
+            age = self.as_of.year - born.year - ((self.as_of.month, self.as_of.day) < (born.month, born.day))
+            yield (self.first_patient_id + n, first_user_id + n if n < patient_users else None, born,
+                   rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.randint(90, 300),
+                   rng.randint(58, 78), age, self._address(rng))
+
+    def _doctors(self, patient_users):
+        rng = self._rng('doctor')
+        first_user_id = self.offsets['User'] + 1 + patient_users
+        for n in range(self.doctors):
+            yield (self.first_doctor_id + n, first_user_id + n, rng.choice(self.department_ids),
+                   rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.randint(1, 40), self._address(rng))
+
+    def _insurance(self):
+        rng = self._rng('insurance')
+        for n in range(self.patients):
+            yield (self.offsets['insurance'] + 1 + n, self.first_patient_id + n,
+                   self.as_of + timedelta(days=rng.randint(-180, 3 * 365)), rng.choice(INSURANCE_COMPANIES))
+
+    def _medical_records(self):
+        rng = self._rng('medicalrecord')
+        for n in range(self.patients):
+            yield (self.offsets['medicalrecord'] + 1 + n, self.first_patient_id + n,
+                   rng.choice(DIAGNOSES), rng.choice(RESULTS))
+
+    # Patients drawn with a skew (a minority of patients has most visits)
+    def _patient_sampler(self, rng):
+        ids = list(range(self.first_patient_id, self.first_patient_id + self.patients))
+        rng.shuffle(ids)
+        weights = zipf_weights(len(ids), 0.6)
+        return lambda k: rng.choices(ids, cum_weights=weights, k=k)
+
+    # Past dates, weighted towards weekdays and recent months
+    def _past_days(self):
+        days = [self.as_of - timedelta(days=n) for n in range(self.history_days, 0, -1)]
+        weights = list(accumulate(WEEKDAY_WEIGHTS[day.weekday()] * (1 + i / len(days))
+                                  for i, day in enumerate(days)))
+        return days, weights
+
+    def _bloodtests(self):
+        if (not self.bloodtests or not self.patients):
+            return
+        rng = self._rng('bloodtest')
+        sample_patients = self._patient_sampler(rng)
+        days, day_weights = self._past_days()
+        for start in range(0, self.bloodtests, 10000):
+            k = min(10000, self.bloodtests - start)
+            for n, patient_id, day in zip(range(start, start + k), sample_patients(k),
+                                          rng.choices(days, cum_weights=day_weights, k=k)):
+                yield (self.offsets['bloodtest'] + 1 + n, patient_id, day, rng.choice(BLOODTEST_RESULTS))
+
+    def _prescriptions(self):
+        if (not self.prescriptions or not self.patients):
+            return
+        rng = self._rng('prescription')
+        sample_patients = self._patient_sampler(rng)
+        days, day_weights = self._past_days()
+        for start in range(0, self.prescriptions, 10000):
+            k = min(10000, self.prescriptions - start)
+            for n, patient_id, day in zip(range(start, start + k), sample_patients(k),
+                                          rng.choices(days, cum_weights=day_weights, k=k)):
+                treatment_name, duration_days = rng.choice(self.treatments)
+                # Older bills are more likely to have been paid
+                paid = rng.random() < min(0.95, (self.as_of - day).days / 60)
+                yield (self.offsets['prescription'] + 1 + n, patient_id, treatment_name, duration_days,
+                       day, rng.choice(PRESCRIPTION_NOTES), int(paid))
+
+    def _appointments(self):
+        if (not self.appointments or not self.patients):
+            return
+        rng = self._rng('appointment')
+        sample_patients = self._patient_sampler(rng)
+
+        # A few doctors are much busier than the rest
+        doctor_ids = list(self.doctor_ids)
+        rng.shuffle(doctor_ids)
+        doctor_weights = zipf_weights(len(doctor_ids), 0.8)
+
+        days = [self.as_of + timedelta(days=n) for n in range(-self.history_days, self.future_days + 1)]
+        day_weights = list(accumulate(WEEKDAY_WEIGHTS[day.weekday()] * (1 + i / len(days))
+                                      for i, day in enumerate(days)))
+        slot_weights = list(accumulate(TIME_WEIGHTS))
+        duration_weights = list(accumulate(DURATION_WEIGHTS))
+
+        for start in range(0, self.appointments, 10000):
+            k = min(10000, self.appointments - start)
+            for n, patient_id, doctor_id, day, slot, duration in zip(
+                    range(start, start + k), sample_patients(k),
+                    rng.choices(doctor_ids, cum_weights=doctor_weights, k=k),
+                    rng.choices(days, cum_weights=day_weights, k=k),
+                    rng.choices(TIME_SLOTS, cum_weights=slot_weights, k=k),
+                    rng.choices(DURATIONS, cum_weights=duration_weights, k=k)):
+                yield (self.offsets['appointment'] + 1 + n, patient_id, doctor_id, rng.choice(self.room_ids),
+                       day, slot, rng.choice(APPOINTMENT_DESCRIPTIONS), duration)
+
+
+# Bulk-load rows with LOAD DATA LOCAL INFILE, through TSV files of up to
+# file_rows rows (one transaction per file)
+def load_data(conn, table, columns, rows, tmp_dir, file_rows=1000000):
+    path = os.path.join(tmp_dir, f'{table}.tsv')
+    cur = conn.cursor()
+    loaded = 0
+    try:
+        while (True):
+            count = 0
+            with open(path, 'w', encoding='utf-8', newline='\n') as f:
+                for row in rows:
+                    f.write('\t'.join(tsv_field(value) for value in row) + '\n')
+                    count += 1
+                    if (count == file_rows):
+                        break
+            if (not count):
+                return loaded
+
+            cur.execute(f"""LOAD DATA LOCAL INFILE %s INTO TABLE {table}
+                            CHARACTER SET utf8mb4
+                            FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+                            LINES TERMINATED BY '\\n'
+                            ({', '.join(columns)})""", (path,))
+            conn.commit()
+            loaded += count
+            yield loaded
+    finally:
+        cur.close()
+        if (os.path.exists(path)):
+            os.remove(path)
+
+
+# Batched multi-row inserts (for servers without local_infile)
+def insert_batches(conn, table, columns, rows, batch_size=5000):
+    sql = f"""INSERT INTO {table} ({', '.join(columns)})
+              VALUES ({', '.join(['%s'] * len(columns))})"""
+    cur = conn.cursor()
+    loaded = 0
+    try:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if (len(batch) == batch_size):
+                cur.executemany(sql, batch)
+                conn.commit()
+                loaded += len(batch)
+                batch = []
+                yield loaded
+        if (batch):
+            cur.executemany(sql, batch)
+            conn.commit()
+            loaded += len(batch)
+            yield loaded
+    finally:
+        cur.close()
@@ -0,0 +1,49 @@
+# gunicorn settings (picked up automatically: `gunicorn app:app`)
+import os
+import shutil
+import tempfile
+
+# Workers share their Prometheus metrics through files in a directory of
+# their own, new for every run (inside PROMETHEUS_MULTIPROC_DIR if the
+# operator set it, so nothing already there is touched). It must exist
+# before the app imports prometheus_client; a configuration reload keeps it.
+if (not os.environ.get('MEDICAL_APP_METRICS_DIR')
+        or os.environ['MEDICAL_APP_METRICS_DIR'] != os.environ.get('PROMETHEUS_MULTIPROC_DIR')):
+    os.environ['MEDICAL_APP_METRICS_DIR'] = tempfile.mkdtemp(
+        prefix='medical_app_metrics_', dir=os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = os.environ['MEDICAL_APP_METRICS_DIR']
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+
+# Threaded workers: a request waiting on MySQL or on the password hashing
+# pool (see hashing.py) only holds one of its worker's threads
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Import the app once in the master process, so the workers share its
+# read-only state (e.g. the reference data cache) copy-on-write
+preload_app = True
+
+
+# Load the reference data before the workers are forked
+def when_ready(server):
+    from app import reference
+    try:
+        reference.load()
+    except Exception as e:
+        server.log.warning(f'Reference data not preloaded: {e}')
+
+
+# Drop a dead worker's live gauges (e.g. in-flight requests)
+def child_exit(server, worker):
+    if (not os.environ.get('PROMETHEUS_MULTIPROC_DIR')):
+        return
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+# Remove the metrics directory created above (only that one)
+def on_exit(server):
+    if (os.environ.get('MEDICAL_APP_METRICS_DIR')):
+        shutil.rmtree(os.environ['MEDICAL_APP_METRICS_DIR'], ignore_errors=True)
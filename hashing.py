@@ -0,0 +1,120 @@
+import fcntl
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+# Raised when the hashing pool has no room for another request (or a
+# request waited too long for its result)
+class HashingBusy(Exception):
+    pass
+
+
+# A fixed number of slots shared by every worker process: slot i is taken
+# while byte i of the file is locked. The kernel drops a process's locks
+# when it exits, so a worker that dies never leaks its slots.
+class SharedSlots:
+    def __init__(self, path, size):
+        self.size = size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._held = set()  # Slots taken by this process (its locks don't exclude its own threads)
+        self._lock = threading.Lock()
+
+    # Take a free slot (None if every slot is taken)
+    def acquire(self):
+        with self._lock:
+            for slot in range(self.size):
+                if (slot in self._held):
+                    continue
+                try:
+                    fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, slot)
+                except OSError:
+                    continue
+                self._held.add(slot)
+                return slot
+        return None
+
+    def release(self, slot):
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, slot)
+            self._held.discard(slot)
+
+
+# Flask extension running password hashing/verification in a small pool
+# of worker processes (started on demand). The number of hashes in flight
+# is bounded for the whole server, across the gunicorn workers.
+class PasswordHasher:
+    def __init__(self, app=None):
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if (app is not None):
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+        app.config.setdefault('HASH_POOL_SIZE', 2)
+        app.config.setdefault('HASH_QUEUE_LIMIT', 8)
+        app.config.setdefault('HASH_TIMEOUT', 5)
+        app.config.setdefault('HASH_SLOT_FILE', '/tmp/medical_app_hash_slots')
+
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.pool_size = app.config['HASH_POOL_SIZE']
+        self.timeout = app.config['HASH_TIMEOUT']
+
+        # Hashes in flight on the whole server: running in a pool or waiting for one
+        self._slots = SharedSlots(app.config['HASH_SLOT_FILE'], self.pool_size + app.config['HASH_QUEUE_LIMIT'])
+        app.extensions['hasher'] = self
+
+    # The pool for this process (created on first use, after any fork)
+    def _pool(self):
+        with self._lock:
+            if (self._executor is None or self._pid != os.getpid()):
+                # Start the workers fresh, without copies of our connections
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.pool_size,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        slot = self._slots.acquire()
+        if (slot is None):
+            raise HashingBusy('Too many password checks in progress')
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            self._slots.release(slot)
+            raise
+
+        # The slot stays taken until the hash is done (or cancelled before
+        # it started), even if this request stops waiting for it
+        future.add_done_callback(lambda future: self._slots.release(slot))
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashingBusy(f'Password check took longer than {self.timeout}s')
+
+    # Hash a password with the configured method
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    # Check a password against a stored hash
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    # Whether a stored hash was made with different parameters than the
+    # configured ones (and should be replaced after a successful login)
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        with self._lock:
+            if (self._executor is not None and self._pid == os.getpid()):
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,248 @@
+import csv
+import json
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from werkzeug.security import generate_password_hash
+
+# Columns expected in an import file (the registration forms' field names)
+PATIENT_FIELDS = ('first_name', 'last_name', 'date_of_birth', 'address', 'email', 'password')
+DOCTOR_FIELDS = ('doctor_firstname', 'doctor_lastname', 'department_id', 'doctor_address', 'email', 'password')
+
+
+# Stream the rows of a CSV (with a header) or NDJSON file as dicts
+def read_rows(path, file_format=None):
+    if (file_format is None):
+        file_format = 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+    with open(path, newline='', encoding='utf-8') as f:
+        if (file_format == 'csv'):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if (line.strip()):
+                    yield json.loads(line)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while (True):
+        chunk = list(islice(iterator, size))
+        if (not chunk):
+            return
+        yield chunk
+
+
+# How MySQL compares the matched columns (case-insensitive, trailing spaces ignored)
+def match_key(*values):
+    return tuple(None if value is None else str(value).rstrip().casefold() for value in values)
+
+
+def placeholders(count, width=1):
+    group = '(' + ', '.join(['%s'] * width) + ')' if width > 1 else '%s'
+    return ', '.join([group] * count)
+
+
+# The rows of a chunk to write: (row, existing match) to link or create,
+# the pending hashes of their passwords (in the same order, links first),
+# and the emails and person keys they claim
+ChunkPlan = namedtuple('ChunkPlan', 'to_link to_create hashes emails claimed')
+
+# How each role's rows match an existing unregistered person (as in the
+# registration routes): table, id column, matched columns
+MATCH_COLUMNS = {
+    'patient': ('patient', 'patient_id', ('first_name', 'last_name', 'address')),
+    'doctor': ('doctor', 'doctor_id', ('doctor_firstname', 'doctor_lastname', 'doctor_address', 'department_id'))
+}
+
+
+# Imports registrations in chunks: one transaction, and a handful of
+# batched statements, per chunk (instead of four round trips per person).
+# Only the rows that will be written have their passwords hashed.
+class Importer:
+    def __init__(self, conn, role, hash_method, workers=None):
+        self.conn = conn
+        self.role = role
+        self.hash_method = hash_method
+        self.workers = workers or os.cpu_count()
+        self.stats = {'rows': 0, 'created': 0, 'linked': 0, 'skipped': 0}
+
+    def _hash_rows(self, executor, rows):
+        passwords = [row['password'] for row in rows]
+        return executor.map(generate_password_hash, passwords, [self.hash_method] * len(passwords),
+                            chunksize=max(1, len(passwords) // (self.workers * 4)))
+
+    # Import every row, calling progress(stats) after each chunk
+    def run(self, rows, chunk_size=500, progress=None):
+        # Start the hashing processes fresh, without copies of our connection
+        with ProcessPoolExecutor(max_workers=self.workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            chunks = chunked(rows, chunk_size)
+            chunk = next(chunks, None)
+
+            # Check the file's columns up front
+            fields = PATIENT_FIELDS if self.role == 'patient' else DOCTOR_FIELDS
+            missing = [field for field in fields if chunk and field not in chunk[0]]
+            if (missing):
+                raise ValueError(f"Missing columns: {', '.join(missing)}")
+            plan = self._plan_chunk(executor, chunk, None) if chunk else None
+
+            while (plan):
+                # Plan the next chunk (and hash its passwords) while this one is written
+                next_chunk = next(chunks, None)
+                next_plan = self._plan_chunk(executor, next_chunk, plan) if next_chunk else None
+
+                self._import_chunk(plan)
+                if (progress):
+                    progress(self.stats)
+                plan = next_plan
+        return self.stats
+
+    # Choose the rows of a chunk to write, and start hashing their
+    # passwords. Rows claiming an email or person that `pending` (the
+    # chunk not yet written) claims are skipped, as they would be once it is.
+    def _plan_chunk(self, executor, chunk, pending):
+        cur = self.conn.cursor()
+        try:
+            self.stats['rows'] += len(chunk)
+
+            # Skip rows without credentials, and emails that are already
+            # taken (or repeated in the file)
+            emails = [row.get('email') for row in chunk]
+            cur.execute(f"""SELECT email FROM User WHERE email IN ({placeholders(len(emails))})""", emails)
+            taken = {match_key(row['email']) for row in cur.fetchall()}
+            if (pending):
+                taken |= pending.emails
+
+            accepted, claimed_emails = [], set()
+            for row in chunk:
+                key = match_key(row.get('email'))
+                if (not row.get('email') or not row.get('password') or key in taken):
+                    self.stats['skipped'] += 1
+                    continue
+                taken.add(key)
+                claimed_emails.add(key)
+                accepted.append(row)
+
+            # Link to an unclaimed matching person, skip a claimed one,
+            # otherwise create the person
+            table, id_column, columns = MATCH_COLUMNS[self.role]
+            existing = self._existing(cur, table, id_column, columns, accepted)
+
+            to_create, to_link, claimed = [], [], set()
+            for row in accepted:
+                key = match_key(*(row.get(column) for column in columns))
+                match = existing.get(key)
+                if (key in claimed or (pending and key in pending.claimed)
+                        or (match and match['user_id'] is not None)):
+                    self.stats['skipped'] += 1  # Already registered
+                    claimed_emails.discard(match_key(row['email']))
+                    continue
+                claimed.add(key)
+                (to_link if match else to_create).append((row, match))
+
+        finally:
+            cur.close()
+
+        hashes = self._hash_rows(executor, [row for row, _ in to_link + to_create])
+        return ChunkPlan(to_link, to_create, hashes, claimed_emails, claimed)
+
+    def _import_chunk(self, plan):
+        hashes = list(plan.hashes)
+        to_link = [(row, password_hash, match) for (row, match), password_hash in zip(plan.to_link, hashes)]
+        to_create = [(row, password_hash, match)
+                     for (row, match), password_hash in zip(plan.to_create, hashes[len(to_link):])]
+        if (not to_create and not to_link):
+            return
+
+        cur = self.conn.cursor()
+        try:
+            if (self.role == 'patient'):
+                self._import_patients(cur, to_link, to_create)
+            else:
+                self._import_doctors(cur, to_link, to_create)
+            self.conn.commit()
+
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        finally:
+            cur.close()
+
+    # Existing rows matching the chunk, keyed like match_key
+    def _existing(self, cur, table, id_column, columns, rows):
+        if (not rows):
+            return {}
+        keys = [tuple(row.get(column) for column in columns) for row in rows]
+        cur.execute(f"""SELECT {id_column}, user_id, {', '.join(columns)}
+                        FROM {table}
+                        WHERE ({', '.join(columns)}) IN ({placeholders(len(keys), len(columns))})""",
+                    [value for key in keys for value in key])
+        return {match_key(*(row[column] for column in columns)): row for row in cur.fetchall()}
+
+    # Create the User rows and return their ids by email
+    def _insert_users(self, cur, accepted):
+        cur.executemany(f"""INSERT INTO User (email, password, role)
+                            VALUES (%s, %s, '{self.role}')""",
+                        [(row['email'], password_hash) for row, password_hash in accepted])
+        emails = [row['email'] for row, _ in accepted]
+        cur.execute(f"""SELECT user_id, email FROM User WHERE email IN ({placeholders(len(emails))})""", emails)
+        return {match_key(row['email']): row['user_id'] for row in cur.fetchall()}
+
+    # Same rules as register_patient (see _plan_chunk)
+    def _import_patients(self, cur, to_link, to_create):
+        user_ids = self._insert_users(cur, [(row, h) for row, h, _ in to_link + to_create])
+
+        # Link the existing patients
+        cur.executemany("""UPDATE patient
+                           SET user_id = %s
+                           WHERE patient_id = %s""",
+                        [(user_ids[match_key(row['email'])], match['patient_id']) for row, _, match in to_link])
+        patient_ids = [match['patient_id'] for _, _, match in to_link]
+
+        # Create the new patients
+        if (to_create):
+            new_user_ids = [user_ids[match_key(row['email'])] for row, _, _ in to_create]
+            cur.executemany("""INSERT INTO patient (user_id, first_name,
+                                   last_name, date_of_birth, address)
+                               VALUES (%s, %s, %s, %s, %s)""",
+                            [(user_id, row.get('first_name'), row.get('last_name'),
+                              row.get('date_of_birth') or None, row.get('address'))
+                             for user_id, (row, _, _) in zip(new_user_ids, to_create)])
+            cur.execute(f"""SELECT patient_id FROM patient
+                            WHERE user_id IN ({placeholders(len(new_user_ids))})""", new_user_ids)
+            patient_ids += [row['patient_id'] for row in cur.fetchall()]
+
+        # Insurance and medical record entries for every registered patient
+        cur.executemany("""INSERT INTO insurance (patient_id) VALUES (%s)""",
+                        [(patient_id,) for patient_id in patient_ids])
+        cur.executemany("""INSERT INTO medicalrecord (patient_id) VALUES (%s)""",
+                        [(patient_id,) for patient_id in patient_ids])
+
+        self.stats['linked'] += len(to_link)
+        self.stats['created'] += len(to_create)
+
+    # Same rules as register_doctor
+    def _import_doctors(self, cur, to_link, to_create):
+        user_ids = self._insert_users(cur, [(row, h) for row, h, _ in to_link + to_create])
+
+        # Link the existing doctors
+        cur.executemany("""UPDATE doctor
+                           SET user_id = %s
+                           WHERE doctor_id = %s""",
+                        [(user_ids[match_key(row['email'])], match['doctor_id']) for row, _, match in to_link])
+
+        # Create the new doctors
+        cur.executemany("""INSERT INTO doctor (user_id, doctor_firstname,
+                               doctor_lastname, doctor_address, department_id)
+                           VALUES (%s, %s, %s, %s, %s)""",
+                        [(user_ids[match_key(row['email'])], row.get('doctor_firstname'),
+                          row.get('doctor_lastname'), row.get('doctor_address'), row.get('department_id'))
+                         for row, _, _ in to_create])
+
+        self.stats['linked'] += len(to_link)
+        self.stats['created'] += len(to_create)
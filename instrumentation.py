@@ -0,0 +1,191 @@
+import random
+import re
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+
+from flask import before_render_template, g, has_app_context, request, template_rendered
+
+
+# Statement text with whitespace collapsed (parameters are still
+# placeholders at this point, so equal statements normalize equally)
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    if (isinstance(sql, bytes)):
+        sql = sql.decode('utf-8', 'replace')
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+# The statements issued (and the time spent rendering) during one request
+class SQLTrace:
+    __slots__ = ('statements', 'slow', 'slow_threshold', 'render_time', '_render_started',
+                 'started', 'sampled', 'endpoint', 'route')
+
+    def __init__(self, sampled=True, slow_threshold=None):
+        self.sampled = sampled  # Report this request (Server-Timing, N+1 log)
+        self.statements = []    # [(normalized sql, seconds, rows)]
+        self.slow = []          # [(sql, parameters, seconds)] at or over slow_threshold
+        self.slow_threshold = slow_threshold
+        self.render_time = 0.0
+        self._render_started = None
+        self.started = time.perf_counter()
+        self.endpoint = 'unmatched'  # Set when the request finishes
+        self.route = None            # 'METHOD /rule'
+
+    def record(self, sql, args, duration, rows):
+        self.statements.append((normalize_sql(sql), duration, rows))
+        if (self.slow_threshold is not None and duration >= self.slow_threshold):
+            self.slow.append((sql, args, duration))
+
+    @property
+    def db_time(self):
+        return sum(duration for _, duration, _ in self.statements)
+
+    # Statements issued at least `threshold` times (likely N+1 queries)
+    def repeated(self, threshold):
+        counts = {}
+        for sql, _, _ in self.statements:
+            counts[sql] = counts.get(sql, 0) + 1
+        return {sql: count for sql, count in counts.items() if count >= threshold}
+
+
+# The trace of the current asgi.py request (which has no app context)
+async_trace = ContextVar('sql_trace', default=None)
+
+
+def current_trace():
+    return g.get('_sql_trace') if has_app_context() else async_trace.get()
+
+
+# Add statement tracing to a cursor class (only sampled requests pay for
+# more than one context lookup per statement)
+@lru_cache(maxsize=None)
+def instrumented(cursor_class):
+    class InstrumentedCursor(cursor_class):
+        _tracing = False
+
+        def _traced(self, method, query, args, statement=None):
+            trace = current_trace()
+            if (trace is None or self._tracing):
+                return method(self, query, args)
+
+            # executemany may call execute for each row; record it once
+            self._tracing = True
+            started = time.perf_counter()
+            try:
+                return method(self, query, args)
+            finally:
+                self._tracing = False
+                trace.record(statement or query, args, time.perf_counter() - started, self.rowcount)
+
+        def execute(self, query, args=None):
+            return self._traced(cursor_class.execute, query, args)
+
+        def executemany(self, query, args):
+            return self._traced(cursor_class.executemany, query, args)
+
+        def callproc(self, procname, args=()):
+            return self._traced(cursor_class.callproc, procname, args, f'CALL {procname}')
+
+    InstrumentedCursor.__name__ = 'Instrumented' + cursor_class.__name__
+    return InstrumentedCursor
+
+
+# The same for an aiomysql cursor class (asgi.py only calls execute)
+@lru_cache(maxsize=None)
+def async_instrumented(cursor_class):
+    class InstrumentedCursor(cursor_class):
+        async def execute(self, query, args=None):
+            trace = current_trace()
+            if (trace is None):
+                return await cursor_class.execute(self, query, args)
+
+            started = time.perf_counter()
+            try:
+                return await cursor_class.execute(self, query, args)
+            finally:
+                trace.record(query, args, time.perf_counter() - started, self.rowcount)
+
+    InstrumentedCursor.__name__ = 'AsyncInstrumented' + cursor_class.__name__
+    return InstrumentedCursor
+
+
+# Flask extension tracing a sample of requests: adds a Server-Timing
+# header and logs repeated statements (N+1 patterns) at debug level.
+# With listeners (e.g. metrics), every request is traced and passed on.
+class SQLInstrumentation:
+    def __init__(self, app=None):
+        self._listeners = []
+        if (app is not None):
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_TRACE_SAMPLE_RATE', 0.1)
+        app.config.setdefault('SQL_TRACE_REPEAT_THRESHOLD', 3)
+        app.config.setdefault('SQL_TRACE_SERVER_TIMING', True)
+        app.config.setdefault('SQL_SLOW_QUERY_THRESHOLD', None)  # seconds (None: off)
+
+        self.app = app
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        before_render_template.connect(self._render_started, app)
+        template_rendered.connect(self._render_finished, app)
+        app.extensions['sql_instrumentation'] = self
+
+    # Call listener(trace, response) at the end of every request
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    # A trace for a new request (None if it is neither sampled nor listened to)
+    def start_trace(self):
+        rate = self.app.config['SQL_TRACE_SAMPLE_RATE']
+        sampled = (rate >= 1 or (rate > 0 and random.random() < rate))
+        if (sampled or self._listeners):
+            return SQLTrace(sampled, self.app.config['SQL_SLOW_QUERY_THRESHOLD'])
+        return None
+
+    def _start(self):
+        trace = self.start_trace()
+        if (trace is not None):
+            g._sql_trace = trace
+
+    def _render_started(self, sender, **extra):
+        trace = current_trace()
+        if (trace is not None):
+            trace._render_started = time.perf_counter()
+
+    def _render_finished(self, sender, **extra):
+        trace = current_trace()
+        if (trace is not None and trace._render_started is not None):
+            trace.render_time += time.perf_counter() - trace._render_started
+            trace._render_started = None
+
+    def _finish(self, response):
+        trace = g.pop('_sql_trace', None)
+        if (trace is None):
+            return response
+
+        trace.endpoint = request.endpoint or 'unmatched'
+        trace.route = f'{request.method} {request.url_rule.rule if request.url_rule else request.path}'
+        timing = self.finish_trace(trace, response, f'{request.method} {request.path}')
+        if (timing):
+            response.headers.add('Server-Timing', timing)
+        return response
+
+    # Report a finished trace (with its endpoint and route set): logs its
+    # repeated statements and passes it to the listeners. Returns the
+    # Server-Timing header to add, if any.
+    def finish_trace(self, trace, response, request_line):
+        if (trace.sampled):
+            for sql, count in trace.repeated(self.app.config['SQL_TRACE_REPEAT_THRESHOLD']).items():
+                self.app.logger.debug('%s ran the same statement %d times: %s', request_line, count, sql)
+
+        for listener in self._listeners:
+            listener(trace, response)
+
+        if (trace.sampled and self.app.config['SQL_TRACE_SERVER_TIMING']):
+            total = time.perf_counter() - trace.started
+            return (f'db;dur={trace.db_time * 1000:.1f};desc="{len(trace.statements)} queries", '
+                    f'render;dur={trace.render_time * 1000:.1f}, '
+                    f'total;dur={total * 1000:.1f}')
+        return None
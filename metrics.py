@@ -0,0 +1,139 @@
+import ipaddress
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+
+from flask import g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                               REGISTRY, generate_latest, multiprocess)
+
+# With PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py), every worker
+# writes its samples to memory-mapped files in that directory and /metrics
+# adds them up, whichever worker serves the scrape
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency', ['endpoint', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+REQUESTS = Counter('http_requests', 'Requests served', ['endpoint', 'method', 'status'])
+IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests being served', multiprocess_mode='livesum')
+
+QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds', 'Statement latency', ['endpoint', 'statement'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+QUERIES_PER_REQUEST = Histogram(
+    'db_queries_per_request', 'Statements issued per request', ['endpoint'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50))
+
+POOL_CONNECTIONS = Gauge('db_pool_connections', 'Pooled connections', ['state'],
+                         multiprocess_mode='livesum')
+POOL_EVENTS = Counter('db_pool_events', 'Connection pool events', ['event'])
+POOL_WAIT = Counter('db_pool_wait_seconds', 'Time spent waiting for a pooled connection')
+
+CACHE_REQUESTS = Counter('cache_requests', 'Cache lookups', ['cache', 'result'])
+
+# Cumulative connection pool counters exported as POOL_EVENTS
+POOL_EVENT_STATS = ('checkouts', 'waits', 'timeouts', 'connections_created',
+                    'connections_closed', 'ping_failures')
+
+
+# A low-cardinality name for a statement: its verb and first table
+# (e.g. 'SELECT appointment', 'UPDATE patient', 'CALL get_patient_appointments_by_date')
+@lru_cache(maxsize=1024)
+def statement_label(sql):
+    verb = sql.split(' ', 1)[0].upper()
+    match = re.search(r'\b(?:FROM|INTO|UPDATE|CALL)\s+`?(\w+)', sql, re.IGNORECASE)
+    return f'{verb} {match.group(1)}' if match else verb
+
+
+# Flask extension collecting Prometheus metrics for the routes, the
+# database (through the SQL instrumentation) and the connection pool
+# and caches, and rendering them for /metrics
+class Metrics:
+    def __init__(self, app=None, instrumentation=None, pool=None, caches=None):
+        self.pool = pool
+        self.caches = caches or {}  # name -> object with stats() (hits / misses)
+        self._last = {}             # Cumulative stats already exported by this process
+        self._last_pid = None
+        self._lock = threading.Lock()
+        if (app is not None):
+            self.init_app(app, instrumentation)
+
+    def init_app(self, app, instrumentation):
+        app.config.setdefault('METRICS_ALLOWED_NETWORKS', ('127.0.0.1/32', '::1/128'))
+        self._allowed = [ipaddress.ip_network(network) for network in app.config['METRICS_ALLOWED_NETWORKS']]
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+        instrumentation.add_listener(self._record_statements)
+        app.extensions['metrics'] = self
+
+    def _start(self):
+        g._metrics_started = time.perf_counter()
+        IN_FLIGHT.inc()
+
+    def _finish(self, response):
+        started = g.get('_metrics_started')
+        if (started is not None):
+            endpoint = request.endpoint or 'unmatched'
+            REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - started)
+            REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+        self.collect_stats()
+        return response
+
+    def _teardown(self, exception):
+        # Runs even if the request failed before after_request
+        if (g.pop('_metrics_started', None) is not None):
+            IN_FLIGHT.dec()
+
+    def _record_statements(self, trace, response):
+        QUERIES_PER_REQUEST.labels(trace.endpoint).observe(len(trace.statements))
+        for sql, duration, _ in trace.statements:
+            QUERY_LATENCY.labels(trace.endpoint, statement_label(sql)).observe(duration)
+
+    # Export this process's pool and cache statistics (counters are
+    # advanced by how much they grew since the last call)
+    def collect_stats(self):
+        with self._lock:
+            if (self._last_pid != os.getpid()):
+                # The totals are per process; start over in a forked worker
+                self._last, self._last_pid = {}, os.getpid()
+
+            if (self.pool is not None):
+                stats = self.pool.stats()
+                POOL_CONNECTIONS.labels('in_use').set(stats['in_use'])
+                POOL_CONNECTIONS.labels('idle').set(stats['idle'])
+                for event in POOL_EVENT_STATS:
+                    POOL_EVENTS.labels(event).inc(self._delta(('pool', event), stats[event]))
+                POOL_WAIT.inc(self._delta(('pool', 'wait_time_total'), stats['wait_time_total']))
+
+            for name, cache in self.caches.items():
+                stats = cache.stats()
+                for stat, result in (('hits', 'hit'), ('misses', 'miss')):
+                    CACHE_REQUESTS.labels(name, result).inc(self._delta((name, stat), stats[stat]))
+
+    def _delta(self, key, value):
+        # Counters restart from zero when the pool resets after a fork
+        delta = value - self._last.get(key, 0)
+        self._last[key] = value
+        return delta if delta >= 0 else value
+
+    def allowed(self, address):
+        try:
+            address = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(address in network for network in self._allowed)
+
+    # The exposition text for every worker (or just this process when
+    # not running under gunicorn) and its content type
+    def render(self):
+        self.collect_stats()
+        if (os.environ.get('PROMETHEUS_MULTIPROC_DIR')):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,135 @@
+from datetime import date, time, timedelta
+from decimal import Decimal
+from operator import attrgetter
+
+from flask.json.provider import DefaultJSONProvider
+
+
+# Base class for compact, read-only row records
+# (subclasses list their columns in __slots__)
+class Record:
+    __slots__ = ()
+    _temporal_fields = ()
+
+    # Build a record from a DictCursor row (missing columns become None)
+    @classmethod
+    def from_row(cls, row):
+        record = cls.__new__(cls)
+        for field in cls.__slots__:
+            setattr(record, field, row.get(field))
+        return record
+
+    @classmethod
+    def from_rows(cls, rows):
+        return [cls.from_row(row) for row in rows]
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._values = attrgetter(*cls.__slots__)
+
+    # JSON-ready dict (dates and times as ISO 8601 strings)
+    def to_json(self):
+        data = dict(zip(self.__slots__, self._values(self)))
+        for field in self._temporal_fields:
+            value = data[field]
+            if (value is not None):
+                data[field] = value.isoformat() if isinstance(value, (date, time)) else str(value)
+        return data
+
+    def __repr__(self):
+        fields = ', '.join(f'{field}={getattr(self, field)!r}' for field in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+
+# An appointment, optionally with its doctor's name
+class Appointment(Record):
+    __slots__ = (
+        'appointment_id',
+        'patient_id',
+        'doctor_id',
+        'room_id',
+        'appointment_date',
+        'appointment_time',
+        'duration_minutes',
+        'description',
+        'doctor_firstname',
+        'doctor_lastname'
+    )
+    _temporal_fields = ('appointment_date', 'appointment_time')
+
+
+# A patient's profile
+class Patient(Record):
+    __slots__ = (
+        'patient_id',
+        'first_name',
+        'last_name',
+        'date_of_birth',
+        'weight_lb',
+        'height_in',
+        'age',
+        'address'
+    )
+    _temporal_fields = ('date_of_birth',)
+
+
+# A prescription, along with its treatment details
+class Prescription(Record):
+    __slots__ = (
+        'prescription_id',
+        'patient_id',
+        'treatment_name',
+        'duration_days',
+        'prescribed_on',
+        'notes',
+        'paid',
+        'description',
+        'bill'
+    )
+    _temporal_fields = ('prescribed_on',)
+
+    # Amount still owed for this prescription
+    @property
+    def total_amount(self):
+        if (self.paid):
+            return Decimal(0)
+        return self.bill or Decimal(0)
+
+    def to_json(self):
+        data = super().to_json()
+        data['paid'] = bool(self.paid)
+        data['total_amount'] = self.total_amount
+        return data
+
+
+# A department (reference data, see reference.py)
+class Department(Record):
+    __slots__ = (
+        'department_id',
+        'department_name',
+        'officelocation'
+    )
+
+
+# A room (reference data, see reference.py)
+class Room(Record):
+    __slots__ = (
+        'room_id',
+        'capacity',
+        'floor'
+    )
+
+
+# JSON provider that serializes records, and dates/times as ISO 8601
+class RecordJSONProvider(DefaultJSONProvider):
+    sort_keys = False  # Records already have a fixed field order
+
+    @staticmethod
+    def default(o):
+        if (isinstance(o, Record)):
+            return o.to_json()
+        if (isinstance(o, (date, time))):
+            return o.isoformat()
+        if (isinstance(o, timedelta)):
+            return str(o)
+        return DefaultJSONProvider.default(o)
@@ -0,0 +1,266 @@
+# The statements behind the app's hot paths, shared by the routes (app.py,
+# asgi.py, booking.py) and `flask explain-check`, which EXPLAINs every
+# *_SQL statement below with sample values. Parameters are named
+# (%(patient_id)s), so every driver takes the same dict.
+#
+# Stored procedures are called through the *_CALL statements; explain-check
+# explains the statements of their bodies, as stored on the server.
+#
+# The keyset-paginated lists come in two variants: the first page, and
+# the pages after a cursor (_AFTER_SQL, continuing after the row whose
+# sort key is after_date / after_time / after_id).
+
+
+# A user with their linked patient/doctor (load_user)
+LOAD_USER_SQL = """SELECT u.user_id, u.email, u.role,
+                          p.patient_id, d.doctor_id
+                   FROM User u
+                   LEFT JOIN patient p ON p.user_id = u.user_id
+                   LEFT JOIN doctor d ON d.user_id = u.user_id
+                   WHERE u.user_id = %(user_id)s"""
+
+# The user signing in
+LOGIN_SQL = """SELECT * FROM User
+               WHERE email = %(email)s"""
+
+# Registration: the email address is already in use
+EMAIL_TAKEN_SQL = """SELECT user_id
+                     FROM User
+                     WHERE email = %(email)s"""
+
+# Registration: an existing patient/doctor row to link the new user to
+PATIENT_MATCH_SQL = """SELECT patient_id, user_id
+                       FROM patient
+                       WHERE first_name = %(first_name)s
+                           AND last_name = %(last_name)s
+                           AND address = %(address)s"""
+
+DOCTOR_MATCH_SQL = """SELECT doctor_id, user_id
+                      FROM doctor
+                      WHERE doctor_firstname = %(doctor_firstname)s
+                          AND doctor_lastname = %(doctor_lastname)s
+                          AND doctor_address = %(doctor_address)s
+                          AND department_id = %(department_id)s"""
+
+# The patient homepage: the current insurance and next appointment come
+# from the patient's summary row (kept up to date by triggers)
+PATIENT_HOME_SQL = """SELECT p.*, s.insurance_id, s.insurance_company AS company,
+                             s.insurance_expiry AS date_of_expiry, s.next_appointment_date
+                      FROM patient p
+                      LEFT JOIN patient_summary s ON s.patient_id = p.patient_id
+                      WHERE p.patient_id = %(patient_id)s"""
+
+# A patient's appointments from today to week_later matching a search
+SEARCH_APPOINTMENT_CALL = """CALL search_appointment(%(patient_id)s, %(today)s, %(week_later)s, %(query)s)"""
+
+# A patient's appointments on one day
+APPOINTMENTS_BY_DATE_CALL = """CALL get_patient_appointments_by_date(%(patient_id)s, %(date)s)"""
+
+# Delete an appointment if it belongs to the patient; returns its
+# doctor_id and room_id (NULL if nothing was deleted)
+CANCEL_APPOINTMENT_CALL = """CALL cancel_patient_appointment(%(appointment_id)s, %(patient_id)s)"""
+
+# Recompute the summary rows of a patient_id range (summary-check and
+# generate-data, as an account allowed to write patient_summary)
+REFRESH_PATIENT_SUMMARY_CALL = """CALL refresh_patient_summary(%(first_id)s, %(last_id)s)"""
+
+# A patient's appointments from today to week_later (the homepage, and a
+# search without a query)
+UPCOMING_APPOINTMENTS_SQL = """SELECT a.appointment_id, a.appointment_date, a.appointment_time,
+                                      a.description, d.doctor_firstname, d.doctor_lastname, a.room_id
+                               FROM appointment a
+                               LEFT JOIN doctor d ON a.doctor_id = d.doctor_id
+                               WHERE a.patient_id = %(patient_id)s
+                                   AND a.appointment_date >= %(today)s
+                                   AND a.appointment_date <= %(week_later)s
+                               ORDER BY a.appointment_date ASC, a.appointment_time ASC"""
+
+# One page of a patient's appointments, newest first (keyset pagination
+# on appointment_date, appointment_time, appointment_id)
+APPOINTMENT_PAGE = """SELECT a.appointment_id, a.patient_id, a.doctor_id, a.room_id,
+                             a.appointment_date, a.appointment_time, a.description,
+                             a.duration_minutes, d.doctor_firstname, d.doctor_lastname
+                      FROM appointment a
+                      LEFT JOIN doctor d ON a.doctor_id = d.doctor_id
+                      WHERE a.patient_id = %(patient_id)s
+                          {after}
+                      ORDER BY a.appointment_date DESC, a.appointment_time DESC, a.appointment_id DESC
+                      LIMIT %(limit)s"""
+APPOINTMENT_PAGE_SQL = APPOINTMENT_PAGE.format(after='')
+APPOINTMENT_PAGE_AFTER_SQL = APPOINTMENT_PAGE.format(
+    after="""AND (a.appointment_date < %(after_date)s
+                               OR (a.appointment_date = %(after_date)s
+                                   AND (a.appointment_time < %(after_time)s
+                                        OR (a.appointment_time = %(after_time)s
+                                            AND a.appointment_id < %(after_id)s))))""")
+
+# Every appointment of a patient from start to end (the calendar month)
+APPOINTMENTS_BY_RANGE_SQL = """SELECT a.appointment_id,
+                                      a.patient_id,
+                                      a.doctor_id,
+                                      a.appointment_date,
+                                      a.appointment_time,
+                                      a.duration_minutes,
+                                      a.description,
+                                      d.doctor_firstname,
+                                      d.doctor_lastname,
+                                      a.room_id
+                               FROM appointment a
+                               LEFT JOIN doctor d ON d.doctor_id = a.doctor_id
+                               WHERE a.patient_id = %(patient_id)s
+                                   AND a.appointment_date >= %(start)s
+                                   AND a.appointment_date <= %(end)s
+                               ORDER BY a.appointment_date ASC, a.appointment_time ASC"""
+
+# The doctor homepage
+DOCTOR_HOME_SQL = """SELECT d.*
+                     FROM doctor d
+                     WHERE d.doctor_id = %(doctor_id)s"""
+
+# A doctor's whole day, with each appointment's patient. The day is that
+# of appointment_id, if it is one of the doctor's, or else `date`.
+DOCTOR_DAY_SQL = """SELECT a.appointment_id,
+                           a.appointment_time,
+                           a.patient_id,
+                           a.doctor_id,
+                           a.room_id,
+                           a.appointment_date,
+                           a.description,
+                           a.duration_minutes,
+                           p.first_name,
+                           p.last_name,
+                           p.date_of_birth,
+                           p.weight_lb,
+                           p.height_in,
+                           p.age,
+                           p.address
+                    FROM appointment a
+                    LEFT JOIN patient p ON a.patient_id = p.patient_id
+                    WHERE a.doctor_id = %(doctor_id)s
+                        AND a.appointment_date = COALESCE(
+                            (SELECT s.appointment_date
+                             FROM appointment s
+                             WHERE s.appointment_id = %(appointment_id)s
+                                 AND s.doctor_id = %(doctor_id)s),
+                            %(date)s)
+                    ORDER BY a.appointment_time ASC"""
+
+# One of the doctor's appointments (none if it is someone else's)
+APPOINTMENT_DETAILS_SQL = """SELECT a.appointment_id,
+                                    a.appointment_time,
+                                    a.patient_id,
+                                    a.doctor_id,
+                                    a.room_id,
+                                    a.appointment_date,
+                                    a.description,
+                                    a.duration_minutes
+                             FROM appointment a
+                             WHERE a.appointment_id = %(appointment_id)s
+                                 AND a.doctor_id = %(doctor_id)s"""
+
+# The patient of an appointment
+APPOINTMENT_PATIENT_SQL = """SELECT patient_id,
+                                    first_name,
+                                    last_name,
+                                    date_of_birth,
+                                    weight_lb,
+                                    height_in,
+                                    age,
+                                    address
+                             FROM patient
+                             WHERE patient_id = %(patient_id)s"""
+
+# One of the patient's prescriptions, with its treatment's description and bill
+PRESCRIPTION_SQL = """SELECT p.prescription_id,
+                             p.patient_id,
+                             p.treatment_name,
+                             p.duration_days,
+                             p.prescribed_on,
+                             p.notes,
+                             p.paid,
+                             t.description,
+                             t.bill
+                      FROM prescription p
+                      JOIN treatment t ON t.treatment_name = p.treatment_name
+                          AND t.duration_days = p.duration_days
+                      WHERE p.prescription_id = %(prescription_id)s
+                          AND p.patient_id = %(patient_id)s"""
+
+# One page of a patient's prescriptions, newest first (keyset pagination
+# on prescribed_on, prescription_id). The bills are joined like those of
+# PRESCRIPTION_TOTALS_SQL, so a page and its totals agree.
+PRESCRIPTION_PAGE = """SELECT p.prescription_id, p.patient_id, p.treatment_name, p.duration_days,
+                              p.prescribed_on, p.notes, p.paid, t.description, t.bill
+                       FROM prescription p
+                       JOIN treatment t ON t.treatment_name = p.treatment_name
+                           AND t.duration_days = p.duration_days
+                       WHERE p.patient_id = %(patient_id)s
+                           {after}
+                       ORDER BY p.prescribed_on DESC, p.prescription_id DESC
+                       LIMIT %(limit)s"""
+PRESCRIPTION_PAGE_SQL = PRESCRIPTION_PAGE.format(after='')
+PRESCRIPTION_PAGE_AFTER_SQL = PRESCRIPTION_PAGE.format(
+    after="""AND (p.prescribed_on < %(after_date)s
+                                OR (p.prescribed_on = %(after_date)s
+                                    AND p.prescription_id < %(after_id)s))""")
+
+# Prescriptions and billed amounts of a patient, paid and unpaid (one
+# aggregate over idx_prescription_patient_paid)
+PRESCRIPTION_TOTALS_SQL = """SELECT p.paid, COUNT(*) AS prescriptions, SUM(t.bill) AS billed
+                             FROM prescription p
+                             JOIN treatment t ON t.treatment_name = p.treatment_name
+                                 AND t.duration_days = p.duration_days
+                             WHERE p.patient_id = %(patient_id)s
+                             GROUP BY p.paid"""
+
+# Mark a bill paid, if it is the patient's and still unpaid
+PAY_BILL_SQL = """UPDATE prescription
+                  SET paid = TRUE
+                  WHERE prescription_id = %(prescription_id)s
+                      AND patient_id = %(patient_id)s
+                      AND paid IS NOT TRUE"""
+
+# Whether a bill that could not be paid exists (and is the patient's)
+BILL_STATUS_SQL = """SELECT p.paid
+                     FROM prescription p
+                     WHERE p.prescription_id = %(prescription_id)s
+                         AND p.patient_id = %(patient_id)s"""
+
+# Mark every unpaid bill of a patient paid (a range of
+# idx_prescription_patient_paid)
+PAY_ALL_BILLS_SQL = """UPDATE prescription
+                       SET paid = TRUE
+                       WHERE patient_id = %(patient_id)s
+                           AND (paid = FALSE OR paid IS NULL)"""
+
+# One page of a patient's medical records, newest first
+MEDICAL_RECORD_PAGE = """SELECT medicalrecord_id as record_id,
+                                patient_id as account_id,
+                                diagnosis as diagnoses,
+                                result
+                         FROM medicalrecord
+                         WHERE patient_id = %(patient_id)s
+                             {after}
+                         ORDER BY medicalrecord_id DESC
+                         LIMIT %(limit)s"""
+MEDICAL_RECORD_PAGE_SQL = MEDICAL_RECORD_PAGE.format(after='')
+MEDICAL_RECORD_PAGE_AFTER_SQL = MEDICAL_RECORD_PAGE.format(after='AND medicalrecord_id < %(after_id)s')
+
+# The latest record and blood test date, from the patient's summary row
+LATEST_MEDICAL_RECORD_SQL = """SELECT latest_record_id as record_id, patient_id as account_id,
+                                      latest_diagnosis as diagnoses, latest_result as result,
+                                      last_bloodtest_date
+                               FROM patient_summary
+                               WHERE patient_id = %(patient_id)s"""
+
+# The appointments of a doctor's or a room's day, for the overlap checks
+# of a booking (idx_appointment_doctor_date_time / idx_appointment_room_date_time)
+DOCTOR_DAY_BOOKINGS_SQL = """SELECT appointment_id, appointment_time, duration_minutes
+                             FROM appointment
+                             WHERE doctor_id = %(doctor_id)s
+                                 AND appointment_date = %(date)s"""
+
+ROOM_DAY_BOOKINGS_SQL = """SELECT appointment_id, appointment_time, duration_minutes
+                           FROM appointment
+                           WHERE room_id = %(room_id)s
+                               AND appointment_date = %(date)s"""
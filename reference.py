@@ -0,0 +1,111 @@
+import threading
+import time
+from types import MappingProxyType
+
+from db import MySQLPool
+from models import Department, Room
+
+
+# Immutable snapshot of the reference tables
+class ReferenceData:
+    __slots__ = ('departments', 'rooms', 'version', 'loaded_at')
+
+    def __init__(self, departments, rooms, version):
+        self.departments = MappingProxyType(departments)  # department_id -> Department
+        self.rooms = MappingProxyType(rooms)              # room_id -> Room
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+
+# In-process cache of the (effectively static) department and room
+# tables (treatment prices are joined by the queries that show them, so
+# that a page and its totals always agree). Load it before gunicorn forks its workers (see
+# gunicorn.conf.py) and they all share one copy; a worker reloads it when
+# the TTL expires or after `flask reference-refresh` bumps its version.
+class ReferenceCache:
+    def __init__(self, app=None, versions=None):
+        self._data = None
+        self._lock = threading.Lock()
+        self._last_miss_reload = 0.0
+        self._retry_at = 0.0  # After a failed reload, keep the old snapshot until then
+        if (app is not None):
+            self.init_app(app, versions)
+
+    def init_app(self, app, versions):
+        app.config.setdefault('REFERENCE_TTL', 3600)
+        app.config.setdefault('REFERENCE_MISS_RELOAD_INTERVAL', 30)
+        app.config.setdefault('REFERENCE_RETRY_INTERVAL', 30)  # seconds between failed reloads
+        self._config = app.config
+        self._versions = versions
+        app.extensions['reference'] = self
+
+    # Read every reference table (over a short-lived connection, so that
+    # nothing is left open when loading before a fork)
+    def load(self):
+        version = self._versions.version('reference')
+        conn = MySQLPool.connect(self._config)
+        try:
+            cur = conn.cursor()
+            cur.execute("""SELECT department_id, department_name, officelocation
+                           FROM department""")
+            departments = {row['department_id']: Department.from_row(row)
+                           for row in cur.fetchall()}
+            cur.execute("""SELECT room_id, capacity, floor
+                           FROM room""")
+            rooms = {row['room_id']: Room.from_row(row) for row in cur.fetchall()}
+            cur.close()
+        finally:
+            conn.close()
+
+        data = ReferenceData(departments, rooms, version)
+        self._data = data
+        return data
+
+    def _stale(self, data):
+        if (data is not None and time.monotonic() < self._retry_at):
+            return False
+        return (data is None
+                or time.monotonic() - data.loaded_at > self._config['REFERENCE_TTL']
+                or data.version != self._versions.version('reference'))
+
+    # The current snapshot (reloaded first if it is stale)
+    def get(self):
+        data = self._data
+        if (not self._stale(data)):
+            return data
+
+        with self._lock:
+            data = self._data
+            if (self._stale(data)):
+                try:
+                    data = self.load()
+                except Exception:
+                    # Keep serving the previous snapshot if the reload fails
+                    # (without another attempt on every request)
+                    if (data is None):
+                        raise
+                    self._retry_at = time.monotonic() + self._config['REFERENCE_RETRY_INTERVAL']
+            return data
+
+    # Make every worker reload the reference data on its next access
+    def invalidate(self):
+        self._versions.bump('reference')
+
+    # Look up a row, reloading (at most every few seconds) on a miss, in
+    # case it was added since the snapshot was taken
+    def _lookup(self, table, key):
+        value = getattr(self.get(), table).get(key)
+        if (value is None and key is not None):
+            now = time.monotonic()
+            with self._lock:
+                if (now - self._last_miss_reload < self._config['REFERENCE_MISS_RELOAD_INTERVAL']):
+                    return None
+                self._last_miss_reload = now
+                value = getattr(self.load(), table).get(key)
+        return value
+
+    def department(self, department_id):
+        return self._lookup('departments', department_id)
+
+    def room(self, room_id):
+        return self._lookup('rooms', room_id)
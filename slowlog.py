@@ -0,0 +1,299 @@
+import fcntl
+import json
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime
+
+from db import MySQLPool
+from instrumentation import normalize_sql
+
+# Statements EXPLAIN accepts
+EXPLAINABLE = re.compile(r'\s*(SELECT|WITH|INSERT|REPLACE|UPDATE|DELETE)\b', re.IGNORECASE)
+CALL = re.compile(r'\s*CALL\s+`?(\w+)`?\s*(?:\((.*)\))?', re.IGNORECASE | re.DOTALL)
+
+# Flow control around the statements of a procedure body
+ROUTINE_CONTROL = re.compile(r'\s*(?:BEGIN\b|END\s+IF\b|END\b|ELSE\b|(?:ELSEIF|IF)\b.*?\bTHEN\b)',
+                             re.IGNORECASE | re.DOTALL)
+DECLARE = re.compile(r'\s*DECLARE\s+(\w+)\s.*?(?:\bDEFAULT\s+(.*))?$', re.IGNORECASE | re.DOTALL)
+
+
+# Parameter types only (values may be personal data)
+def redact(args):
+    if (args is None):
+        return None
+    if (isinstance(args, dict)):
+        return {key: type(value).__name__ for key, value in args.items()}
+    return [type(value).__name__ for value in args]
+
+
+# The values passed to a CALL (statement text and execute() arguments),
+# in parameter order. Raises ValueError for an argument that isn't a
+# placeholder.
+def call_arguments(sql, args):
+    arguments = CALL.match(sql).group(2)
+    if (arguments is None):
+        return list(args or ())  # callproc
+    positional = iter(args if isinstance(args, (list, tuple)) else ())
+    values = []
+    for argument in filter(None, (argument.strip() for argument in arguments.split(','))):
+        match = re.fullmatch(r'%\((\w+)\)s', argument)
+        if (match):
+            values.append(args[match.group(1)])
+        elif (argument == '%s'):
+            values.append(next(positional))
+        else:
+            raise ValueError(f'cannot bind CALL argument {argument}')
+    return values
+
+
+# The statements of a stored procedure that EXPLAIN accepts, with its
+# parameters as %(name)s placeholders, read from the server (so a plan is
+# always that of the procedure as it is now). Local variables are replaced
+# by their DEFAULT expression (or NULL). Returns ([sql, ...], [parameter
+# name, ...]); raises LookupError if the body can't be read.
+def procedure_statements(cur, name):
+    def value(row):
+        return next(iter(row.values())) if isinstance(row, dict) else row[0]
+
+    cur.execute("""SELECT ROUTINE_DEFINITION
+                   FROM information_schema.ROUTINES
+                   WHERE ROUTINE_SCHEMA = DATABASE()
+                       AND ROUTINE_TYPE = 'PROCEDURE'
+                       AND ROUTINE_NAME = %s""", (name,))
+    row = cur.fetchone()
+    if (row is None):
+        raise LookupError(f'no procedure {name}')
+    body = value(row)
+    if (body is None):
+        raise LookupError(f'the body of procedure {name} is not visible to this account (needs SHOW_ROUTINE)')
+    cur.execute("""SELECT PARAMETER_NAME
+                   FROM information_schema.PARAMETERS
+                   WHERE SPECIFIC_SCHEMA = DATABASE()
+                       AND SPECIFIC_NAME = %s
+                       AND ROUTINE_TYPE = 'PROCEDURE'
+                   ORDER BY ORDINAL_POSITION""", (name,))
+    params = [value(row) for row in cur.fetchall()]
+
+    body = re.sub(r'/\*.*?\*/|--[^\n]*', ' ', body, flags=re.DOTALL).replace('%', '%%')
+    replacements = {param.lower(): f'%({param})s' for param in params}
+
+    def substitute(sql):
+        if (not replacements):
+            return sql
+        names = re.compile(r'\b(' + '|'.join(map(re.escape, replacements)) + r')\b', re.IGNORECASE)
+        return names.sub(lambda match: replacements[match.group(1).lower()], sql)
+
+    statements, variables = [], list(replacements)
+    for statement in body.split(';'):
+        control = ROUTINE_CONTROL.match(statement)
+        while (control):
+            statement = statement[control.end():]
+            control = ROUTINE_CONTROL.match(statement)
+        statement = statement.strip()
+
+        declared = DECLARE.match(statement)
+        if (declared):
+            variable, default = declared.groups()
+            variables.append(variable.lower())
+            replacements[variable.lower()] = f'({substitute(default.strip())})' if default else 'NULL'
+            continue
+        if (not EXPLAINABLE.match(statement)):
+            continue
+
+        # Drop SELECT ... INTO <variables>; skip statements without a table
+        into = '|'.join(map(re.escape, variables))
+        if (into):
+            statement = re.sub(rf'\bINTO\s+(?:{into})\b(?:\s*,\s*(?:{into})\b)*', '', statement,
+                               flags=re.IGNORECASE)
+        if (re.search(r'\b(FROM|UPDATE|INTO)\b', statement, re.IGNORECASE)):
+            statements.append(substitute(statement))
+    return statements, params
+
+
+# Tables read with a full scan, filesorts and temporary tables in an
+# EXPLAIN FORMAT=JSON plan
+def plan_problems(plan):
+    problems = []
+
+    def walk(node):
+        if (isinstance(node, dict)):
+            if (node.get('access_type') == 'ALL' and 'table_name' in node):
+                problems.append(f"full scan of {node['table_name']}")
+            if (node.get('using_filesort')):
+                problems.append('filesort')
+            if (node.get('using_temporary_table')):
+                problems.append('temporary table')
+            for value in node.values():
+                walk(value)
+        elif (isinstance(node, list)):
+            for value in node:
+                walk(value)
+
+    walk(plan)
+    return list(dict.fromkeys(problems))
+
+
+# The EXPLAIN FORMAT=JSON plan of a statement
+def explain(cur, sql, args=None):
+    cur.execute('EXPLAIN FORMAT=JSON ' + sql, args)
+    row = cur.fetchone()
+    plan = next(iter(row.values())) if isinstance(row, dict) else row[0]
+    return json.loads(plan)
+
+
+# Stream the entries of a slow query log (optionally only recent ones)
+def read_entries(path, since=None):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if (not line.strip()):
+                continue
+            entry = json.loads(line)
+            if (since is None or datetime.fromisoformat(entry['at']) >= since):
+                yield entry
+
+
+# Group log entries by statement (or endpoint), worst total time first
+def summarize(entries, by='statement'):
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault(entry[by], {by: entry[by], 'durations': [], 'endpoints': set(),
+                                              'plan': None})
+        group['durations'].append(entry['duration_ms'])
+        group['endpoints'].add(entry['endpoint'])
+        if (entry.get('plan') is not None):
+            group['plan'] = entry['plan']  # The latest one
+
+    summary = []
+    for group in groups.values():
+        durations = sorted(group.pop('durations'))
+        group.update({
+            'count': len(durations),
+            'total_ms': sum(durations),
+            'p95_ms': durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+            'max_ms': durations[-1],
+            'problems': plan_problems(group['plan']) if group['plan'] else []
+        })
+        summary.append(group)
+    return sorted(summary, key=lambda group: group['total_ms'], reverse=True)
+
+
+# Flask extension logging statements slower than SQL_SLOW_QUERY_THRESHOLD
+# (with redacted parameters and the route) to an NDJSON file, along with
+# their EXPLAIN FORMAT=JSON plan. Plans are captured by a background
+# thread over its own connection, after the response has been sent.
+class SlowQueryLog:
+    def __init__(self, app=None, instrumentation=None):
+        self.dropped = 0
+        self._pid = None
+        self._lock = threading.Lock()
+        if (app is not None):
+            self.init_app(app, instrumentation)
+
+    def init_app(self, app, instrumentation):
+        app.config.setdefault('SLOW_QUERY_LOG', '/tmp/medical_app_slow_queries.ndjson')
+        app.config.setdefault('SLOW_QUERY_EXPLAIN_INTERVAL', 60)  # seconds between plans of a statement
+        app.config.setdefault('SLOW_QUERY_QUEUE_SIZE', 100)
+
+        self.app = app
+        self.path = app.config['SLOW_QUERY_LOG']
+        instrumentation.add_listener(self._record)
+        app.extensions['slow_query_log'] = self
+
+    # The queue for this process (its thread is started on first use, after any fork)
+    def _queue(self):
+        with self._lock:
+            if (self._pid != os.getpid()):
+                self._pending = queue.Queue(self.app.config['SLOW_QUERY_QUEUE_SIZE'])
+                threading.Thread(target=self._run, args=(self._pending,),
+                                 name='slow-query-log', daemon=True).start()
+                self._pid = os.getpid()
+            return self._pending
+
+    def _record(self, trace, response):
+        if (not trace.slow):
+            return
+        endpoint, route = trace.endpoint, trace.route
+
+        pending = self._queue()
+        for sql, args, duration in trace.slow:
+            statement = normalize_sql(sql)
+            self.app.logger.warning('Slow query (%.0f ms) in %s: %s', duration * 1000, endpoint, statement)
+            entry = {
+                'at': datetime.now().isoformat(timespec='seconds'),
+                'endpoint': endpoint,
+                'route': route,
+                'statement': statement,
+                'params': redact(args),
+                'duration_ms': round(duration * 1000, 1)
+            }
+            try:
+                pending.put_nowait((entry, sql, args))
+            except queue.Full:
+                self.dropped += 1
+
+    # Background thread: explain each statement and append it to the log
+    def _run(self, pending):
+        conn = None
+        plans = {}  # statement -> (plan, error, captured at)
+        while (True):
+            entry, sql, args = pending.get()
+            statement = entry['statement']
+            cached = plans.get(statement)
+            if (cached and time.monotonic() - cached[2] < self.app.config['SLOW_QUERY_EXPLAIN_INTERVAL']):
+                plan, error = cached[0], cached[1]
+            else:
+                try:
+                    if (conn is None):
+                        conn = MySQLPool.connect(self.app.config)
+                    plan, error = self._explain(conn, sql, args)
+                except Exception as e:
+                    plan, error = None, str(e)
+                    if (conn is not None):
+                        try:
+                            conn.close()
+                        except Exception:
+                            pass
+                        conn = None
+                plans[statement] = (plan, error, time.monotonic())
+
+            entry['plan'] = plan
+            if (error):
+                entry['plan_error'] = error
+            try:
+                self._write(entry)
+            except OSError as e:
+                self.app.logger.error('Could not write the slow query log: %s', e)
+
+    def _explain(self, conn, sql, args):
+        cur = conn.cursor()
+        try:
+            # EXPLAIN does not accept CALL; explain the statements of the
+            # procedure's body instead (a list of plans if there are several)
+            match = CALL.match(sql)
+            if (match):
+                try:
+                    statements, names = procedure_statements(cur, match.group(1))
+                    args = dict(zip(names, call_arguments(sql, args)))
+                except (LookupError, ValueError, StopIteration) as e:
+                    return None, str(e)
+                plans = [explain(cur, statement, args) for statement in statements]
+                return (plans[0] if len(plans) == 1 else plans), None
+            if (not EXPLAINABLE.match(sql)):
+                return None, 'statement cannot be explained'
+            return explain(cur, sql, args), None
+        finally:
+            cur.close()
+
+    # Append one entry (whole lines only, as every worker shares the file)
+    def _write(self, entry):
+        line = json.dumps(entry, default=str) + '\n'
+        with open(self.path, 'a', encoding='utf-8') as f:
+            fcntl.lockf(f, fcntl.LOCK_EX)
+            try:
+                f.write(line)
+                f.flush()
+            finally:
+                fcntl.lockf(f, fcntl.LOCK_UN)
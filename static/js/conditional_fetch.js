@@ -0,0 +1,46 @@
+// Recent JSON responses with their ETags, keyed by URL and request body
+const validatedResponses = new Map();
+const MAX_VALIDATED_RESPONSES = 50;
+
+// POST a JSON body, sending the last ETag for the same request so that the
+// server can answer 304 Not Modified (the stored response is reused then)
+function postJsonConditional(url, body) {
+    const payload = JSON.stringify(body);
+    const key = `${url} ${payload}`;
+    const cached = validatedResponses.get(key);
+
+    const headers = {
+        'Content-Type': 'application/json',
+    };
+    if (cached) {
+        headers['If-None-Match'] = cached.etag;
+    }
+
+    return fetch(url, {
+        method: 'POST',
+        headers: headers,
+        body: payload
+    })
+    .then(response => {
+        if (response.status === 304 && cached) {
+            // Mark the entry as most recently used
+            validatedResponses.delete(key);
+            validatedResponses.set(key, cached);
+            return cached.data;
+        }
+
+        return response.json().then(data => {
+            const etag = response.headers.get('ETag');
+            validatedResponses.delete(key);
+            if (etag && data.success) {
+                validatedResponses.set(key, { etag: etag, data: data });
+
+                // Drop the least recently used entries
+                while (validatedResponses.size > MAX_VALIDATED_RESPONSES) {
+                    validatedResponses.delete(validatedResponses.keys().next().value);
+                }
+            }
+            return data;
+        });
+    });
+}
@@ -1,4 +1,8 @@
-// Function to select an appointment and fetch its details
+// The day's appointments and patients, embedded in the page by the server
+const dayDataElement = document.getElementById('day-data');
+const dayData = dayDataElement ? JSON.parse(dayDataElement.textContent) : { appointments: {}, patients: {} };
+
+// Function to select an appointment and show its details
 function selectAppointment(appointmentId) {
     // Remove selected class from all items
     const allItems = document.querySelectorAll('.time-item');
@@ -12,7 +16,15 @@ function selectAppointment(appointmentId) {
         clickedItem.classList.add('selected');
     }
     
-    // Fetch appointment details
+    // Use the embedded details when we have them (no round trip needed)
+    const appointment = dayData.appointments[appointmentId];
+    if (appointment) {
+        showDetails(appointment, dayData.patients[appointment.patient_id]);
+        return;
+    }
+    
+    // Otherwise, fetch appointment details
+    // (the browser revalidates its cached copy with If-None-Match)
     fetch(`/doctor/appointments/${appointmentId}/details`)
         .then(response => {
             if (!response.ok) {
@@ -22,17 +34,7 @@ function selectAppointment(appointmentId) {
         })
         .then(data => {
             if (data.success) {
-                // Update appointment information panel
-                updateAppointmentPanel(data.appointment);
-                
-                // Update patient information panel
-                if (data.patient) {
-                    updatePatientPanel(data.patient);
-                }
-                
-                // Show both panels
-                document.getElementById('appointment-panel').style.display = 'block';
-                document.getElementById('patient-panel').style.display = 'block';
+                showDetails(data.appointment, data.patient);
             } else {
                 console.error('Error:', data.message);
             }
@@ -42,23 +44,37 @@ function selectAppointment(appointmentId) {
         });
 }
 
+// Function to fill in and show both information panels
+function showDetails(appointment, patient) {
+    // Update appointment information panel
+    updateAppointmentPanel(appointment);
+    
+    // Update patient information panel
+    if (patient) {
+        updatePatientPanel(patient);
+    }
+    
+    // Show both panels
+    document.getElementById('appointment-panel').style.display = 'block';
+    document.getElementById('patient-panel').style.display = 'block';
+}
+
 // Function to update appointment information panel
 function updateAppointmentPanel(appointment) {
-    document.getElementById('appointment-date').textContent = appointment.date || '-';
+    document.getElementById('appointment-date').textContent = appointment.appointment_date || '-';
     document.getElementById('appointment-description').textContent = appointment.description || '-';
-    document.getElementById('appointment-duration').textContent = appointment.duration ? appointment.duration + ' minutes' : '-';
-    document.getElementById('appointment-patient-id').textContent = appointment.patient_id || '-';
+    document.getElementById('appointment-duration').textContent = appointment.duration_minutes ? appointment.duration_minutes + ' minutes' : '-';
     document.getElementById('appointment-room-id').textContent = appointment.room_id || '-';
 }
 
 // Function to update patient information panel
 function updatePatientPanel(patient) {
-    document.getElementById('patient-id').textContent = patient.id || '-';
+    document.getElementById('patient-id').textContent = patient.patient_id || '-';
     document.getElementById('patient-first-name').textContent = patient.first_name || '-';
     document.getElementById('patient-last-name').textContent = patient.last_name || '-';
-    document.getElementById('patient-dob').textContent = patient.dob || '-';
-    document.getElementById('patient-weight').textContent = patient.weight ? patient.weight + ' lb' : '-';
-    document.getElementById('patient-height').textContent = patient.height ? patient.height + ' in' : '-';
+    document.getElementById('patient-dob').textContent = patient.date_of_birth || '-';
+    document.getElementById('patient-weight').textContent = patient.weight_lb ? patient.weight_lb + ' lb' : '-';
+    document.getElementById('patient-height').textContent = patient.height_in ? patient.height_in + ' in' : '-';
     document.getElementById('patient-age').textContent = patient.age || '-';
     document.getElementById('patient-address').textContent = patient.address || '-';
 }
@@ -34,14 +34,7 @@ document.addEventListener("DOMContentLoaded", function() {
         }
         
         // Send search request to server
-        fetch('/patient/search-appointments', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ query: searchQuery })
-        })
-        .then(response => response.json())
+        postJsonConditional('/patient/search-appointments', { query: searchQuery })
         .then(data => {
             if (data.success) {
                 displayAppointments(data.appointments);
@@ -74,7 +67,7 @@ document.addEventListener("DOMContentLoaded", function() {
                     </div>
                     <div class="appointment-details">
                         <span class="time">${time}</span>
-                        <span class="description">${appt.description}</span>
+                        <span class="description">${escapeHtml(appt.description || 'No description')}</span>
                     </div>
                 </div>
             `;
@@ -83,6 +76,14 @@ document.addEventListener("DOMContentLoaded", function() {
         appointmentsList.innerHTML = html;
     }
     
+    // Escape text from the server (e.g. a patient's own appointment
+    // description) before it goes into HTML
+    function escapeHtml(value) {
+        return String(value ?? '').replace(/[&<>"']/g, c => ({
+            '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+        })[c]);
+    }
+    
     function resetAppointments() {
         appointmentsList.innerHTML = originalAppointmentsHTML;
     }
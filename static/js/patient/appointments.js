@@ -6,6 +6,9 @@ let selectedDay = today.getDate();
 let selectedMonth = today.getMonth();
 let selectedYear = today.getFullYear();
 
+// Appointments per month, keyed by "YYYY-MM" (each value is a pending/settled fetch)
+const monthCache = new Map();
+
 function renderCalendar() {
     const calendarDays = document.getElementById('calendarDays');
     calendarDays.innerHTML = '';
@@ -26,6 +29,7 @@ function renderCalendar() {
         const dayElement = document.createElement('div');
         dayElement.className = 'calendar-day';
         dayElement.textContent = day;
+        dayElement.dataset.date = formatDate(currentYear, currentMonth, day);
 
         // Check if the day is selected
         if (day === selectedDay && currentMonth === selectedMonth && currentYear === selectedYear) {
@@ -52,6 +56,27 @@ function renderCalendar() {
 
         calendarDays.appendChild(dayElement);
     }
+
+    showAppointmentCounts(currentYear, currentMonth);
+}
+
+// Add a badge with the number of appointments to each day of the month
+async function showAppointmentCounts(year, month) {
+    const monthData = await loadMonth(year, month);
+    if (!monthData || year !== currentYear || month !== currentMonth) return;
+
+    document.querySelectorAll('.calendar-day[data-date]').forEach(dayElement => {
+        const existing = dayElement.querySelector('.appointment-count');
+        if (existing) existing.remove();
+
+        const count = monthData.counts[dayElement.dataset.date];
+        if (count) {
+            const badge = document.createElement('span');
+            badge.className = 'appointment-count';
+            badge.textContent = count;
+            dayElement.appendChild(badge);
+        }
+    });
 }
 
 function updateCurrentDate() {
@@ -69,6 +94,14 @@ function updateYear() {
     }
 }
 
+// Escape text from the server (e.g. a patient's own appointment
+// description) before it goes into HTML
+function escapeHtml(value) {
+    return String(value ?? '').replace(/[&<>"']/g, c => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    })[c]);
+}
+
 // Format date as YYYY-MM-DD
 function formatDate(year, month, day) {
     const monthStr = String(month + 1).padStart(2, '0');
@@ -105,27 +138,44 @@ function formatDateDisplay(dateStr) {
     }
 }
 
-// Fetch appointments for selected date
-async function fetchAppointmentsForDate(date) {
-    try {
-        const response = await fetch('/patient/appointments-by-date', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ date: date })
+// Fetch (once) all appointments in a month
+function loadMonth(year, month) {
+    const key = formatDate(year, month, 1).slice(0, 7);
+    if (!monthCache.has(key)) {
+        const lastDay = new Date(year, month + 1, 0).getDate();
+        const request = postJsonConditional('/patient/appointments-by-range', {
+            start: formatDate(year, month, 1),
+            end: formatDate(year, month, lastDay)
+        })
+        .then(data => {
+            if (!data.success) {
+                throw new Error(data.message);
+            }
+            return data;
+        })
+        .catch(error => {
+            console.error('Error fetching appointments:', error);
+            monthCache.delete(key);  // Retry on the next request
+            return null;
         });
+        monthCache.set(key, request);
+    }
+    return monthCache.get(key);
+}
 
-        const data = await response.json();
-        
-        if (data.success) {
-            displayAppointments(data.appointments);
-        } else {
-            console.error('Error fetching appointments:', data.message);
-            displayAppointments([]);
-        }
-    } catch (error) {
-        console.error('Error fetching appointments:', error);
+// Forget a month so that it is fetched again (e.g. after a cancellation)
+function invalidateMonth(year, month) {
+    monthCache.delete(formatDate(year, month, 1).slice(0, 7));
+}
+
+// Show appointments for selected date (served from the month cache)
+async function fetchAppointmentsForDate(date) {
+    const [year, month] = date.split('-').map(Number);
+    const monthData = await loadMonth(year, month - 1);
+    
+    if (monthData) {
+        displayAppointments(monthData.days[date] || []);
+    } else {
         displayAppointments([]);
     }
 }
@@ -142,12 +192,12 @@ function displayAppointments(appointments) {
         appointmentList.innerHTML = appointments.map(appt => {
             const time = formatTime(appt.appointment_time);
             const date = formatDateDisplay(appt.appointment_date);
-            const doctorName = `Dr. ${appt.doctor_firstname || ''} ${appt.doctor_lastname || ''}`.trim();
-            const room = appt.room_id ? `Room ${appt.room_id}` : 'Room N/A';
-            const description = appt.description || 'No description';
-            const duration = appt.duration_minutes || 0;
-            const appointmentId = appt.appointment_id || appt.id;
-            const searchText = `${description} ${appt.doctor_firstname || ''} ${appt.doctor_lastname || ''}`.toLowerCase();
+            const doctorName = escapeHtml(`Dr. ${appt.doctor_firstname || ''} ${appt.doctor_lastname || ''}`.trim());
+            const room = appt.room_id ? `Room ${escapeHtml(appt.room_id)}` : 'Room N/A';
+            const description = escapeHtml(appt.description || 'No description');
+            const duration = escapeHtml(appt.duration_minutes || 0);
+            const appointmentId = escapeHtml(appt.appointment_id || appt.id);
+            const searchText = escapeHtml(`${appt.description || 'No description'} ${appt.doctor_firstname || ''} ${appt.doctor_lastname || ''}`.toLowerCase());
             
             return `
                 <div class="appointment-item" data-search="${searchText}" data-appointment-id="${appointmentId}">
@@ -175,6 +225,66 @@ function displayAppointments(appointments) {
     initializeCancelButtons();
 }
 
+// Lazily load older appointments when the end of the list scrolls into view
+function initializeLazyLoading() {
+    const sentinel = document.getElementById('loadMoreAppointments');
+    if (!sentinel || !('IntersectionObserver' in window)) return;
+
+    let loading = false;
+    const observer = new IntersectionObserver(async (entries) => {
+        if (!entries[0].isIntersecting || loading) return;
+        loading = true;
+
+        try {
+            const cursor = encodeURIComponent(sentinel.dataset.nextCursor);
+            const response = await fetch(`/patient/appointments/page?cursor=${cursor}`);
+            const data = await response.json();
+
+            if (!data.success) {
+                throw new Error(data.message);
+            }
+
+            sentinel.insertAdjacentHTML('beforebegin', data.appointments.map(renderHistoryItem).join(''));
+            if (data.next_cursor) {
+                sentinel.dataset.nextCursor = data.next_cursor;
+            } else {
+                observer.disconnect();
+                sentinel.remove();
+            }
+        } catch (error) {
+            console.error('Error loading appointments:', error);
+            observer.disconnect();
+            sentinel.textContent = 'Could not load more appointments.';
+        } finally {
+            loading = false;
+        }
+    });
+    observer.observe(sentinel);
+}
+
+// Render an appointment from the (paginated) history list
+function renderHistoryItem(appt) {
+    const time = formatTime(appt.appointment_time);
+    const date = formatDateDisplay(appt.appointment_date);
+    const searchText = `${appt.description || ''} ${appt.doctor_firstname || ''} ${appt.doctor_lastname || ''}`.toLowerCase();
+
+    return `
+        <div class="appointment-item" data-search="${escapeHtml(searchText)}">
+            <div class="appointment-time">
+                ${time} (${escapeHtml(appt.duration_minutes)} min)
+            </div>
+            <div class="appointment-desc">
+                ${escapeHtml(appt.description)}
+            </div>
+            <div class="appointment-details">
+                <span>${date}</span> •
+                <span>Dr. ${escapeHtml(appt.doctor_firstname)} ${escapeHtml(appt.doctor_lastname)}</span> •
+                <span>Room ${escapeHtml(appt.room_id)}</span>
+            </div>
+        </div>
+    `;
+}
+
 // Initialize search functionality
 function initializeSearch() {
     const searchInput = document.getElementById('searchInput');
@@ -239,8 +349,10 @@ function initializeCancelButtons() {
                 
                 if (data.success) {
                     // Refresh the appointment list for the currently selected date
+                    invalidateMonth(selectedYear, selectedMonth);
                     const selectedDate = formatDate(selectedYear, selectedMonth, selectedDay);
                     await fetchAppointmentsForDate(selectedDate);
+                    showAppointmentCounts(currentYear, currentMonth);
                 } else {
                     alert('Error cancelling appointment: ' + (data.message || 'Unknown error'));
                     newButton.disabled = false;
@@ -280,6 +392,7 @@ document.querySelector('.next-month').addEventListener('click', () => {
 
 // Initialize search functionality
 initializeSearch();
+initializeLazyLoading();
 
 // Initialize calendar on page load
 renderCalendar();
@@ -0,0 +1,57 @@
+// Lazily load older medical records when the end of the history scrolls into view
+function initializeLazyLoading() {
+    const sentinel = document.getElementById('loadMoreRecords');
+    if (!sentinel || !('IntersectionObserver' in window)) return;
+
+    let loading = false;
+    const observer = new IntersectionObserver(async (entries) => {
+        if (!entries[0].isIntersecting || loading) return;
+        loading = true;
+
+        try {
+            const cursor = encodeURIComponent(sentinel.dataset.nextCursor);
+            const response = await fetch(`/patient/medical-records?cursor=${cursor}`);
+            const data = await response.json();
+
+            if (!data.success) {
+                throw new Error(data.message);
+            }
+
+            data.medical_records.forEach(record => {
+                sentinel.parentNode.insertBefore(renderRecord(record), sentinel);
+            });
+            if (data.next_cursor) {
+                sentinel.dataset.nextCursor = data.next_cursor;
+            } else {
+                observer.disconnect();
+                sentinel.remove();
+            }
+        } catch (error) {
+            console.error('Error loading medical records:', error);
+            observer.disconnect();
+            sentinel.textContent = 'Could not load more records.';
+        } finally {
+            loading = false;
+        }
+    });
+    observer.observe(sentinel);
+}
+
+// Render a record of the history (same markup as the server-rendered rows)
+function renderRecord(record) {
+    const row = document.createElement('div');
+    row.className = 'info-row history-item';
+    row.innerHTML = `
+        <div class="label"></div>
+        <div class="value">
+            <div class="history-diagnoses"></div>
+            <div class="history-result"></div>
+        </div>
+    `;
+    row.querySelector('.label').textContent = `#${record.record_id}`;
+    row.querySelector('.history-diagnoses').textContent = record.diagnoses || '';
+    row.querySelector('.history-result').textContent = record.result || '';
+    return row;
+}
+
+initializeLazyLoading();
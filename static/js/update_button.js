@@ -55,37 +55,61 @@ document.addEventListener("DOMContentLoaded", function() {
 
 });
 
-// Send the input data to the Flask server
+// Edits saved within this long of each other go to the server together
+const SAVE_DELAY_MS = 800;
+
+// Edits waiting to be sent (field name -> input element)
+const pendingEdits = new Map();
+let saveTimer = null;
+
+// Queue the input's value to be saved with any other pending edits
 function saveData(inputElement) {
-    // Retrieve the relevant elements and data
-    const infoRow = inputElement.closest('.info-row');
     const editableValue = inputElement.closest('.edit-value');
+    const displayValue = inputElement.closest('.info-row').querySelector('.display-value');
+    
+    // Show the new value right away (dimmed until it is saved)
+    pendingEdits.set(editableValue.dataset.field, inputElement);
+    displayValue.textContent = inputElement.value;
+    displayValue.style.opacity = 0.5;
+    inputElement.style.display = 'none';
+    displayValue.style.display = 'inline-block';
+    
+    clearTimeout(saveTimer);
+    saveTimer = setTimeout(flushEdits, SAVE_DELAY_MS);
+}
+
+// Send every pending edit to the Flask server in a single request
+function flushEdits(keepalive = false) {
+    clearTimeout(saveTimer);
+    if (pendingEdits.size === 0) return;
     
-    let newValue = inputElement.value;
-    const fieldName = editableValue.dataset.field;
+    const edits = new Map(pendingEdits);
+    pendingEdits.clear();
     
     // Determine if a patient or doctor is logged in
+    const infoRow = edits.values().next().value.closest('.info-row');
     const patientId = infoRow.dataset.patientId;
     const doctorId = infoRow.dataset.doctorId;
     
+    const fields = {};
+    edits.forEach((input, field) => { fields[field] = input.value; });
+    
     let updateUrl;
     let requestBody;
     
     if (patientId) {
         // Patient
-        updateUrl = '/patient/update';
+        updateUrl = '/patient/profile';
         requestBody = {
             patient_id: patientId,
-            field: fieldName,
-            value: newValue
+            fields: fields
         };
     } else if (doctorId) {
         // Doctor
-        updateUrl = '/doctor/update';
+        updateUrl = '/doctor/profile';
         requestBody = {
             doctor_id: doctorId,
-            field: fieldName,
-            value: newValue
+            fields: fields
         };
     } else {
         alert('Error: Could not determine logged-in user.');
@@ -94,38 +118,53 @@ function saveData(inputElement) {
 
     // Send data to Flask
     fetch(updateUrl, {
-        method: 'POST',
+        method: 'PATCH',
         headers: {
             'Content-Type': 'application/json',
         },
-        body: JSON.stringify(requestBody)
+        body: JSON.stringify(requestBody),
+        keepalive: keepalive  // Let the request outlive the page
     })
     .then(response => response.json())  // JSON response from Flask
     .then(data => {
         if (data.success) {
-            // Update the HTML display
-            const displayValue = infoRow.querySelector('.display-value');
-            displayValue.textContent = data.new_value;
-            
-            // Update date inputs to YYYY-MM-DD format
-            if (inputElement.type === 'date' && (fieldName === 'date_of_birth' || fieldName === 'date_of_expiry')) {
-                const dateParts = data.new_value.split('-');
-                if (dateParts.length === 3 && dateParts[0].length === 2) {
-                    const formattedDate = `${dateParts[2]}-${dateParts[0]}-${dateParts[1]}`;
-                    inputElement.value = formattedDate;
-                }
-            }
-            
-            // Swap (back) the visible element
-            inputElement.style.display = 'none';
-            displayValue.style.display = 'inline-block';
+            edits.forEach((input, field) => showSaved(input, field, data.new_values[field]));
         } else {
             alert('Error updating: ' + data.message);
+            edits.forEach(input => reopen(input));
         }
     })
     // Handle network errors
     .catch(error => {   
         console.error('Network error:', error);
         alert('A network error occurred. Please try again.');
+        edits.forEach(input => reopen(input));
     });
 }
+
+// Update the HTML display with the saved value
+function showSaved(inputElement, fieldName, newValue) {
+    const displayValue = inputElement.closest('.info-row').querySelector('.display-value');
+    displayValue.textContent = newValue;
+    displayValue.style.opacity = '';
+    
+    // Update date inputs to YYYY-MM-DD format
+    if (inputElement.type === 'date' && (fieldName === 'date_of_birth' || fieldName === 'date_of_expiry')) {
+        const dateParts = newValue.split('-');
+        if (dateParts.length === 3 && dateParts[0].length === 2) {
+            const formattedDate = `${dateParts[2]}-${dateParts[0]}-${dateParts[1]}`;
+            inputElement.value = formattedDate;
+        }
+    }
+}
+
+// Show the input again so a rejected edit can be corrected
+function reopen(inputElement) {
+    const displayValue = inputElement.closest('.info-row').querySelector('.display-value');
+    displayValue.style.opacity = '';
+    displayValue.style.display = 'none';
+    inputElement.style.display = 'inline-block';
+}
+
+// Don't lose edits still waiting to be sent when leaving the page
+window.addEventListener('pagehide', () => flushEdits(true));
@@ -0,0 +1,68 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+SLOT = struct.Struct('<Q')
+
+
+# Write counters (per patient, per doctor, ...) used to build ETags.
+# The counters live in a memory-mapped file, so every worker process sees
+# a write made by any other; keys are hashed into a fixed number of slots
+# (a collision only makes an unrelated ETag change too). The time of each
+# slot's last write is kept alongside, in a second array.
+class VersionStore:
+    def __init__(self, path, slots=65536):
+        self.path = path
+        self.slots = slots
+        self._lock = threading.Lock()
+
+        size = SLOT.size * slots * 2
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            # A new file starts a new epoch (slot 0), so ETags issued
+            # before the file was recreated can never match again
+            if (os.fstat(self._fd).st_size < size):
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, os.urandom(SLOT.size), 0)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+        self._times = SLOT.size * slots  # Offset of the write times (ms since the epoch)
+
+    def _offset(self, scope, key):
+        slot = 1 + zlib.crc32(f'{scope}:{key}'.encode()) % (self.slots - 1)
+        return slot * SLOT.size
+
+    # Current version of a key (e.g. version('patient', 42))
+    def version(self, scope, key=0):
+        return SLOT.unpack_from(self._map, self._offset(scope, key))[0]
+
+    # Record a write to a key
+    def bump(self, scope, key=0):
+        offset = self._offset(scope, key)
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, SLOT.size, offset)
+            try:
+                value = SLOT.unpack_from(self._map, offset)[0] + 1
+                SLOT.pack_into(self._map, offset, value)
+                SLOT.pack_into(self._map, self._times + offset, int(time.time() * 1000))
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, SLOT.size, offset)
+
+    # Whether any of the (scope, key) pairs was written in the last `seconds`
+    def changed_within(self, seconds, *keys):
+        since = (time.time() - seconds) * 1000
+        return any(SLOT.unpack_from(self._map, self._times + self._offset(scope, key))[0] >= since
+                   for scope, key in keys)
+
+    # Strong validator for a response built from the given versions/params
+    def etag(self, *parts):
+        digest = hashlib.sha1(self._map[:SLOT.size])
+        digest.update(repr(parts).encode())
+        return digest.hexdigest()